@@ -0,0 +1,265 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import threading
+import collections
+import email.utils
+import urllib.parse
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from fpl_archive import ARCHIVE_DIR, partition_dir, read_archive, read_league_info, list_archived_seasons
+from fpl_functions import build_standings, game_week_standings
+from fpl_squads import MAX_SIMILARITY_TEAMS, load_squad_tensor, squads_dir
+
+### START OF STATS API FUNCTIONS ###
+
+# A read-only JSON API over the archive written by run_api_extraction, for tools that need the league statistics
+# without a Streamlit session. It never calls the FPL API, e.g.
+#   python fpl_api.py --port 8766
+#   curl http://localhost:8766/leagues/723575/standings/10
+
+CACHE_MAX_AGE_SECONDS = 300 # how long clients may reuse a response before revalidating it with its ETag
+MAX_CACHED_RESPONSES = 1024
+
+class APIError(Exception):
+    """
+    Raised by the endpoints with the HTTP status to answer with.
+    """
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+class ArchivedLeague:
+    """
+    The statistics of one archived league season, computed once when it is first requested
+    and again only after the league is archived again.
+    """
+    def __init__(self, league_id, season, archive_dir=ARCHIVE_DIR):
+        self.info = read_league_info(league_id, season, archive_dir)
+        self.history = read_archive('hist_teams_data', [league_id], [season], archive_dir=archive_dir) \
+            .drop(columns=['league_id', 'season'])
+        self.standings = build_standings(self.history) if len(self.history) else None
+        self.players = read_archive('player_data', [league_id], [season], archive_dir=archive_dir,
+                                    columns=['id_player', 'web_name', 'name', 'plural_name_short'])
+        self.players = self.players.drop(columns=['league_id', 'season']).set_index('id_player')
+        directory = squads_dir(archive_dir, league_id, season)
+        self.squads = load_squad_tensor(directory) if os.path.isdir(directory) else None
+
+    def game_week_standings(self, game_week):
+        if self.standings is None or game_week not in self.info['game_weeks']:
+            raise APIError(404, f"Game week {game_week} is not archived.")
+        return game_week_standings(self.standings, game_week)
+
+    def team_history(self, entry):
+        history = self.history[self.history['entry'] == entry]
+        if history.empty:
+            raise APIError(404, f"Team {entry} is not in the league.")
+        return history.sort_values(by='event')
+
+    def squad_tensor(self, game_week):
+        if self.squads is None or game_week not in self.squads.game_weeks:
+            raise APIError(404, f"The picks of game week {game_week} are not archived.")
+        return self.squads
+
+    def ownership(self, game_week):
+        ownership = self.squad_tensor(game_week).ownership(game_week)
+        ownership = ownership.join(self.players, how='left').reset_index()
+        return ownership.sort_values(by=['selected', 'effective_ownership'], ascending=False)
+
+    def similarity(self, game_week, entry=None):
+        """
+        Similarity scores of one team against every team, or of every pair of teams in a small league.
+        """
+        squads = self.squad_tensor(game_week)
+        if entry is None and len(squads.entries) > MAX_SIMILARITY_TEAMS:
+            raise APIError(400, f"The league has more than {MAX_SIMILARITY_TEAMS} teams. Ask for one team with ?entry=<id>.")
+        rows = range(len(squads.entries))
+        if entry is not None:
+            rows = [i for i, e in enumerate(squads.entries) if e == entry]
+            if not rows:
+                raise APIError(404, f"Team {entry} has no archived picks.")
+        scores = squads.similarity(game_week, list(rows))
+        return {'entries': [int(e) for e in squads.entries], 'rows': [int(squads.entries[i]) for i in rows],
+                'scores': np.round(scores.astype(np.float64), 2).tolist()}
+
+def records(frame):
+    """
+    Rows of a frame as JSON-ready dicts, with missing values as null.
+    """
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+class StatsAPI:
+    """
+    Routes requests to the archived leagues and keeps the encoded responses, so that a repeated request
+    is answered without touching pandas. A league's responses are recomputed when it is archived again.
+    """
+    ROUTES = [
+        (re.compile(r'/leagues$'), 'leagues'),
+        (re.compile(r'/leagues/(\d+)$'), 'league'),
+        (re.compile(r'/leagues/(\d+)/standings/(\d+)$'), 'standings'),
+        (re.compile(r'/leagues/(\d+)/teams/(\d+)/history$'), 'team_history'),
+        (re.compile(r'/leagues/(\d+)/ownership/(\d+)$'), 'ownership'),
+        (re.compile(r'/leagues/(\d+)/similarity/(\d+)$'), 'similarity'),
+    ]
+
+    def __init__(self, archive_dir=ARCHIVE_DIR, max_cached_responses=MAX_CACHED_RESPONSES):
+        self.archive_dir = archive_dir
+        self.max_cached_responses = max_cached_responses
+        self.leagues = {}
+        self.responses = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+
+    def archived_at(self, league_id, season):
+        """
+        Modification time of the league's league.json, which is rewritten every time the league is archived.
+        """
+        try:
+            return os.path.getmtime(os.path.join(partition_dir(self.archive_dir, league_id, season), 'league.json'))
+        except FileNotFoundError:
+            raise APIError(404, f"League {league_id} has no archived season {season}.")
+
+    def latest_season(self, league_id):
+        seasons = [season for _, season in list_archived_seasons(league_id, self.archive_dir)]
+        if not seasons:
+            raise APIError(404, f"League {league_id} is not archived.")
+        return max(seasons)
+
+    def league(self, league_id, season, archived_at):
+        with self.lock:
+            cached = self.leagues.get((league_id, season))
+        if cached is not None and cached[0] == archived_at:
+            return cached[1]
+        league = ArchivedLeague(league_id, season, self.archive_dir)
+        with self.lock:
+            self.leagues[(league_id, season)] = (archived_at, league)
+        return league
+
+    def get(self, path, query):
+        """
+        Answer a GET request. Returns the encoded body and its ETag and modification time.
+        """
+        for pattern, endpoint in self.ROUTES:
+            match = pattern.match(path.rstrip('/'))
+            if match:
+                break
+        else:
+            raise APIError(404, f"No endpoint at {path}.")
+        args = [int(group) for group in match.groups()]
+
+        if endpoint == 'leagues':
+            # the list of leagues changes whenever a league is archived, so it is not kept
+            body = encode([read_league_info(league_id, season, self.archive_dir)
+                           for league_id, season in list_archived_seasons(archive_dir=self.archive_dir)])
+            return body, etag(body), None
+
+        league_id = args[0]
+        season = query.get('season') or self.latest_season(league_id)
+        if not re.match(r'\d{4}-\d{2}$', season):
+            raise APIError(400, f"season must look like 2024-25, not {season}.")
+        archived_at = self.archived_at(league_id, season)
+        key = (path.rstrip('/'), tuple(sorted(query.items())), archived_at)
+        with self.lock:
+            response = self.responses.get(key)
+            if response is not None:
+                self.responses.move_to_end(key)
+                self.counters['cache_hits'] += 1
+                return response
+            self.counters['cache_misses'] += 1
+
+        league = self.league(league_id, season, archived_at)
+        if endpoint == 'league':
+            data = league.info
+        elif endpoint == 'standings':
+            data = records(league.game_week_standings(args[1]))
+        elif endpoint == 'team_history':
+            data = records(league.team_history(args[1]))
+        elif endpoint == 'ownership':
+            data = records(league.ownership(args[1]))
+        else:
+            entry = query.get('entry')
+            if entry is not None and not entry.isdigit():
+                raise APIError(400, f"entry must be a team id, not {entry}.")
+            data = league.similarity(args[1], int(entry) if entry is not None else None)
+
+        body = encode(data)
+        response = (body, etag(body), archived_at)
+        with self.lock:
+            self.responses[key] = response
+            while len(self.responses) > self.max_cached_responses:
+                self.responses.popitem(last=False)
+        return response
+
+def encode(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def etag(body):
+    return f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+class StatsAPIServer(ThreadingHTTPServer):
+    """
+    Serves a StatsAPI over HTTP.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, archive_dir=ARCHIVE_DIR):
+        super().__init__(address, StatsAPIHandler)
+        self.api = StatsAPI(archive_dir)
+
+class StatsAPIHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            body, body_etag, modified_at = self.server.api.get(url.path, query)
+        except APIError as e:
+            return self.respond(e.status, encode({'detail': e.detail}))
+        except Exception as e:
+            # answer with JSON like any other error rather than dropping the connection
+            print(f"ERROR: GET {self.path} failed: {e!r}")
+            return self.respond(500, encode({'detail': 'Internal server error.'}))
+
+        headers = {'ETag': body_etag, 'Cache-Control': f'public, max-age={CACHE_MAX_AGE_SECONDS}'}
+        if modified_at is not None:
+            headers['Last-Modified'] = email.utils.formatdate(modified_at, usegmt=True)
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or body_etag in [tag.strip() for tag in if_none_match.split(',')]):
+            return self.respond(304, b'', headers)
+        self.respond(200, body, headers)
+
+    def respond(self, status, body, headers=None):
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stats_api(port=0, archive_dir=ARCHIVE_DIR):
+    """
+    Start the stats API on a background thread. Returns the server and its base URL.
+    """
+    server = StatsAPIServer(('127.0.0.1', port), archive_dir)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+### END OF STATS API FUNCTIONS ###
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the archived league statistics as a read-only JSON API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    server = StatsAPIServer((args.host, args.port), args.archive_dir)
+    print(f"Serving the league statistics in {args.archive_dir} at http://{args.host}:{args.port}/")
+    server.serve_forever()
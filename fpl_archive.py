@@ -0,0 +1,181 @@
+import os
+import glob
+import json
+import time
+import fcntl
+import datetime
+import contextlib
+import threading
+import pandas as pd
+
+### START OF ARCHIVE FUNCTIONS ###
+
+# Local archive of extracted leagues, partitioned as league=<id>/season=<season>/gw=<gw>/<table>.parquet
+ARCHIVE_DIR = os.environ.get('FPL_ARCHIVE_DIR', 'fpl_archive')
+
+# game week column of each archived table. Tables without one are stored once per season.
+ARCHIVE_TABLES = {
+    'dim_teams': None,
+    'player_data': None,
+    'hist_teams_data': 'event',
+    'full_selection_data': 'event', # game_week is missing for the picks of players without game week data
+    'all_gw_data': 'game_week',
+    'all_transfers': 'event',
+    'df_transfers_in_out': 'event',
+}
+
+def season_label(date):
+    """
+    Season that a date falls in, e.g. '2024-25'. Seasons are taken to start in July.
+    """
+    start_year = date.year if date.month >= 7 else date.year - 1
+    return f"{start_year}-{(start_year + 1) % 100:02d}"
+
+def partition_dir(archive_dir, league_id, season, game_week=None):
+    path = os.path.join(archive_dir, f"league={league_id}", f"season={season}")
+    if game_week is not None:
+        path = os.path.join(path, f"gw={int(game_week):02d}")
+    return path
+
+def write_atomic(path, write):
+    """
+    Write a file through a temporary file so that readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}-{threading.get_ident()}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+@contextlib.contextmanager
+def file_lock(path, timeout=None, poll_seconds=0.5):
+    """
+    Hold an exclusive flock on the file at path, shared by every thread and process on the machine.
+    Waits for up to timeout seconds, or for as long as it takes when timeout is None.
+    Yields False instead of waiting when the timeout is 0 and another holder has the lock.
+    The lock is released by the OS if the holder dies.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as lock_file:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    if timeout == 0:
+                        yield False
+                        return
+                    raise TimeoutError(f"Timed out waiting for the lock on {path}.")
+                time.sleep(poll_seconds)
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def archive_league_data(league_id, season, league_name, start_event, tables, archive_dir=ARCHIVE_DIR):
+    """
+    Write the extracted tables of a league into the archive, one parquet file per table and game week.
+    tables maps the table names in ARCHIVE_TABLES to their frames. Partitions that already exist are replaced.
+    """
+    game_weeks = set()
+    for table, frame in tables.items():
+        game_week_column = ARCHIVE_TABLES[table]
+        if game_week_column is None:
+            path = os.path.join(partition_dir(archive_dir, league_id, season), f"{table}.parquet")
+            write_atomic(path, lambda tmp_path: frame.reset_index(drop=True).to_parquet(tmp_path, index=False))
+            continue
+        frame = frame[frame[game_week_column].notna()]
+        for game_week, partition in frame.groupby(frame[game_week_column].astype(int)):
+            path = os.path.join(partition_dir(archive_dir, league_id, season, game_week), f"{table}.parquet")
+            write_atomic(path, lambda tmp_path: partition.reset_index(drop=True).to_parquet(tmp_path, index=False))
+            game_weeks.add(int(game_week))
+
+    # the game weeks are merged with the ones already archived, so concurrent archives of the league take turns
+    path = os.path.join(partition_dir(archive_dir, league_id, season), 'league.json')
+    with file_lock(f"{path}.lock"):
+        league_info = {
+            'league_id': league_id,
+            'season': season,
+            'league_name': league_name,
+            'start_event': int(start_event),
+            'game_weeks': sorted(game_weeks | set(read_league_info(league_id, season, archive_dir).get('game_weeks', []))),
+            'archived_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        write_atomic(path, lambda tmp_path: write_json(tmp_path, league_info))
+    return league_info
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+def read_league_info(league_id, season, archive_dir=ARCHIVE_DIR):
+    path = os.path.join(partition_dir(archive_dir, league_id, season), 'league.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def list_archived_seasons(league_id=None, archive_dir=ARCHIVE_DIR):
+    """
+    List the archived (league_id, season) pairs, optionally for a single league.
+    """
+    pattern = partition_dir(archive_dir, '*' if league_id is None else league_id, '*')
+    seasons = []
+    for path in sorted(glob.glob(pattern)):
+        league_part, season_part = path.split(os.sep)[-2:]
+        seasons.append((int(league_part.split('=', 1)[1]), season_part.split('=', 1)[1]))
+    return seasons
+
+def read_archive(table, league_ids=None, seasons=None, game_weeks=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """
+    Read an archived table for the given leagues, seasons and game weeks (all of them when None).
+    Only the matching partitions and the requested columns are read. The league_id and season of each row are added.
+    game_weeks is ignored for the tables that are stored once per season.
+    """
+    def as_patterns(values):
+        return ['*'] if values is None else list(values)
+
+    if ARCHIVE_TABLES[table] is None:
+        game_weeks = [None]
+
+    frames = []
+    for league_id in as_patterns(league_ids):
+        for season in as_patterns(seasons):
+            for game_week in as_patterns(game_weeks):
+                pattern = partition_dir(archive_dir, league_id, season)
+                if game_week is not None:
+                    pattern = os.path.join(pattern, 'gw=*' if game_week == '*' else f"gw={int(game_week):02d}")
+                for path in sorted(glob.glob(os.path.join(pattern, f"{table}.parquet"))):
+                    league_part, season_part = os.path.relpath(path, archive_dir).split(os.sep)[:2]
+                    frame = pd.read_parquet(path, columns=columns)
+                    frame['league_id'] = int(league_part.split('=', 1)[1])
+                    frame['season'] = season_part.split('=', 1)[1]
+                    frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=(columns or []) + ['league_id', 'season'])
+    return pd.concat(frames, ignore_index=True)
+
+def manager_rank_trajectory(player_name, league_ids=None, seasons=None, archive_dir=ARCHIVE_DIR):
+    """
+    League rank and total points of a manager across game weeks and seasons.
+    Managers are matched by name since their entry id changes every season.
+    """
+    columns = ['player_name', 'entry_name', 'event', 'total_points', 'league_rank']
+    history = read_archive('hist_teams_data', league_ids=league_ids, seasons=seasons, columns=columns, archive_dir=archive_dir)
+    history = history[history['player_name'] == player_name]
+    return history.sort_values(by=['league_id', 'season', 'event']).reset_index(drop=True)
+
+def compare_season_standings(league_id, seasons=None, archive_dir=ARCHIVE_DIR):
+    """
+    Final league rank of each manager in each archived season of a league, one column per season.
+    """
+    columns = ['player_name', 'event', 'league_rank']
+    history = read_archive('hist_teams_data', league_ids=[league_id], seasons=seasons, columns=columns, archive_dir=archive_dir)
+    if history.empty:
+        return pd.DataFrame()
+    final_event = history.groupby('season')['event'].transform('max')
+    final_standings = history[history['event'] == final_event]
+    return final_standings.pivot_table(index='player_name', columns='season', values='league_rank', aggfunc='min')
+
+### END OF ARCHIVE FUNCTIONS ###
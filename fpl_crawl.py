@@ -0,0 +1,209 @@
+import os
+import time
+import threading
+import collections
+import concurrent.futures
+
+### START OF CRAWL CONTROL FUNCTIONS ###
+
+MAX_CONCURRENCY = int(os.environ.get('FPL_MAX_CONCURRENCY', 8)) # most requests in flight at once, across all extractions
+INITIAL_CONCURRENCY = 4
+BACKOFF_FACTOR = 0.5 # the concurrency is multiplied by this on every 429 or 5xx
+BACKOFF_SECONDS = 1.0 # pause after a 429 or 5xx without a Retry-After header, doubled on consecutive failures
+MAX_BACKOFF_SECONDS = 60.0
+REQUEST_TIMEOUT_SECONDS = 30
+MAX_ATTEMPTS = 5 # tries per unit of work before it counts against the error budget
+ERROR_BUDGET = 0.02 # share of units an extraction may lose before it is abandoned
+ERROR_BUDGET_MIN_UNITS = 2 # units an extraction may always lose, so that a small league is not abandoned over one unit
+
+# outcomes worth trying again: throttling, server errors and network errors. Client errors such as 404 are final.
+RETRYABLE_OUTCOMES = {'throttled', 'server_error', 'network_error'}
+
+class CrawlError(Exception):
+    """
+    Raised when an extraction loses more units of work than its error budget allows.
+    """
+
+class CrawlController:
+    """
+    Limits the requests in flight to the API, adapting the limit with AIMD: the limit grows by one for every window of
+    successful requests and is cut by BACKOFF_FACTOR on a 429 or 5xx, after which no new requests start until the
+    backoff (the Retry-After header if the API sends one) has passed.
+    Shared by every extraction in the process, so that concurrent extractions back off together.
+    """
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, initial_concurrency=INITIAL_CONCURRENCY,
+                 backoff_factor=BACKOFF_FACTOR, backoff_seconds=BACKOFF_SECONDS, max_backoff_seconds=MAX_BACKOFF_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.backoff_factor = backoff_factor
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.consecutive_failures = 0
+        self.counters = collections.Counter()
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a free slot and for any backoff to pass.
+        """
+        with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < int(self.limit):
+                    break
+                self.condition.wait(timeout=pause if pause > 0 else None)
+            self.in_flight += 1
+
+    def release(self, outcome, retry_after=None):
+        """
+        Free the slot and adapt the limit to the outcome of the request.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            self.counters['requests'] += 1
+            self.counters[outcome] += 1
+            if outcome == 'ok':
+                self.consecutive_failures = 0
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif outcome in RETRYABLE_OUTCOMES:
+                self.consecutive_failures += 1
+                self.limit = max(1.0, self.limit * self.backoff_factor)
+                backoff = retry_after if retry_after is not None else \
+                    self.backoff_seconds * 2 ** (self.consecutive_failures - 1)
+                self.paused_until = max(self.paused_until, time.monotonic() + min(backoff, self.max_backoff_seconds))
+                self.counters['backoffs'] += 1
+            self.condition.notify_all()
+
+    def count(self, counter, n=1):
+        with self.condition:
+            self.counters[counter] += n
+
+    def stats(self):
+        """
+        Current limit, requests in flight and counters, for monitoring.
+        """
+        with self.condition:
+            return {'limit': round(self.limit, 2), 'in_flight': self.in_flight, **self.counters}
+
+crawl_controller = CrawlController()
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header. HTTP dates are not used by the API and are ignored.
+    """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def classify_status(status_code):
+    if status_code == 200:
+        return 'ok'
+    if status_code == 429:
+        return 'throttled'
+    if status_code >= 500:
+        return 'server_error'
+    return 'client_error'
+
+def request_json(url, controller=None):
+    """
+    GET a URL through the controller. Returns the parsed JSON, or None, and the outcome of the request.
+    """
+    import requests # imported on first use, since the app only needs it when a league is extracted
+    controller = controller or crawl_controller
+    controller.acquire()
+    outcome, retry_after = 'network_error', None
+    try:
+        response = requests.get(url, timeout=REQUEST_TIMEOUT_SECONDS)
+        outcome = classify_status(response.status_code)
+        if outcome == 'ok':
+            return response.json(), outcome
+        if outcome == 'throttled':
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        print(f"Failed to fetch data. Status code: {response.status_code}")
+        print(response.text)
+        return None, outcome
+    except requests.RequestException as e:
+        print(f"Failed to fetch data from {url}: {e}")
+        return None, outcome
+    finally:
+        controller.release(outcome, retry_after)
+
+class ErrorBudget:
+    """
+    Units of work attempted and lost in one extraction. Exhausted when more than budget of the units are lost,
+    and more than min_units of them.
+    """
+    def __init__(self, budget=ERROR_BUDGET, min_units=ERROR_BUDGET_MIN_UNITS):
+        self.budget = budget
+        self.min_units = min_units
+        self.units = 0
+        self.failed_units = []
+        self.lock = threading.Lock()
+
+    def record(self, n_units, failed_units):
+        with self.lock:
+            self.units += n_units
+            self.failed_units.extend(failed_units)
+
+    def exhausted(self):
+        return len(self.failed_units) > max(self.min_units, self.budget * self.units)
+
+    def check(self):
+        """
+        Raise CrawlError once the budget is exhausted, so that an incomplete league is never cached.
+        """
+        if self.exhausted():
+            raise CrawlError(f"Lost {len(self.failed_units)} of {self.units} units, more than the error budget "
+                             f"of {self.budget:.0%} (at least {self.min_units} units). First lost units: {self.failed_units[:5]}")
+
+def fetch_units(urls, budget=None, controller=None, max_attempts=MAX_ATTEMPTS, journal=None):
+    """
+    Fetch a unit of work per URL concurrently, e.g. {(entry, game_week): url}, and return {unit: data} for the units fetched.
+    Units that fail with a retryable error are put back at the end of the queue, up to max_attempts tries.
+    Units that still fail are recorded against the budget, and CrawlError is raised once the budget is exhausted.
+    Units answered with a client error such as 404 do not exist, so they are left out of the results without counting
+    against the budget.
+    With a journal, units already in it are not fetched again and every unit fetched is added to it.
+    """
+    controller = controller or crawl_controller
+    journaled = journal.load() if journal is not None else {}
+    results = {unit: journaled[url] for unit, url in urls.items() if url in journaled}
+    if results:
+        controller.count('resumed_units', len(results))
+    pending = collections.deque((unit, url) for unit, url in urls.items() if url not in journaled)
+    attempts = collections.Counter()
+    failed_units = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=controller.max_concurrency) as pool:
+        futures = {}
+        while pending or futures:
+            while pending:
+                unit, url = pending.popleft()
+                attempts[unit] += 1
+                futures[pool.submit(request_json, url, controller)] = (unit, url)
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                unit, url = futures.pop(future)
+                data, outcome = future.result()
+                if outcome == 'ok':
+                    results[unit] = data
+                    if journal is not None:
+                        journal.record(url, data)
+                elif outcome in RETRYABLE_OUTCOMES and attempts[unit] < max_attempts:
+                    controller.count('requeued')
+                    pending.append((unit, url))
+                elif outcome == 'client_error':
+                    controller.count('missing_units')
+                else:
+                    controller.count('failed_units')
+                    failed_units.append(unit)
+    if journal is not None:
+        journal.close()
+    if budget is not None:
+        budget.record(len(urls), failed_units)
+        budget.check()
+    return results
+
+### END OF CRAWL CONTROL FUNCTIONS ###
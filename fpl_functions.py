@@ -1,30 +1,39 @@
-import requests
+import os
 import pandas as pd
+import numpy as np
+import contextlib
 import datetime
+import hashlib
+import json
 import pytz
+import threading
+import tracemalloc
 import warnings
-from tqdm.auto import tqdm
+from fpl_archive import ARCHIVE_DIR, archive_league_data, season_label
+from fpl_crawl import ErrorBudget, crawl_controller, fetch_units
+from fpl_journal import JOURNAL_DIR, ExtractionJournal
+from fpl_squads import build_squad_tensor, squads_dir
 
 # Suppress all warnings
 warnings.filterwarnings("ignore")
 
-# Set pandas display options
-pd.set_option('display.max_columns', None)
-tqdm.pandas()
-
 ### START OF API RELATED FUNCTIONS ###
 
 # Constants
-BASE_URL = 'https://fantasy.premierleague.com/api/'
+BASE_URL = os.environ.get('FPL_BASE_URL', 'https://fantasy.premierleague.com/api/')
 
 def fetch_data(url):
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Failed to fetch data. Status code: {response.status_code}")
-        print(response.text)
-        return None
+    return fetch_units({url: url}).get(url)
+
+def current_game_week():
+    """
+    Latest game week that has started, from the events of bootstrap-static. Later game weeks have no data to crawl.
+    Falls back to the last game week of the season if bootstrap-static cannot be fetched.
+    """
+    data = fetch_data(f"{BASE_URL}bootstrap-static/")
+    if not data:
+        return TOTAL_GAME_WEEKS
+    return max((event['id'] for event in data['events'] if event.get('is_current') or event.get('finished')), default=1)
 
 def create_dim_teams(league_id):
     url = f"{BASE_URL}leagues-classic/{league_id}/standings/"
@@ -35,15 +44,17 @@ def create_dim_teams(league_id):
     # standings.rename(columns={"rank": "league_rank"}, inplace=True) # rename rank column to league_rank
     return standings[['id', 'player_name', 'entry', 'entry_name']], league_name, start_event
 
-def create_hist_teams_data(dim_teams, start_event):
-    hist_teams_data = pd.DataFrame()
+def create_hist_teams_data(dim_teams, start_event, budget=None, journal=None):
+    responses = fetch_units({entry: f"{BASE_URL}entry/{entry}/history" for entry in dim_teams['entry']}, 
+                            budget=budget, journal=journal)
+    hist_teams_data = []
     for entry in dim_teams['entry']:
-        url = f"{BASE_URL}entry/{entry}/history"
-        data = fetch_data(url)
+        data = responses.get(entry)
         if data:
             historical_standings = pd.json_normalize(data['current'])
             historical_standings['entry'] = entry
-            hist_teams_data = pd.concat([hist_teams_data, historical_standings])
+            hist_teams_data.append(historical_standings)
+    hist_teams_data = pd.concat(hist_teams_data)
 
     # Ensure that the dataset only starts from the start_event gameweek
     hist_teams_data = hist_teams_data[hist_teams_data['event']>=start_event]
@@ -62,37 +73,43 @@ def create_hist_teams_data(dim_teams, start_event):
     
     return hist_teams_data
 
-def create_all_team_selections(hist_teams_data, max_gw, start_event):
-    all_team_selections = pd.DataFrame()
-    for gw in range(start_event, max_gw + 1):
-        for entry in hist_teams_data[hist_teams_data['event'] == gw]['entry']:
-            url = f"{BASE_URL}entry/{entry}/event/{gw}/picks/"
-            data = fetch_data(url)
-            if data:
-                team_selection = pd.json_normalize(data['picks'])
-                team_selection['entry'] = entry
-                team_selection['event'] = gw
-                auto_subs = pd.json_normalize(data['automatic_subs'])
-                
-                if auto_subs.empty:
-                    auto_subs = pd.DataFrame(columns=['entry', 'element_in', 'element_out', 'event'])
-                
-                team_selection = pd.merge(team_selection, auto_subs[['element_in', 'element_out']], 
-                                          left_on='element', right_on='element_in', how='left')
-                team_selection = team_selection.drop('element_in', axis=1)
-                team_selection = pd.merge(team_selection, auto_subs[['element_in', 'element_out']], 
-                                          left_on='element', right_on='element_out', how='left')
-                team_selection = team_selection.drop('element_out_y', axis=1)
-                team_selection.rename(columns={"element_out_x": "element_out"}, inplace=True)
-                
-                all_team_selections = pd.concat([all_team_selections, team_selection])
+def create_all_team_selections(hist_teams_data, max_gw, start_event, budget=None, journal=None):
+    units = [(entry, gw) for gw in range(start_event, max_gw + 1)
+             for entry in hist_teams_data[hist_teams_data['event'] == gw]['entry']]
+    responses = fetch_units({(entry, gw): f"{BASE_URL}entry/{entry}/event/{gw}/picks/" for entry, gw in units}, 
+                            budget=budget, journal=journal)
+    team_selections = []
+    auto_subs = []
+    for entry, gw in units:
+        data = responses.get((entry, gw))
+        if data:
+            team_selection = pd.json_normalize(data['picks'])
+            team_selection['entry'] = entry
+            team_selection['event'] = gw
+            team_selection['active_chip'] = data.get('active_chip')
+            team_selections.append(team_selection)
+            for auto_sub in data['automatic_subs']:
+                auto_subs.append((entry, gw, auto_sub['element_in'], auto_sub['element_out']))
+
+    if not team_selections:
+        return pd.DataFrame()
+    all_team_selections = pd.concat(team_selections)
+
+    # for players that came off the bench, the player they replaced, and for players that were replaced, the player that came on
+    auto_subs = pd.DataFrame(auto_subs, columns=['entry', 'event', 'element_in', 'element_out'], dtype='float64')
+    selection_keys = pd.MultiIndex.from_frame(all_team_selections[['entry', 'event', 'element']])
+    sub_in_index = pd.MultiIndex.from_frame(auto_subs[['entry', 'event', 'element_in']])
+    sub_out_index = pd.MultiIndex.from_frame(auto_subs[['entry', 'event', 'element_out']])
+    all_team_selections['element_out'] = take_by_key(sub_in_index, {'element_out': auto_subs['element_out'].array}, selection_keys)['element_out']
+    all_team_selections['element_in'] = take_by_key(sub_out_index, {'element_in': auto_subs['element_in'].array}, selection_keys)['element_in']
     return all_team_selections
 
-def create_all_gw_data(max_gw, start_event):
+def create_all_gw_data(max_gw, start_event, budget=None, journal=None):
+    game_weeks = range(start_event, max_gw + 1)
+    responses = fetch_units({gw: f"{BASE_URL}event/{gw}/live/" for gw in game_weeks}, budget=budget, journal=journal)
     all_gw_data = pd.DataFrame()
-    for gw in range(start_event, max_gw + 1):
-        url = f"{BASE_URL}event/{gw}/live/"
-        data = fetch_data(url)
+    for gw in game_weeks:
+        data = responses.get(gw)
         if data:
             elements = data['elements']
             temp_df = pd.DataFrame()
@@ -104,29 +121,205 @@ def create_all_gw_data(max_gw, start_event):
             all_gw_data = pd.concat([all_gw_data, temp_df])
     return all_gw_data
 
-def get_player_info():
+# player attributes kept from bootstrap-static, in the column layout of the original player_data frame
+PLAYER_DATA_COLUMNS = ['code', 'name', 'short_name', 'pulse_id', 'id_player', 'element_type', 'first_name', 'second_name',
+                       'web_name', 'team', 'team_code', 'id_position', 'plural_name', 'plural_name_short', 'singular_name']
+
+class PlayerDimension:
+    """
+    Player attributes from bootstrap-static stored as compact arrays, indexed by player id.
+    Team and position names are categoricals. Built once per bootstrap-static version and shared by all leagues.
+    """
+    def __init__(self, data, version):
+        self.version = version
+        elements, teams, element_types = data['elements'], data['teams'], data['element_types']
+
+        # players of a club that is not in bootstrap-static are left out, as the original merge on the club code did
+        team_codes = [team['code'] for team in teams]
+        known_team_codes = set(team_codes)
+        elements = [player for player in elements if player['team_code'] in known_team_codes]
+
+        # season of the data, from the deadline of the first game week
+        events = data.get('events') or [{}]
+        first_deadline = events[0].get('deadline_time')
+        self.season = season_label(pd.Timestamp(first_deadline) if first_deadline else datetime.date.today())
+
+        self.ids = np.array([player['id'] for player in elements], dtype=np.int16)
+        self.index = pd.Index(self.ids)
+        # pandas builds the hash table of an index on its first lookup, and concurrent first lookups from several
+        # script threads can see it half built. Build it now, before the dimension is shared.
+        self.index.get_indexer(self.ids[:1])
+
+        type_ids = [element_type['id'] for element_type in element_types]
+        team_positions = pd.Index(team_codes).get_indexer([player['team_code'] for player in elements])
+        type_positions = pd.Index(type_ids).get_indexer([player['element_type'] for player in elements])
+
+        def team_field(field, dtype=None):
+            values = [team[field] for team in teams]
+            if dtype is None:
+                return pd.Categorical.from_codes(team_positions, categories=values)
+            return np.array(values, dtype=dtype)[team_positions]
+
+        def type_field(field):
+            return pd.Categorical.from_codes(type_positions, categories=[element_type[field] for element_type in element_types])
+
+        self.columns = {
+            'id_player': self.ids,
+            'element_type': np.array([player['element_type'] for player in elements], dtype=np.int8),
+            'first_name': np.array([player['first_name'] for player in elements], dtype=object),
+            'second_name': np.array([player['second_name'] for player in elements], dtype=object),
+            'web_name': np.array([player['web_name'] for player in elements], dtype=object),
+            'team': np.array([player['team'] for player in elements], dtype=np.int8),
+            'team_code': np.array([player['team_code'] for player in elements], dtype=np.int16),
+            'name': team_field('name'),
+            'short_name': team_field('short_name'),
+            'pulse_id': team_field('pulse_id', dtype=np.int16),
+            'plural_name': type_field('plural_name'),
+            'plural_name_short': type_field('plural_name_short'),
+            'singular_name': type_field('singular_name'),
+        }
+        # columns of the original player_data that are duplicates of the join keys
+        self.aliases = {'code': 'team_code', 'id_position': 'element_type'}
+
+        # the original player_data is ordered by club, then by player
+        self._player_data_order = self.ids[np.argsort(team_positions, kind='stable')]
+        self._player_data = None
+
+    def lookup(self, element_ids, columns=None, suffix=''):
+        """
+        Look up player attributes for each element id, decoded to the dtypes of the original player_data.
+        Element ids that are not found are filled with NaN, same as a left merge.
+        """
+        columns = {col: self.columns[self.aliases.get(col, col)] for col in columns or PLAYER_DATA_COLUMNS}
+        return {col: decode_player_column(values) for col, values in take_by_key(self.index, columns, element_ids, suffix).items()}
+
+    @property
+    def player_data(self):
+        """
+        The player data as a frame in the original player_data layout. Shared, so do not modify it in place.
+        """
+        if self._player_data is None:
+            self._player_data = pd.DataFrame(self.lookup(self._player_data_order))
+        return self._player_data
+
+def decode_player_column(values):
+    """
+    A player dimension column taken by take_by_key, in the dtype of the original player_data: categoricals as objects,
+    whole numbers as int64, or float64 when a player was not found.
+    """
+    if isinstance(values, pd.Categorical):
+        return np.asarray(values, dtype=object)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.int64)
+    if values.dtype.kind == 'f':
+        return values.astype(np.float64)
+    return values
+
+# cache of the player dimension for the latest bootstrap-static version, shared across leagues and script threads
+_player_dimensions = {}
+_player_dimensions_lock = threading.Lock()
+
+def player_dimension_version(data):
+    """
+    Hash the parts of bootstrap-static that the player dimension is built from.
+    Live fields like form and ownership are left out so the version only changes when players or clubs change.
+    """
+    player_fields = ['id', 'element_type', 'first_name', 'second_name', 'web_name', 'team', 'team_code']
+    content = {
+        'elements': [[player[field] for field in player_fields] for player in data['elements']],
+        'teams': [[team['code'], team['name'], team['short_name'], team['pulse_id']] for team in data['teams']],
+        'element_types': [[element_type['id'], element_type['plural_name'], element_type['plural_name_short'],
+                           element_type['singular_name']] for element_type in data['element_types']],
+    }
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+def get_player_dimension():
     url = f"{BASE_URL}bootstrap-static/"
     data = fetch_data(url)
     if data:
-        main_player_info = pd.json_normalize(data['elements'])
-        important_columns = ['id', 'element_type', 'first_name', 'second_name', 'web_name', 'team', 'team_code']
-        main_player_info = main_player_info[important_columns]
-        
-        team_info = pd.json_normalize(data['teams'])
-        team_info = team_info[['code', 'name', 'short_name', 'pulse_id']]
-        
-        element_types_info = pd.json_normalize(data['element_types'])
-        element_types_info = element_types_info[['id', 'plural_name', 'plural_name_short', 'singular_name']]
-        
-        player_data = pd.merge(team_info, main_player_info, left_on='code', right_on='team_code', how='left', suffixes=('_team', '_player'))
-        player_data = pd.merge(player_data, element_types_info, left_on='element_type', right_on='id', how='left', suffixes=('_player', '_position'))
-        
-        return player_data
+        version = player_dimension_version(data)
+        with _player_dimensions_lock:
+            player_dimension = _player_dimensions.get(version)
+        if player_dimension is None:
+            player_dimension = PlayerDimension(data, version)
+            with _player_dimensions_lock:
+                _player_dimensions.clear() # only keep the latest version
+                _player_dimensions[version] = player_dimension
+        return player_dimension
+    return None
+
+def get_player_info():
+    player_dimension = get_player_dimension()
+    if player_dimension:
+        return player_dimension.player_data
     return None
 
-def merge_data(player_data, all_gw_data, all_team_selections, dim_teams):
-    all_player_gw_data = pd.merge(player_data, all_gw_data, left_on='id_player', right_on='player_id', how='left', suffixes=('_PLAYER', '_GW'))
-    full_selection_data = pd.merge(all_team_selections, all_player_gw_data, left_on=['event', 'element'], right_on=['game_week', 'player_id'], how='left', suffixes=('_TeamSelections', '_PlayerGW'))
+def take_by_key(index, columns, keys, suffix=''):
+    """
+    Look up the given columns for each key. Keys that are not found are filled with NaN, same as a left merge.
+    """
+    positions = index.get_indexer(keys)
+    # take only accepts ndarrays and extension arrays, so the .array of a numpy column is passed as its ndarray
+    return {f'{col}{suffix}': pd.api.extensions.take(np.asarray(values) if isinstance(values, pd.arrays.NumpyExtensionArray) else values,
+                                                     positions, allow_fill=True)
+            for col, values in columns.items()}
+
+# columns of Full_Selection_Data used by the pages and the analytical functions
+SELECTION_PLAYER_COLUMNS = ['web_name', 'name', 'plural_name_short', 'singular_name', 'element_type']
+SELECTION_GW_COLUMNS = ['total_points', 'minutes', 'goals_scored', 'assists', 'clean_sheets']
+
+# warn when merging a league takes more memory than this
+MERGE_MEMORY_BUDGET_MB = 256
+
+# tracemalloc traces every allocation of every thread while it runs, so the app only tracks the peak memory of merge_data
+# when FPL_TRACK_MEMORY=1. run_api_extraction always tracks it.
+TRACK_MEMORY = os.environ.get('FPL_TRACK_MEMORY') == '1'
+
+@contextlib.contextmanager
+def track_peak_memory(label, budget_mb=None):
+    """
+    Print the peak memory allocated while the block runs, and warn if it goes over the budget.
+    tracemalloc is process wide, so this is meant for a single extraction at a time, not for the app's script threads.
+    """
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+        peak_mb = (peak_memory - start_memory) / 2**20
+        print(f"Peak memory for {label}: {peak_mb:.1f} MB")
+        if budget_mb is not None and peak_mb > budget_mb:
+            print(f"WARNING: {label} went over the memory budget of {budget_mb} MB.")
+
+def merge_data(player_dimension, all_gw_data, all_team_selections, dim_teams,
+               player_columns=SELECTION_PLAYER_COLUMNS, gw_columns=SELECTION_GW_COLUMNS):
+    """
+    Join each team selection with the player attributes and the player's stats for the game week.
+    Only the given player and game week columns are carried over, and the game week data is cut down to
+    the players picked in the league before it is joined.
+    """
+    all_team_selections = all_team_selections.reset_index(drop=True)
+    player_columns = [col for col in player_columns if col not in all_team_selections.columns]
+
+    # game week stats of the players picked in the league only
+    picked_players = all_gw_data['player_id'].isin(all_team_selections['element'].unique())
+    all_gw_data_lite = all_gw_data.loc[picked_players, ['game_week', 'player_id'] + gw_columns]
+    gw_index = pd.MultiIndex.from_frame(all_gw_data_lite[['game_week', 'player_id']])
+    gw_lookup = take_by_key(gw_index, {col: all_gw_data_lite[col].array for col in all_gw_data_lite.columns},
+                            pd.MultiIndex.from_frame(all_team_selections[['event', 'element']]))
+
+    # the original merge joined the player attributes through the game week data, so picks without game week data
+    # get no player attributes either
+    has_gw_data = pd.notna(gw_lookup['game_week'])
+    player_lookup = player_dimension.lookup(all_team_selections['element'].where(has_gw_data), columns=player_columns)
+
+    full_selection_data = pd.concat([all_team_selections, pd.DataFrame({**gw_lookup, **player_lookup})], axis=1)
     full_selection_data = pd.merge(dim_teams, full_selection_data, on='entry', how='left', suffixes=('_Team', '_Selection'))
     full_selection_data['points_earned'] = full_selection_data['multiplier'] * full_selection_data['total_points']
     return full_selection_data
@@ -158,11 +351,12 @@ def check_data_consistency(dim_teams, hist_teams_data, full_selection_data, max_
             print(f'Checking done for Game Week {gw}.')
     return total_errors
 
-def get_all_transfers(dim_teams, max_gw, start_event):
+def get_all_transfers(dim_teams, max_gw, start_event, budget=None, journal=None):
+    responses = fetch_units({entry: f"{BASE_URL}entry/{entry}/transfers/" for entry in dim_teams['entry']}, 
+                            budget=budget, journal=journal)
     all_transfers = pd.DataFrame()
     for entry in dim_teams['entry']:
-        url = f"{BASE_URL}entry/{entry}/transfers/"
-        data = fetch_data(url)
+        data = responses.get(entry)
         if data:
             df_transfers = pd.json_normalize(data)
             all_transfers = pd.concat([all_transfers, df_transfers])
@@ -181,16 +375,29 @@ def get_all_transfers(dim_teams, max_gw, start_event):
     
     return all_transfers
 
-def process_transfers(all_transfers, dim_teams, player_data, hist_teams_data, all_gw_data):
+def process_transfers(all_transfers, dim_teams, player_dimension, hist_teams_data, all_gw_data):
+    all_transfers = all_transfers.reset_index(drop=True)
+    n_transfers = len(all_transfers)
 
-    all_transfers = pd.merge(all_transfers, dim_teams, on='entry', how='left', suffixes=('_Team', '_Transfer'))
-    all_transfers = pd.merge(all_transfers, player_data, left_on='element_in', right_on='id_player', how='left', suffixes=('_Team', '_PlayerIn'))
-    all_transfers = pd.merge(all_transfers, player_data, left_on='element_out', right_on='id_player', how='left', suffixes=('_PlayerIn', '_PlayerOut'))
-    
+    # team details for each transfer
+    team_index = pd.Index(dim_teams['entry'])
+    team_columns = {col: dim_teams[col].array for col in dim_teams.columns if col != 'entry'}
+    team_lookup = take_by_key(team_index, team_columns, all_transfers['entry'])
+
+    # player details for the players brought in and sold
+    player_in_lookup = player_dimension.lookup(all_transfers['element_in'], suffix='_PlayerIn')
+    player_out_lookup = player_dimension.lookup(all_transfers['element_out'], suffix='_PlayerOut')
+
+    # league rank of the team at the game week of the transfer
     hist_teams_data_lite = hist_teams_data[['entry', 'event', 'league_rank']]
-    all_transfers = pd.merge(all_transfers, hist_teams_data_lite, on=['event', 'entry'], how='left')
-    
-    all_transfers.reset_index(inplace=True)
+    rank_index = pd.MultiIndex.from_frame(hist_teams_data_lite[['event', 'entry']])
+    league_rank = take_by_key(rank_index, {'league_rank': hist_teams_data_lite['league_rank'].array},
+                              pd.MultiIndex.from_frame(all_transfers[['event', 'entry']]))['league_rank']
+
+    all_transfers = pd.concat([pd.DataFrame({'index': np.arange(n_transfers)}),
+                               all_transfers,
+                               pd.DataFrame({**team_lookup, **player_in_lookup, **player_out_lookup,
+                                             'league_rank': league_rank})], axis=1)
     all_transfers['Transfer_ID'] = all_transfers.index
     
     common_columns = ['entry', 'event', 'league_rank', 'time', 'id', 'player_name', 'entry_name', 'time_SG', 'date_clean', 'time_clean', 'Transfer_ID']
@@ -198,44 +405,172 @@ def process_transfers(all_transfers, dim_teams, player_data, hist_teams_data, al
     columns_for_player_out = ['element_out', 'element_out_cost', 'name_PlayerOut', 'id_player_PlayerOut', 'first_name_PlayerOut', 'second_name_PlayerOut', 'web_name_PlayerOut', 'singular_name_PlayerOut']
     standardised_columns = ['element', 'element_cost', 'name', 'id_player', 'first_name', 'second_name', 'web_name', 'singular_name']
     
-    df_transfer_ins = all_transfers[common_columns + columns_for_player_in]
-    df_transfer_outs = all_transfers[common_columns + columns_for_player_out]
+    # stack the ins on top of the outs: the common columns are repeated, the player columns are concatenated
+    df_transfers_in_out = all_transfers[common_columns].take(np.tile(np.arange(n_transfers), 2)).reset_index(drop=True)
+    for col, col_in, col_out in zip(standardised_columns, columns_for_player_in, columns_for_player_out):
+        df_transfers_in_out[col] = pd.concat([all_transfers[col_in], all_transfers[col_out]], ignore_index=True)
     
-    df_transfer_ins.columns = common_columns + standardised_columns
-    df_transfer_outs.columns = common_columns + standardised_columns
-    
-    df_transfer_ins['Direction'] = 'In'
-    df_transfer_outs['Direction'] = 'Out'
-    
-    df_transfers_in_out = pd.concat([df_transfer_ins, df_transfer_outs])
+    df_transfers_in_out['Direction'] = np.repeat(['In', 'Out'], n_transfers).astype(object)
     
+    # points scored by the player in the game week of the transfer
     all_gw_data_lite = all_gw_data[['game_week', 'player_id', 'total_points']]
-    df_transfers_in_out = pd.merge(df_transfers_in_out, all_gw_data_lite, left_on=['event', 'id_player'], right_on=['game_week', 'player_id'], how='left')
+    gw_index = pd.MultiIndex.from_frame(all_gw_data_lite[['game_week', 'player_id']])
+    gw_columns = {col: all_gw_data_lite[col].array for col in all_gw_data_lite.columns}
+    gw_lookup = take_by_key(gw_index, gw_columns, pd.MultiIndex.from_frame(df_transfers_in_out[['event', 'id_player']]))
+    for col, values in gw_lookup.items():
+        df_transfers_in_out[col] = values
     
     return all_transfers, df_transfers_in_out
 
-def run_api_extraction(game_week, league_id):
+# group of API calls that each table of a league is extracted by, from cheapest to most expensive
+LEAGUE_TABLES = {
+    'league_name': 'league',
+    'start_event': 'league',
+    'dim_teams': 'league',
+    'hist_teams_data': 'history',
+    'all_gw_data': 'gw_data',
+    'full_selection_data': 'selections',
+    'ownership_index': 'selections',
+    'squads': 'selections',
+    'all_transfers': 'transfers',
+    'df_transfers_in_out': 'transfers',
+}
+
+class LeagueData:
+    """
+    Handle to the tables of a league, each extracted from the API the first time it is used, e.g. league.hist_teams_data.
+    Tables are extracted in the groups of LEAGUE_TABLES, so that a page that only needs the standings and history
+    never crawls the picks of every team. load(group, extract) is called to get each group, so that the app can serve
+    it from its caches. It defaults to running extract() directly.
+    The responses of each group are journaled in journal_dir, so that an extraction that fails halfway resumes from
+    where it stopped. The journals are kept until the groups are stored: by load when one is given, otherwise by the
+    caller, which then calls clear_journals().
+    Game weeks are extracted up to game_week, or up to the current game week when it is None.
+    version identifies the crawl that every group of the handle is loaded from, so that the app never mixes crawls.
+    """
+    def __init__(self, league_id, game_week=None, archive_dir=ARCHIVE_DIR, load=None, journal_dir=JOURNAL_DIR,
+                 track_memory=TRACK_MEMORY, version=None):
+        self.league_id = league_id
+        self.game_week = game_week
+        self.version = version
+        self.archive_dir = archive_dir
+        self.journal_dir = journal_dir
+        self.track_memory = track_memory
+        self.stores_groups = load is not None
+        self.load = load or (lambda group, extract: extract())
+        self.groups = {}
+        self.player_dimension = None
+
+    def __getattr__(self, table):
+        if table not in LEAGUE_TABLES:
+            raise AttributeError(f"'LeagueData' object has no attribute '{table}', and it is not a table in LEAGUE_TABLES")
+        return self.group(LEAGUE_TABLES[table])[table]
+
+    def group(self, name):
+        if name not in self.groups:
+            self.groups[name] = self.load(name, getattr(self, f"extract_{name}"))
+            if self.stores_groups:
+                self.clear_journals([name])
+        return self.groups[name]
+
+    def is_loaded(self, table):
+        return LEAGUE_TABLES[table] in self.groups
+
+    def last_game_week(self):
+        """
+        Last game week to extract, looked up the first time a group is extracted.
+        """
+        if self.game_week is None:
+            self.game_week = current_game_week()
+        return self.game_week
+
+    def players(self):
+        """
+        Player dimension of the season, fetched once per handle.
+        """
+        if self.player_dimension is None:
+            self.player_dimension = get_player_dimension()
+        return self.player_dimension
+
+    def extract_league(self):
+        dim_teams, league_name, start_event = create_dim_teams(self.league_id)
+        return {'league_name': league_name, 'start_event': start_event, 'dim_teams': dim_teams}
+
+    def journal(self, group):
+        if not self.journal_dir:
+            return None
+        return ExtractionJournal(os.path.join(self.journal_dir, f"league-{self.league_id}-gw{self.last_game_week()}-{group}.jsonl"))
+
+    def clear_journals(self, groups=None):
+        for group in groups or set(LEAGUE_TABLES.values()):
+            journal = self.journal(group)
+            if journal is not None:
+                journal.clear()
+
+    def extract_history(self):
+        budget, journal = ErrorBudget(), self.journal('history')
+        hist_teams_data = create_hist_teams_data(self.dim_teams, self.start_event, budget, journal)
+        self.complete({'dim_teams': self.dim_teams, 'hist_teams_data': hist_teams_data}, budget)
+        return {'hist_teams_data': hist_teams_data}
+
+    def extract_gw_data(self):
+        budget, journal = ErrorBudget(), self.journal('gw_data')
+        all_gw_data = create_all_gw_data(self.last_game_week(), self.start_event, budget, journal)
+        self.complete({'all_gw_data': all_gw_data}, budget)
+        return {'all_gw_data': all_gw_data}
+
+    def extract_selections(self):
+        budget, journal = ErrorBudget(), self.journal('selections')
+        all_team_selections = create_all_team_selections(self.hist_teams_data, self.last_game_week(), self.start_event, budget, journal)
+        player_dimension = self.players()
+
+        with track_peak_memory('merge_data', budget_mb=MERGE_MEMORY_BUDGET_MB) if self.track_memory else contextlib.nullcontext():
+            full_selection_data = merge_data(player_dimension, self.all_gw_data, all_team_selections, self.dim_teams)
+        print(f"Full selection data size: {full_selection_data.memory_usage(deep=True).sum() / 2**20:.1f} MB")
+
+        # the same picks as compact arrays, for the calculations over every team in the league
+        squads = build_squad_tensor(all_team_selections)
+        print(f"Squad tensor size: {squads.nbytes / 2**20:.2f} MB")
+
+        total_errors = check_data_consistency(self.dim_teams, self.hist_teams_data, full_selection_data, self.last_game_week(), self.start_event)
+        print(f"Total errors found: {total_errors}")
+
+        # the squads are saved first, so that league.json does not list a game week whose squads are not archived yet
+        if self.archive_dir:
+            squads.save(squads_dir(self.archive_dir, self.league_id, player_dimension.season))
+        self.complete({'player_data': player_dimension.player_data, 'full_selection_data': full_selection_data}, budget)
+        return {'full_selection_data': full_selection_data, 'ownership_index': build_ownership_index(full_selection_data),
+                'squads': squads}
+
+    def extract_transfers(self):
+        budget, journal = ErrorBudget(), self.journal('transfers')
+        all_transfers = get_all_transfers(self.dim_teams, self.last_game_week(), self.start_event, budget, journal)
+        all_transfers, df_transfers_in_out = process_transfers(all_transfers, self.dim_teams, self.players(), 
+                                                               self.hist_teams_data, self.all_gw_data)
+        self.complete({'all_transfers': all_transfers, 'df_transfers_in_out': df_transfers_in_out}, budget)
+        return {'all_transfers': all_transfers, 'df_transfers_in_out': df_transfers_in_out}
+
+    def complete(self, tables, budget):
+        """
+        Report the crawl and keep a copy of the tables in the local archive, since the API only has the current season.
+        """
+        print(f"Lost {len(budget.failed_units)} of {budget.units} units. Crawl counters: {crawl_controller.stats()}")
+        if self.archive_dir:
+            season = self.players().season
+            archive_league_data(self.league_id, season, self.league_name, self.start_event, tables, archive_dir=self.archive_dir)
+            print(f"Archived {', '.join(tables)} for season {season} to {self.archive_dir}")
+
+def run_api_extraction(game_week, league_id, archive_dir=ARCHIVE_DIR, journal_dir=JOURNAL_DIR):
     start_time = datetime.datetime.now()
     print(f"Code started at: {start_time}")
     
+    game_week = min(game_week, current_game_week()) # game weeks that have not started have no data yet
     print(f"EXTRACTING DATA UP TO GAME WEEK {game_week}")
     
-    dim_teams, league_name, start_event = create_dim_teams(league_id)
-    if dim_teams is None:
-        return None, None, None, None, None
-    
-    hist_teams_data = create_hist_teams_data(dim_teams, start_event)
-    all_team_selections = create_all_team_selections(hist_teams_data, game_week, start_event)
-    all_gw_data = create_all_gw_data(game_week, start_event)
-    player_data = get_player_info()
-    
-    full_selection_data = merge_data(player_data, all_gw_data, all_team_selections, dim_teams)
-    
-    total_errors = check_data_consistency(dim_teams, hist_teams_data, full_selection_data, game_week, start_event)
-    print(f"Total errors found: {total_errors}")
-    
-    all_transfers = get_all_transfers(dim_teams, game_week, start_event)
-    all_transfers, df_transfers_in_out = process_transfers(all_transfers, dim_teams, player_data, hist_teams_data, all_gw_data)
+    league = LeagueData(league_id, game_week, archive_dir, journal_dir=journal_dir, track_memory=True)
+    tables = (league.league_name, league.start_event, league.hist_teams_data, league.full_selection_data, 
+              league.all_transfers, league.df_transfers_in_out)
+    league.clear_journals()
     
     end_time = datetime.datetime.now()
     print(f"Code ended at: {end_time}")
@@ -246,12 +581,283 @@ def run_api_extraction(game_week, league_id):
     elapsed_time_formatted = f"{hours:02}:{minutes:02}:{seconds:02}"
     print(f"Elapsed time: {elapsed_time_formatted}")
     
-    return league_name, start_event, hist_teams_data, full_selection_data, all_transfers, df_transfers_in_out
+    return tables
 
 ### END OF API RELATED FUNCTIONS ###
 
 
 
+### START OF AUTO-SUB AND CAPTAINCY FUNCTIONS ###
+
+SQUAD_SIZE = 15
+STARTING_SIZE = 11
+
+# minimum and maximum number of starting players for each element type (GKP, DEF, MID, FWD)
+MIN_STARTERS_BY_TYPE = np.array([0, 1, 3, 2, 1])
+MAX_STARTERS_BY_TYPE = np.array([0, 1, 5, 5, 3])
+
+def squad_order(team_selections):
+    """
+    Order the picks of the complete squads, those with exactly 15 picks in positions 1 to 15, by entry, event and position
+    so that they can be reshaped into a (squads, 15) matrix. The picks of any other squad are left out.
+    """
+    entries = team_selections['entry'].to_numpy()
+    events = team_selections['event'].to_numpy()
+    positions = team_selections['position'].to_numpy()
+    order = np.lexsort((positions, events, entries))
+    if len(order) == 0:
+        return order
+
+    # each squad is a run of the same entry and event in that order
+    entries, events, positions = entries[order], events[order], positions[order]
+    starts = np.flatnonzero(np.r_[True, (entries[1:] != entries[:-1]) | (events[1:] != events[:-1])])
+    sizes = np.diff(np.r_[starts, len(order)])
+    squad_of_pick = np.repeat(np.arange(len(starts)), sizes)
+    expected_positions = np.arange(len(order)) - np.repeat(starts, sizes) + 1
+    complete = sizes == SQUAD_SIZE
+    complete &= np.bincount(squad_of_pick, weights=positions != expected_positions, minlength=len(starts)) == 0
+    return order[complete[squad_of_pick]]
+
+def resolve_team_selections(team_selections, minutes, finished=None):
+    """
+    Resolve auto-subs, the captain/vice-captain fallback and the chip multipliers for every squad at once.
+
+    team_selections has one row per pick with the columns entry, event, position, element_type, multiplier,
+    is_captain, is_vice_captain and active_chip. minutes and finished are aligned to its rows; a starter is only
+    substituted once their fixtures are finished (all finished by default).
+    Squads without exactly 15 picks in positions 1 to 15 cannot be resolved, and keep the multipliers they have.
+    Returns the multiplier, is_auto_sub_in and is_auto_sub_out of each pick, aligned to the rows.
+    """
+    order = squad_order(team_selections)
+    if len(order) < len(team_selections):
+        print(f"WARNING: {len(team_selections) - len(order)} picks are not part of a complete squad of {SQUAD_SIZE}, "
+              f"their multipliers are kept as they are.")
+
+    def as_squads(values):
+        return np.asarray(values)[order].reshape(-1, SQUAD_SIZE)
+
+    element_type = as_squads(team_selections['element_type'].to_numpy(dtype=np.int64))
+    is_captain = as_squads(team_selections['is_captain'].to_numpy(dtype=bool))
+    is_vice_captain = as_squads(team_selections['is_vice_captain'].to_numpy(dtype=bool))
+    active_chip = as_squads(team_selections['active_chip'].to_numpy(dtype=object))[:, 0]
+    played = as_squads(np.asarray(minutes) > 0)
+    finished = np.ones_like(played) if finished is None else as_squads(np.asarray(finished, dtype=bool))
+    did_not_play = ~played & finished
+
+    n_squads = len(element_type)
+    rows = np.arange(n_squads)
+    bench_boost = active_chip == 'bboost'
+    in_team = np.zeros((n_squads, SQUAD_SIZE), dtype=bool)
+    in_team[:, :STARTING_SIZE] = True
+    in_team[bench_boost] = True
+    auto_sub_in = np.zeros_like(in_team)
+    auto_sub_out = np.zeros_like(in_team)
+
+    # starters per element type, to keep the formation valid
+    type_counts = np.zeros((n_squads, len(MIN_STARTERS_BY_TYPE)), dtype=np.int64)
+    np.add.at(type_counts, (np.repeat(rows, STARTING_SIZE), element_type[:, :STARTING_SIZE].ravel()), 1)
+
+    # each bench player in order of priority replaces the first starter that did not play, if the formation allows it
+    for bench in range(STARTING_SIZE, SQUAD_SIZE):
+        bench_type = element_type[:, bench]
+        can_come_on = ~bench_boost & played[:, bench]
+        for starter in range(STARTING_SIZE):
+            starter_type = element_type[:, starter]
+            same_type = starter_type == bench_type
+            valid = (same_type
+                     | ((starter_type != 1) & (bench_type != 1)
+                        & (type_counts[rows, starter_type] > MIN_STARTERS_BY_TYPE[starter_type])
+                        & (type_counts[rows, bench_type] < MAX_STARTERS_BY_TYPE[bench_type])))
+            swap = can_come_on & in_team[:, starter] & ~auto_sub_out[:, starter] & did_not_play[:, starter] & valid
+            in_team[swap, starter] = False
+            in_team[swap, bench] = True
+            auto_sub_out[swap, starter] = True
+            auto_sub_in[swap, bench] = True
+            type_counts[rows[swap], starter_type[swap]] -= 1
+            type_counts[rows[swap], bench_type[swap]] += 1
+            can_come_on &= ~swap
+
+    # the vice-captain takes the armband if the captain did not play
+    captain = is_captain & in_team & ~did_not_play
+    vice_takes_over = ~captain.any(axis=1)
+    captain[vice_takes_over] = (is_vice_captain & in_team & ~did_not_play)[vice_takes_over]
+
+    captain_multiplier = np.where(active_chip == '3xc', 3, 2)
+    multiplier = in_team.astype(np.int64)
+    multiplier[captain] = np.repeat(captain_multiplier, captain.sum(axis=1))
+
+    def as_rows(values, default):
+        result = np.asarray(default, dtype=values.dtype).copy()
+        result[order] = values.ravel()
+        return result
+
+    no_sub = np.zeros(len(team_selections), dtype=bool)
+    return (as_rows(multiplier, team_selections['multiplier'].to_numpy()),
+            as_rows(auto_sub_in, no_sub), as_rows(auto_sub_out, no_sub))
+
+### END OF AUTO-SUB AND CAPTAINCY FUNCTIONS ###
+
+
+
+### START OF LIVE GAME WEEK FUNCTIONS ###
+
+# game week -> ids of the fixtures last seen finished, used when the fixtures request fails
+_finished_fixtures = {}
+
+def fetch_live_points(game_week):
+    """
+    Fetch the live points and minutes of every player for the game week, as arrays keyed by element id,
+    along with whether all of the player's fixtures for the game week are finished.
+    The live endpoint does not say whether a fixture is finished, which the auto-subs need, so the game week's
+    fixtures are requested as well. That is one extra request per poll, shared by all sessions on the site.
+    """
+    url = f"{BASE_URL}event/{game_week}/live/"
+    data = fetch_data(url)
+    if data:
+        elements = data['elements']
+        element_ids = np.array([player['id'] for player in elements], dtype=np.int64)
+        points = np.array([player['stats']['total_points'] for player in elements], dtype=np.int64)
+        minutes = np.array([player['stats']['minutes'] for player in elements], dtype=np.int64)
+
+        # players without a fixture in the game week count as finished
+        fixtures = fetch_data(f"{BASE_URL}fixtures/?event={game_week}")
+        if fixtures is None:
+            finished_fixtures = _finished_fixtures.get(game_week, set())
+            print(f"WARNING: could not fetch the fixtures of game week {game_week}, using the {len(finished_fixtures)} "
+                  f"fixtures last seen finished. Players who did not play in the others are not auto-subbed.")
+        else:
+            finished_fixtures = {fixture['id'] for fixture in fixtures 
+                                 if fixture.get('finished_provisional') or fixture.get('finished')}
+            _finished_fixtures[game_week] = finished_fixtures
+        finished = np.array([all(fixture['fixture'] in finished_fixtures for fixture in player.get('explain', []))
+                             for player in elements], dtype=bool)
+        return element_ids, points, minutes, finished
+    return None
+
+def apply_live_points(hist_teams_data, full_selection_data, game_week, live_points):
+    """
+    Apply the live player points to the picks of the game week, resolve auto-subs and captaincy from the live minutes,
+    then recompute the game week points, total points and league rank of every team for that game week.
+    The input frames are not modified.
+    """
+    element_ids, points, minutes, finished = live_points
+
+    # element id -> live value, as dense arrays so that the lookup is a single take
+    points_by_element = np.zeros(element_ids.max() + 1, dtype=np.int64)
+    points_by_element[element_ids] = points
+    minutes_by_element = np.zeros(element_ids.max() + 1, dtype=np.int64)
+    minutes_by_element[element_ids] = minutes
+    finished_by_element = np.zeros(element_ids.max() + 1, dtype=bool)
+    finished_by_element[element_ids] = finished
+
+    # picks for the game week, by the event of the pick since game_week is missing for players without game week data
+    full_selection_data = full_selection_data.copy(deep=False)
+    in_gw = (full_selection_data['event'] == game_week).to_numpy()
+    elements = full_selection_data.loc[in_gw, 'element'].to_numpy(dtype=np.int64)
+    elements = np.where(elements < len(points_by_element), elements, 0)
+
+    game_weeks = full_selection_data['game_week'].to_numpy(dtype=np.float64, copy=True)
+    game_weeks[in_gw] = game_week
+    full_selection_data['game_week'] = game_weeks
+    for col, by_element in [('total_points', points_by_element), ('minutes', minutes_by_element)]:
+        values = full_selection_data[col].to_numpy(copy=True)
+        values[in_gw] = by_element[elements]
+        full_selection_data[col] = values
+
+    multiplier = full_selection_data['multiplier'].to_numpy(copy=True)
+    multiplier[in_gw], _, _ = resolve_team_selections(full_selection_data.loc[in_gw], minutes_by_element[elements],
+                                                      finished_by_element[elements])
+    full_selection_data['multiplier'] = multiplier
+    full_selection_data['points_earned'] = full_selection_data['multiplier'] * full_selection_data['total_points']
+
+    live_gw_points = full_selection_data.loc[in_gw].groupby('entry')['points_earned'].sum()
+
+    # team standings for the game week
+    hist_teams_data = hist_teams_data.copy(deep=False)
+    in_gw = (hist_teams_data['event'] == game_week).to_numpy()
+    gw_rows = hist_teams_data.loc[in_gw]
+    prior_total_points = gw_rows['total_points'] - gw_rows['gw_points']
+    gw_points = gw_rows['entry'].map(live_gw_points).fillna(gw_rows['points']).astype(gw_rows['points'].dtype)
+
+    updates = {'points': gw_points}
+    updates['gw_points'] = updates['points'] - gw_rows['event_transfers_cost']
+    updates['total_points'] = prior_total_points + updates['gw_points']
+    updates['league_rank'] = updates['total_points'].rank(method='dense', ascending=False).astype(int)
+
+    for col, gw_values in updates.items():
+        values = hist_teams_data[col].to_numpy(copy=True)
+        values[in_gw] = gw_values.to_numpy()
+        hist_teams_data[col] = values
+
+    return hist_teams_data, full_selection_data
+
+### END OF LIVE GAME WEEK FUNCTIONS ###
+
+
+
+### START OF PROJECTION FUNCTIONS ###
+
+TOTAL_GAME_WEEKS = 38
+
+def project_league_finish(hist_teams_data, game_week, n_simulations=10000, total_game_weeks=TOTAL_GAME_WEEKS,
+                          seed=None, chunk_size=1000):
+    """
+    Simulate the remaining game weeks of the season to get each team's probability of finishing in each league rank.
+    Each team's game week points are resampled from its own net points so far. Ties are broken at random.
+    Returns a frame of probabilities with one row per team (entry_name) and one column per rank.
+    """
+    played = hist_teams_data[hist_teams_data['event'] <= game_week].sort_values(by=['entry_name', 'event'])
+    entry_names = played['entry_name'].unique()
+    n_teams = len(entry_names)
+    team_codes = pd.Index(entry_names).get_indexer(played['entry_name'])
+
+    # points so far, and the past game week points of each team packed to the left of a (teams, game weeks) matrix
+    current_totals = np.zeros(n_teams)
+    np.add.at(current_totals, team_codes, played['gw_points'].to_numpy(dtype=np.float64))
+    games_played = np.bincount(team_codes, minlength=n_teams)
+    slot = np.arange(len(played)) - np.repeat(np.cumsum(games_played) - games_played, games_played)
+    past_points = np.zeros((n_teams, max(games_played.max(initial=0), 1)))
+    past_points[team_codes, slot] = played['gw_points'].to_numpy(dtype=np.float64)
+    games_played = np.maximum(games_played, 1)
+
+    rng = np.random.default_rng(seed)
+    remaining_game_weeks = max(total_game_weeks - game_week, 0)
+    rank_counts = np.zeros(n_teams * n_teams, dtype=np.int64)
+    teams = np.arange(n_teams)
+
+    for start in range(0, n_simulations, chunk_size):
+        n_chunk = min(chunk_size, n_simulations - start)
+        totals = np.tile(current_totals, (n_chunk, 1))
+        for _ in range(remaining_game_weeks):
+            picked = (rng.random((n_chunk, n_teams)) * games_played).astype(np.int64)
+            totals += past_points[teams, picked]
+
+        # points are whole numbers, so adding a fraction only breaks the ties
+        order = np.argsort(-(totals + rng.random((n_chunk, n_teams))), axis=1)
+        rank_counts += np.bincount((order * n_teams + teams).ravel(), minlength=n_teams * n_teams)
+
+    probabilities = rank_counts.reshape(n_teams, n_teams) / n_simulations
+    return pd.DataFrame(probabilities, index=pd.Index(entry_names, name='entry_name'), columns=np.arange(1, n_teams + 1))
+
+def summarise_league_projection(probabilities, hist_teams_data, game_week):
+    """
+    Summarise the projected finishing positions of each team, ordered by expected final rank.
+    """
+    current_rank = hist_teams_data[hist_teams_data['event'] == game_week].set_index('entry_name')['league_rank']
+    summary = pd.DataFrame({
+        'entry_name': probabilities.index,
+        'league_rank': current_rank.reindex(probabilities.index).to_numpy(),
+        'expected_rank': probabilities.to_numpy() @ probabilities.columns.to_numpy(dtype=np.float64),
+        'win_probability': probabilities[1].to_numpy(),
+        'top_3_probability': probabilities.loc[:, :3].sum(axis=1).to_numpy(),
+        'most_likely_rank': probabilities.idxmax(axis=1).to_numpy(),
+    })
+    return summary.sort_values(by=['expected_rank', 'league_rank']).reset_index(drop=True)
+
+### END OF PROJECTION FUNCTIONS ###
+
+
+
 ### START OF ANALYTICAL FUNCTIONS ###
 
 def cleanse_similar_df(df, team_1, team_2):
@@ -384,4 +990,217 @@ def calculate_similarity_score(df1, df2):
     return round(overall_similarity, 2), similar_df, only_df1, only_df2
 
 
-### END OF ANALYTICAL FUNCTIONS ###
\ No newline at end of file
+def simulate_captain_choices(full_selection_data):
+    """
+    For every team and game week, score every player in the team as the alternative captain.
+    Returns the best alternative for each game week and the points it would have added.
+    """
+    picks = full_selection_data[full_selection_data['multiplier'] > 0]
+    # game_week is missing for a player without game week data, so the picks are grouped by their event
+    picks = picks[['entry', 'entry_name', 'event', 'web_name', 'multiplier', 'total_points', 'active_chip']].reset_index(drop=True)
+    picks['total_points'] = picks['total_points'].fillna(0)
+
+    keys = [picks['entry'], picks['event']]
+    is_captain = picks['multiplier'] > 1
+    captain_extra = np.where(picks['active_chip'] == '3xc', 2, 1) # extra multiples of points for the captain
+    captain_points = picks['total_points'].where(is_captain, 0).groupby(keys).transform('max')
+
+    # points gained by moving the armband to each player
+    picks['points_left'] = (picks['total_points'] - captain_points) * captain_extra
+    picks['captain'] = picks['web_name'].where(is_captain).groupby(keys).transform('first')
+
+    best = picks.loc[picks.groupby(keys)['points_left'].idxmax()]
+    return pd.DataFrame({'entry': best['entry'], 'entry_name': best['entry_name'], 'game_week': best['event'],
+                         'decision': 'Captain', 'choice_made': best['captain'].fillna('No captain'),
+                         'better_choice': best['web_name'], 'points_left': best['points_left']})
+
+def simulate_transfer_reversals(full_selection_data, df_transfers_in_out, all_gw_data, hist_teams_data=None):
+    """
+    Score every transfer as if it had not been made, from the game week of the transfer until the player bought is sold.
+    The player sold would have scored in place of the player bought in each of those game weeks,
+    and the share of any points deduction for the game week of the transfer is saved.
+    """
+    transfers_in = df_transfers_in_out[df_transfers_in_out['Direction'] == 'In']
+    transfers_out = df_transfers_in_out[df_transfers_in_out['Direction'] == 'Out']
+    transfers = pd.merge(transfers_in[['Transfer_ID', 'entry', 'entry_name', 'event', 'time', 'element', 'web_name']],
+                         transfers_out[['Transfer_ID', 'element', 'web_name']],
+                         on='Transfer_ID', suffixes=('_in', '_out')).reset_index(drop=True)
+
+    # the slot changes again when the player bought is next sold by the same team, otherwise it holds to the last game week
+    sales = pd.merge(transfers[['entry', 'element_in', 'time']].reset_index(),
+                     transfers[['entry', 'element_out', 'time', 'event']],
+                     left_on=['entry', 'element_in'], right_on=['entry', 'element_out'], suffixes=('', '_sold'))
+    next_sale = sales[sales['time_sold'] > sales['time']].groupby('index')['event'].min()
+    last_game_week = full_selection_data['event'].max() if len(full_selection_data) else 0
+    span_end = next_sale.reindex(transfers.index).fillna(last_game_week + 1).to_numpy(dtype=np.int64)
+    span = np.clip(span_end - transfers['event'].to_numpy(dtype=np.int64), 0, None)
+
+    # one row per transfer and game week held
+    rows = np.repeat(np.arange(len(transfers)), span)
+    game_weeks = transfers['event'].to_numpy(dtype=np.int64)[rows] + np.arange(len(rows)) - np.repeat(np.cumsum(span) - span, span)
+
+    # points of both players and the multiplier the player bought had in each game week
+    gw_index = pd.MultiIndex.from_frame(all_gw_data[['game_week', 'player_id']])
+    gw_points = {'total_points': all_gw_data['total_points'].array}
+    points = {}
+    for direction in ['in', 'out']:
+        keys = pd.MultiIndex.from_arrays([game_weeks, transfers[f'element_{direction}'].to_numpy()[rows]])
+        points[direction] = np.nan_to_num(np.asarray(take_by_key(gw_index, gw_points, keys)['total_points'], dtype=np.float64))
+    selection_index = pd.MultiIndex.from_frame(full_selection_data[['entry', 'event', 'element']])
+    multiplier = take_by_key(selection_index, {'multiplier': full_selection_data['multiplier'].array},
+                             pd.MultiIndex.from_arrays([transfers['entry'].to_numpy()[rows], game_weeks,
+                                                        transfers['element_in'].to_numpy()[rows]]))['multiplier']
+    multiplier = np.nan_to_num(np.asarray(multiplier, dtype=np.float64))
+
+    points_left = np.bincount(rows, weights=(points['out'] - points['in']) * multiplier, minlength=len(transfers))
+
+    # each transfer of the game week carries an equal share of the points deduction
+    if hist_teams_data is not None:
+        transfer_cost = hist_teams_data[['entry', 'event', 'event_transfers_cost']]
+        transfer_count = transfers.groupby(['entry', 'event'])['Transfer_ID'].transform('count')
+        cost_index = pd.MultiIndex.from_frame(transfer_cost[['entry', 'event']])
+        cost = take_by_key(cost_index, {'cost': transfer_cost['event_transfers_cost'].array},
+                           pd.MultiIndex.from_frame(transfers[['entry', 'event']]))['cost']
+        points_left = points_left + np.nan_to_num(np.asarray(cost, dtype=np.float64)) / transfer_count
+
+    return pd.DataFrame({'entry': transfers['entry'], 'entry_name': transfers['entry_name'], 'game_week': transfers['event'],
+                         'decision': 'Transfer', 'choice_made': transfers['web_name_in'] + ' in for ' + transfers['web_name_out'],
+                         'better_choice': 'Keep ' + transfers['web_name_out'], 'points_left': points_left})
+
+def simulate_what_ifs(full_selection_data, df_transfers_in_out, all_gw_data, hist_teams_data=None):
+    """
+    Rank the captaincy and transfer decisions of every team in the league by the points left on the table.
+    Decisions that could not have been improved on are left out.
+    """
+    what_ifs = pd.concat([simulate_captain_choices(full_selection_data),
+                          simulate_transfer_reversals(full_selection_data, df_transfers_in_out, all_gw_data, hist_teams_data)],
+                         ignore_index=True)
+    what_ifs = what_ifs[what_ifs['points_left'] > 0]
+    return what_ifs.sort_values(by=['points_left', 'game_week'], ascending=[False, True]).reset_index(drop=True)
+
+
+def build_ownership_index(full_selection_data):
+    """
+    Build the league's ownership of every player picked in each game week, indexed by (game_week, element).
+    Players that nobody picked in a game week have no row. Ownership and effective ownership are
+    the share of the league's teams that picked the player, and the average multiplier across the league's teams.
+    """
+    # the game week of a pick is its event, as game_week is missing for players without game week data
+    picks = full_selection_data[full_selection_data['event'].notna()]
+    picks = picks.assign(game_week=picks['event'].astype(int),
+                         starting=picks['position'] <= 11,
+                         captained=(picks['position'] <= 11) & picks['is_captain'].astype(bool))
+    ownership_index = picks.groupby(['game_week', 'element']).agg(
+        web_name=('web_name', 'first'),
+        name=('name', 'first'),
+        element_type=('element_type', 'first'),
+        plural_name_short=('plural_name_short', 'first'),
+        total_points=('total_points', 'first'),
+        selected=('entry', 'size'),
+        starting=('starting', 'sum'),
+        captained=('captained', 'sum'),
+        multiplier_sum=('multiplier', 'sum'),
+    )
+    teams = picks.groupby('game_week')['entry'].nunique()
+    teams = teams.reindex(ownership_index.index.get_level_values('game_week')).to_numpy()
+    ownership_index['ownership'] = ownership_index['selected'] / teams
+    ownership_index['effective_ownership'] = ownership_index['multiplier_sum'] / teams
+    return ownership_index.sort_index()
+
+def ownership_counts(ownership_index, first_game_week, last_game_week, column='starting', by='web_name', top_n=5):
+    """
+    Total of an ownership column over a range of game weeks, grouped by player or club, for the top N.
+    """
+    game_weeks = ownership_index.loc[first_game_week:last_game_week]
+    counts = game_weeks.groupby(by)[column].sum()
+    return counts[counts > 0].nlargest(top_n)
+
+def find_differentials(ownership_index, game_week, max_ownership=0.2, top_n=10):
+    """
+    Highest scoring players in the game week that were picked by at most max_ownership of the league.
+    """
+    if game_week not in ownership_index.index.get_level_values('game_week'):
+        return ownership_index.iloc[:0]
+    players = ownership_index.loc[game_week]
+    players = players[players['ownership'] <= max_ownership]
+    return players.sort_values(by=['total_points', 'ownership'], ascending=[False, True]).head(top_n)
+
+# number of players of each element type in a squad (GKP, DEF, MID, FWD)
+SQUAD_PLAYERS_BY_TYPE = {1: 2, 2: 5, 3: 5, 4: 3}
+
+def find_template_team(ownership_index, game_week):
+    """
+    The league's template squad for the game week: the most selected players in each position.
+    """
+    if game_week not in ownership_index.index.get_level_values('game_week'):
+        return ownership_index.iloc[:0]
+    players = ownership_index.loc[game_week].sort_values(by=['selected', 'effective_ownership'], ascending=False)
+    template_team = [players[players['element_type'] == element_type].head(count)
+                     for element_type, count in SQUAD_PLAYERS_BY_TYPE.items()]
+    return pd.concat(template_team)
+
+### END OF ANALYTICAL FUNCTIONS ###
+
+
+
+### START OF LEAGUE CHART FUNCTIONS ###
+
+# Leagues with more teams than this are charted as percentile bands and a few team lines, rather than a line per team
+LARGE_LEAGUE_TEAMS = 50
+CHART_TOP_TEAMS = 10
+MAX_CHART_POINTS = 2000 # most points of team lines sent to the browser in one chart, whatever the size of the league
+CHART_PERCENTILES = [10, 25, 50, 75, 90]
+
+def performance_bands(performance, column, x='Game Week', percentiles=CHART_PERCENTILES):
+    """
+    Percentiles of a column across all teams at every game week, as a DataFrame indexed by game week
+    with a column per percentile.
+    """
+    values = performance.pivot_table(index=x, columns='Team', values=column)
+    bands = np.nanpercentile(values.to_numpy(dtype=float), percentiles, axis=1).T
+    return pd.DataFrame(bands, index=values.index, columns=percentiles)
+
+def select_chart_teams(performance, highlight_teams=(), top_n=CHART_TOP_TEAMS, max_points=MAX_CHART_POINTS, x='Game Week'):
+    """
+    Teams to draw as lines in a large league chart: the highlighted teams, then the top N by rank at the latest game week,
+    trimmed so that the lines have at most max_points points between them.
+    """
+    max_teams = max(1, max_points // max(1, performance[x].nunique()))
+    latest = performance[performance[x] == performance[x].max()]
+    top_teams = latest.sort_values(by=['Rank', 'Team'])['Team'].head(top_n)
+    teams = list(dict.fromkeys([*highlight_teams, *top_teams]))
+    return teams[:max_teams]
+
+### END OF LEAGUE CHART FUNCTIONS ###
+
+
+
+### START OF STANDINGS FUNCTIONS ###
+
+STANDINGS_COLUMNS = ['event', 'entry', 'entry_name', 'player_name', 'points', 'total_points', 'bank', 'value', 'event_transfers',
+                     'event_transfers_cost', 'points_on_bench', 'league_rank']
+
+def build_standings(hist_teams_data):
+    """
+    The standings of every game week in one frame, sorted by game week and league rank, with each team's
+    change in rank from the previous game week. Built once per league, so that a page of the standings
+    for any game week is a slice of it.
+    """
+    standings = hist_teams_data[hist_teams_data['event'].notna()][STANDINGS_COLUMNS].sort_values(by=['entry_name', 'event'])
+    standings['rank_change'] = standings['league_rank'] - standings.groupby('entry_name')['league_rank'].shift(1)
+    standings = standings.sort_values(by=['event', 'league_rank', 'entry_name'], kind='stable')
+    return standings.reset_index(drop=True)
+
+def game_week_standings(standings, game_week, search='', sort_by='league_rank', ascending=True):
+    """
+    The standings of a game week, for the teams whose name contains search, sorted by a column with ties in league rank order.
+    """
+    events = standings['event'].to_numpy()
+    rows = standings.iloc[np.searchsorted(events, game_week, side='left'):np.searchsorted(events, game_week, side='right')]
+    if search:
+        rows = rows[rows['entry_name'].str.contains(search, case=False, regex=False)]
+    if sort_by != 'league_rank' or not ascending:
+        rows = rows.sort_values(by=[sort_by, 'league_rank'], ascending=[ascending, True], kind='stable')
+    return rows
+
+### END OF STANDINGS FUNCTIONS ###
\ No newline at end of file
@@ -0,0 +1,84 @@
+import os
+import json
+import time
+
+### START OF JOURNAL FUNCTIONS ###
+
+# Where extractions record the work units they have fetched, so that an interrupted extraction can resume
+JOURNAL_DIR = os.environ.get('FPL_JOURNAL_DIR', 'fpl_journal')
+
+# journals older than this are discarded rather than resumed, since the API data has moved on
+JOURNAL_MAX_AGE_SECONDS = 4 * 60 * 60 # same as the app's cache
+
+class ExtractionJournal:
+    """
+    Append-only log of the responses fetched by an extraction, one JSON line per URL, after a header line with
+    the time the journal was started. Replaying it is idempotent: a URL fetched twice keeps its latest response,
+    and a line cut short by a crash is skipped.
+    """
+    def __init__(self, path, max_age_seconds=JOURNAL_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.file = None
+
+    def load(self):
+        """
+        Responses recorded so far, as {url: data}. A journal older than max_age_seconds is deleted instead.
+        """
+        responses = {}
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return responses
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # a line cut short when the last run stopped
+                if 'started_at' in record:
+                    if time.time() - record['started_at'] > self.max_age_seconds:
+                        break
+                    continue
+                responses[record['url']] = record['data']
+            else:
+                return responses
+        self.clear()
+        return {}
+
+    def record(self, url, data):
+        if self.file is None:
+            self.open()
+        self.file.write(json.dumps({'url': url, 'data': data}) + '\n')
+        self.file.flush()
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, 'a')
+        if is_new:
+            self.file.write(json.dumps({'started_at': time.time()}) + '\n')
+        elif not self.ends_with_newline():
+            self.file.write('\n') # start after the line cut short, rather than on the end of it
+
+    def ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def clear(self):
+        """
+        Delete the journal, once the extraction it belongs to has completed.
+        """
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+### END OF JOURNAL FUNCTIONS ###
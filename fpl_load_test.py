@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import functools
+import threading
+import subprocess
+import collections
+import urllib.parse
+import urllib.request
+
+### START OF LOAD TEST FUNCTIONS ###
+
+# Simulated users of fpl_site.py. The app runs as a real Streamlit server, backed by the stub FPL API, and every user
+# is a websocket session that loads a league and then switches pages, game weeks and teams, e.g.
+#   python fpl_load_test.py --users 24 --leagues 4 --actions 12
+
+LOAD_TEST_PAGES = ['Overall League', 'Individual Team Overview', 'Similarity Analyser', 'Transfer Statistics']
+LOAD_TEST_PERCENTILES = [50, 90, 99]
+ACTION_TIMEOUT_SECONDS = 600
+SERVER_START_TIMEOUT_SECONDS = 60
+MEMORY_SAMPLE_SECONDS = 0.25
+
+# query string parameter that tells the server which action a rerun belongs to. The app does not read it.
+ACTION_PARAM = 'load_test_action'
+
+class CacheStats:
+    """
+    Counts the calls to the app's cached functions and the misses among them, by the action of the rerun that made
+    them. Runs inside the app server, and writes the counts to path every second for the load test to read.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.calls = collections.Counter()
+        self.misses = collections.Counter()
+        self.lock = threading.Lock()
+
+    def current_action(self):
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        if get_script_run_ctx() is None:
+            return 'other'
+        return st.query_params.get(ACTION_PARAM, 'other')
+
+    def count(self, counter):
+        with self.lock:
+            counter[self.current_action()] += 1
+
+    def counted_cache(self, cache_api):
+        """
+        Wrap the st.cache_data or st.cache_resource decorator. Every call to a decorated function is counted on the
+        way in, and a miss is counted when the function body itself runs.
+        """
+        stats = self
+
+        def decorator(func=None, **kwargs):
+            if func is None:
+                return lambda func: decorator(func, **kwargs)
+
+            @functools.wraps(func)
+            def on_miss(*args, **func_kwargs):
+                stats.count(stats.misses)
+                return func(*args, **func_kwargs)
+            cached = cache_api(on_miss, **kwargs)
+
+            @functools.wraps(func)
+            def on_call(*args, **func_kwargs):
+                stats.count(stats.calls)
+                return cached(*args, **func_kwargs)
+            on_call.clear = cached.clear
+            return on_call
+
+        decorator.clear = cache_api.clear
+        return decorator
+
+    def install(self):
+        """
+        Replace st.cache_data and st.cache_resource by their counted versions before the app is run, then start
+        writing the counts.
+        """
+        import streamlit
+        streamlit.cache_data = self.counted_cache(streamlit.cache_data)
+        streamlit.cache_resource = self.counted_cache(streamlit.cache_resource)
+        threading.Thread(target=self.write_forever, daemon=True).start()
+
+    def write_forever(self):
+        while True:
+            with self.lock:
+                counts = {'calls': dict(self.calls), 'misses': dict(self.misses)}
+            with open(f"{self.path}.tmp", 'w') as f:
+                json.dump(counts, f)
+            os.replace(f"{self.path}.tmp", self.path)
+            time.sleep(1)
+
+def serve_instrumented(script, port, stats_path):
+    """
+    Run the app like `streamlit run`, counting its cache hits into stats_path. Called in the app server process.
+    """
+    CacheStats(stats_path).install()
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', script, f'--server.port={port}', '--server.headless=true',
+                '--server.fileWatcherType=none', '--browser.gatherUsageStats=false']
+    cli.main()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_app_server(env, work_dir, script='fpl_site.py'):
+    """
+    Start the app in a new process on a free port and wait until it is healthy. Returns the process, its URL and
+    the path of its cache counts.
+    """
+    port, stats_path = free_port(), os.path.join(work_dir, 'cache_stats.json')
+    code = f"from fpl_load_test import serve_instrumented; serve_instrumented({script!r}, {port}, {stats_path!r})"
+    log = open(os.path.join(work_dir, 'server.log'), 'w')
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process, url, stats_path
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"The app did not start within {SERVER_START_TIMEOUT_SECONDS} s, see {log.name}")
+
+def resident_memory(pid):
+    """
+    Resident set size of a process in bytes, from /proc.
+    """
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def read_cache_memory(url):
+    """
+    Bytes held by each of the app's caches and by the session states, from Streamlit's metrics endpoint.
+    """
+    memory = collections.Counter()
+    with urllib.request.urlopen(f"{url}/_stcore/metrics") as response:
+        for line in response.read().decode('utf-8').splitlines():
+            if line.startswith('cache_memory_bytes{'):
+                labels, value = line[len('cache_memory_bytes{'):].rsplit('} ', 1)
+                labels = dict(label.split('=', 1) for label in labels.split(','))
+                name = labels.get('cache_type', '').strip('"')
+                if labels.get('cache', '').strip('"'):
+                    name += ':' + labels['cache'].strip('"').rsplit('.', 1)[-1]
+                memory[name] += int(float(value))
+    return memory
+
+class SimulatedSession:
+    """
+    One user of the app over its websocket, as a browser would be: every action sends the widget values that the user
+    has set and waits for the rerun to finish. Records the time of each action, labelled by what it did and on which page.
+    """
+    def __init__(self, url, league_id, seed=0):
+        self.url = url.replace('http://', 'ws://') + '/_stcore/stream'
+        self.league_id = league_id
+        self.rng = random.Random(seed)
+        self.widgets = {} # label -> (kind, proto) of the widgets drawn by the last rerun
+        self.values = {} # widget id -> WidgetState set by the user
+        self.messages = {} # hash -> message, for the messages the server only sends by reference after the first time
+        self.timings = []
+        self.errors = []
+        self.page = 'Overall League'
+        self.websocket = None
+
+    def set_widget(self, label, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        kind, widget = self.widgets[label]
+        state = WidgetState(id=widget.id)
+        if kind == 'text_input':
+            state.string_value = value
+        else:
+            state.int_value = list(widget.options).index(value)
+        self.values[widget.id] = state
+
+    def trigger(self, label):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        return WidgetState(id=self.widgets[label][1].id, trigger_value=True)
+
+    async def rerun(self, action, triggers=()):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        back_msg = BackMsg()
+        back_msg.rerun_script.query_string = urllib.parse.urlencode({ACTION_PARAM: action})
+        back_msg.rerun_script.widget_states.widgets.extend([*self.values.values(), *triggers])
+
+        start = time.perf_counter()
+        await self.websocket.write_message(back_msg.SerializeToString(), binary=True)
+        self.widgets = {}
+        while True:
+            data = await asyncio.wait_for(self.websocket.read_message(), ACTION_TIMEOUT_SECONDS)
+            if data is None:
+                raise ConnectionError(f"The app closed the session during {action}.")
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            if msg.WhichOneof('type') is None and msg.ref_hash:
+                msg = self.messages.get(msg.ref_hash, msg)
+            elif msg.hash:
+                self.messages[msg.hash] = msg
+            if msg.WhichOneof('type') == 'script_finished':
+                break
+            if msg.WhichOneof('type') == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+                element = msg.delta.new_element
+                kind = element.WhichOneof('type')
+                if kind == 'exception':
+                    self.errors.append(f"{action}: {element.exception.message}")
+                elif kind in ('radio', 'selectbox', 'text_input', 'button'):
+                    self.widgets[getattr(element, kind).label] = (kind, getattr(element, kind))
+        self.timings.append((action, time.perf_counter() - start))
+
+    async def run(self, n_actions, think_time=0.0):
+        """
+        Open the Home page, load the league and take n_actions random actions. The session is left open.
+        """
+        from tornado.websocket import websocket_connect
+        self.websocket = await websocket_connect(self.url, max_message_size=2**30)
+        await self.rerun('home')
+        self.set_widget('League ID', str(self.league_id))
+        await self.rerun('load league', [self.trigger('Update')])
+        for _ in range(n_actions):
+            await asyncio.sleep(think_time)
+            choice = self.rng.random()
+            if choice < 0.5 or 'Select Game Week' not in self.widgets:
+                self.page = self.rng.choice(LOAD_TEST_PAGES)
+                self.set_widget('Go to', self.page)
+                await self.rerun(f"open {self.page}")
+            elif choice < 0.8 or 'Select Entry Name' not in self.widgets:
+                self.set_widget('Select Game Week', self.rng.choice(self.widgets['Select Game Week'][1].options))
+                await self.rerun(f"game week on {self.page}")
+            else:
+                self.set_widget('Select Entry Name', self.rng.choice(self.widgets['Select Entry Name'][1].options))
+                await self.rerun(f"team on {self.page}")
+        return self
+
+    async def run_safely(self, n_actions, think_time=0.0):
+        try:
+            await self.run(n_actions, think_time)
+        except Exception as e:
+            self.errors.append(f"session for league {self.league_id} stopped: {e!r}")
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))] if values else None
+
+async def sample_peak_memory(pid, peak, stop):
+    while not stop.is_set():
+        peak[0] = max(peak[0], resident_memory(pid))
+        await asyncio.sleep(MEMORY_SAMPLE_SECONDS)
+
+async def drive_sessions(url, pid, n_users, n_leagues, n_actions, think_time, seed):
+    # one session first, on a league of its own, so that the app's imports and the player data are not
+    # counted against the users
+    warm_up = SimulatedSession(url, n_leagues + 1, seed=seed - 1)
+    await warm_up.run_safely(0)
+    rss_before, peak, stop = resident_memory(pid), [0], asyncio.Event()
+    sampler = asyncio.ensure_future(sample_peak_memory(pid, peak, stop))
+
+    sessions = [SimulatedSession(url, 1 + i % n_leagues, seed=seed + i) for i in range(n_users)]
+    start = time.perf_counter()
+    await asyncio.gather(*(session.run_safely(n_actions, think_time) for session in sessions))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+    rss_after = resident_memory(pid)
+    cache_memory = read_cache_memory(url)
+    for session in [warm_up, *sessions]:
+        if session.websocket is not None:
+            session.websocket.close()
+    return sessions, elapsed, rss_before, rss_after, peak[0], cache_memory
+
+def run_load_test(n_users=12, n_leagues=3, n_actions=10, n_entries=30, n_game_weeks=5, latency=0.0, think_time=0.0, seed=0):
+    """
+    Run n_users simulated sessions at once against the app, backed by a stub FPL API with n_leagues leagues.
+    Returns the latency percentiles, cache hit rate and count of each kind of action, the memory of the app per
+    session, and the errors raised in the sessions.
+    """
+    from fpl_stub_server import start_stub_server
+    stub, base_url = start_stub_server(n_entries=n_entries, n_game_weeks=n_game_weeks, latency=latency, seed=seed)
+    work_dir = tempfile.mkdtemp(prefix='fpl_load_test_')
+    env = {**os.environ, 'FPL_BASE_URL': base_url, 'FPL_SNAPSHOT_DIR': os.path.join(work_dir, 'snapshots'),
+           'FPL_ARCHIVE_DIR': os.path.join(work_dir, 'archive'), 'FPL_JOURNAL_DIR': os.path.join(work_dir, 'journal')}
+    process, url, stats_path = start_app_server(env, work_dir)
+    try:
+        sessions, elapsed, rss_before, rss_after, rss_peak, cache_memory = asyncio.run(
+            drive_sessions(url, process.pid, n_users, n_leagues, n_actions, think_time, seed))
+        time.sleep(1.5) # for the server to write its latest cache counts
+        with open(stats_path) as f:
+            cache_counts = json.load(f)
+    finally:
+        process.terminate()
+        process.wait()
+        stub.shutdown()
+
+    timings = collections.defaultdict(list)
+    for session in sessions:
+        for action, seconds in session.timings:
+            timings[action].append(seconds * 1000)
+
+    def hit_rate(action):
+        calls = cache_counts['calls'].get(action, 0)
+        return (calls - cache_counts['misses'].get(action, 0)) / calls if calls else None
+
+    return {
+        'users': n_users, 'leagues': n_leagues, 'elapsed_seconds': round(elapsed, 1),
+        'actions': {action: {'count': len(values), **{f"p{q}_ms": round(percentile(values, q)) for q in LOAD_TEST_PERCENTILES},
+                             'max_ms': round(max(values)), 'cache_hit_rate': hit_rate(action)}
+                    for action, values in sorted(timings.items())},
+        'memory_mb': {'before': round(rss_before / 2**20), 'peak': round(rss_peak / 2**20), 'after': round(rss_after / 2**20),
+                      'growth_per_session': round((rss_after - rss_before) / n_users / 2**20, 1),
+                      'session_state_per_session': round(cache_memory.pop('st_session_state', 0) / (n_users + 1) / 2**20, 2)},
+        'cache_memory_mb': {name: round(value / 2**20, 2) for name, value in sorted(cache_memory.items())},
+        'stub_responses': dict(stub.counters),
+        'errors': [error for session in sessions for error in session.errors],
+    }
+
+def print_report(report):
+    print(f"{report['users']} users on {report['leagues']} leagues in {report['elapsed_seconds']} s")
+    print(f"{'action':40}{'count':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'cache hits':>12}")
+    for action, row in report['actions'].items():
+        hit_rate = '-' if row['cache_hit_rate'] is None else f"{row['cache_hit_rate']:.0%}"
+        print(f"{action:40}{row['count']:7}{row['p50_ms']:9}{row['p90_ms']:9}{row['p99_ms']:9}{row['max_ms']:9}{hit_rate:>12}")
+    memory = report['memory_mb']
+    print(f"App memory: {memory['before']} MB before the users, {memory['peak']} MB at peak, {memory['after']} MB after, "
+          f"{memory['growth_per_session']} MB per session")
+    print(f"Session state per session: {memory['session_state_per_session']} MB")
+    for name, size in report['cache_memory_mb'].items():
+        print(f"  cache {name}: {size} MB")
+    print(f"Stub API responses by status: {report['stub_responses']}")
+    for error in report['errors'][:10]:
+        print(f"Error: {error}")
+
+### END OF LOAD TEST FUNCTIONS ###
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive concurrent simulated users of the app against a stub FPL API.')
+    parser.add_argument('--users', type=int, default=12)
+    parser.add_argument('--leagues', type=int, default=3)
+    parser.add_argument('--actions', type=int, default=10, help='actions per user after loading the league')
+    parser.add_argument('--entries', type=int, default=30, help='teams per league')
+    parser.add_argument('--game-weeks', type=int, default=5, help='game weeks the stub has played')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every stub API response')
+    parser.add_argument('--think-time', type=float, default=0.0, help='seconds each user waits between actions')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = run_load_test(args.users, args.leagues, args.actions, args.entries, args.game_weeks, args.latency,
+                           args.think_time, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    sys.exit(1 if report['errors'] else 0)
@@ -1,9 +1,9 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-from fpl_functions import run_api_extraction, calculate_similarity_score, cleanse_similar_df, cleanse_onlydf
-import numpy as np  # Required for handling conditional operations
 import random
+import datetime
+
+# pandas, numpy, plotly and the fpl modules are imported where they are first used rather than here,
+# so that a new session can show the Home page without loading them. See fpl_startup_benchmark.py.
 
 # Your Streamlit app code here
 
@@ -42,6 +42,7 @@ page = st.sidebar.radio("Go to", ["Overall League",
                                   "Individual Team Overview", 
                                   "Similarity Analyser", 
                                   "Transfer Statistics",
+                                  "SQL Explorer",
                                   "Home"])
 
 # Sidebar filters
@@ -57,12 +58,78 @@ st.sidebar.write('Potato Farm - 2306035')
 # Validate League ID
 valid_league_id = league_id.isdigit()
 
-# Load the data with caching
+CRAWL_CHECK_SECONDS = 300 # how often a session checks whether its league has been crawled again
+
+# The crawl that a league's tables are loaded from, shared by all workers through the snapshot store. It is replaced
+# every 4hrs, which moves every group of tables to the new crawl at once, and the groups of the crawl before the
+# previous one are deleted.
+@st.cache_data(ttl=CRAWL_CHECK_SECONDS)
+def fpl_league_crawl(league_id):
+    from fpl_storage import load_or_extract, get_snapshot_store
+    from fpl_functions import current_game_week, LEAGUE_TABLES
+    key = f'crawl-{league_id}'
+
+    def new_crawl():
+        store = get_snapshot_store()
+        previous = store.get(key) or {}
+        if previous.get('previous_version'):
+            for group in set(LEAGUE_TABLES.values()):
+                store.delete(f"league-{league_id}-{previous['previous_version']}-{group}")
+        return {'version': datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S'),
+                'previous_version': previous.get('version'), 'game_week': current_game_week()}
+
+    return load_or_extract(key, new_crawl)
+
+# Load the data with caching. Each group of tables of a league is cached separately, 
+# so that a page only waits for the tables that it uses. Every group is keyed on the crawl, so the groups stay consistent.
 @st.cache_data(ttl=14400) # every 4hrs clear cache
-def fpl_data_extraction(league_id):
-    LEAGUE_NAME, start_event, hist_Teams_data, Full_Selection_Data, All_Transfers, df_Transfers_IN_OUT = run_api_extraction(game_week=38, 
-                                                                                                            league_id=league_id)
-    return LEAGUE_NAME, start_event, hist_Teams_data, Full_Selection_Data, All_Transfers, df_Transfers_IN_OUT
+def fpl_league_tables(league_id, version, group, _extract):
+    from fpl_storage import load_or_extract
+
+    # Reuse the snapshot from the shared store if another worker has already extracted these tables.
+    # The crawl decides when the tables are refreshed, so the snapshot itself does not expire.
+    return load_or_extract(f'league-{league_id}-{version}-{group}', _extract, max_age_seconds=float('inf'))
+
+def open_league(league_id):
+    """
+    Handle to the tables of a league, from its latest crawl. Nothing is extracted until a page uses a table.
+    """
+    from fpl_functions import LeagueData
+    crawl = fpl_league_crawl(league_id)
+    return LeagueData(league_id, game_week=crawl['game_week'], version=crawl['version'],
+                      load=lambda group, extract: fpl_league_tables(league_id, crawl['version'], group, extract))
+
+PROJECTION_SIMULATIONS = 10000 # number of simulated seasons for the league finish projection
+
+# Cached per league, crawl and game week, and per fetch of the live points in live mode.
+# The league data itself is left out of the cache key, since the crawl version and live fetch time identify it.
+@st.cache_data(ttl=14400)
+def fpl_league_projection(league_id, version, game_week, live_fetched_at, _hist_Teams_data):
+    from fpl_functions import project_league_finish, summarise_league_projection
+    probabilities = project_league_finish(_hist_Teams_data, game_week, n_simulations=PROJECTION_SIMULATIONS)
+    return summarise_league_projection(probabilities, _hist_Teams_data, game_week)
+
+STANDINGS_PAGE_SIZE = 25 # teams per page of the standings table
+
+# Cached per league and crawl, and per fetch of the live points in live mode, so the standings are built once rather than on every rerun
+@st.cache_data(ttl=14400)
+def fpl_league_standings(league_id, version, live_fetched_at, _hist_Teams_data):
+    from fpl_functions import build_standings
+    return build_standings(_hist_Teams_data)
+
+LIVE_POLL_SECONDS = 60 # how often the live points are refreshed in live mode
+
+# Shared by all sessions, so the live endpoint is polled at most once per interval
+@st.cache_data(ttl=LIVE_POLL_SECONDS)
+def fpl_live_points(game_week):
+    from fpl_functions import fetch_live_points
+    return datetime.datetime.now(), fetch_live_points(game_week)
+
+# Shared by all sessions, and rebuilt when a league is archived since it indexes the squads of every archived league
+@st.cache_resource(ttl=14400, max_entries=8)
+def fpl_squad_index(game_week, archive_version):
+    from fpl_squad_index import build_squad_index
+    return build_squad_index(game_week)
 
 def home():
     """
@@ -112,37 +179,82 @@ if st.sidebar.button('Update'):
     if valid_league_id:
         league_id_int = int(league_id)
 
-        # Display a spinner while the API call is being made
+        # Display a spinner while the league standings are fetched. The other tables are loaded by the pages that use them.
+        league = open_league(league_id_int)
         with st.spinner('Loading data. This might take awhile...'):
-            LEAGUE_NAME, start_event, hist_Teams_data, Full_Selection_Data, All_Transfers, df_Transfers_IN_OUT = fpl_data_extraction(league_id_int)
+            LEAGUE_NAME = league.league_name
 
-        # Store the data in session_state to persist it across interactions
-        st.session_state['LEAGUE_NAME'] = LEAGUE_NAME
-        st.session_state['start_event'] = start_event
-        st.session_state['hist_Teams_data'] = hist_Teams_data # use this when computing points and comparing points historically.
-        st.session_state['Full_Selection_Data'] = Full_Selection_Data # use this when analysing an individual team.
-        st.session_state['All_Transfers'] = All_Transfers
-        st.session_state['df_Transfers_IN_OUT'] = df_Transfers_IN_OUT
+        # Store the league in session_state to persist it, and the tables it has loaded, across interactions
+        st.session_state['league_id'] = league_id_int
+        st.session_state['league'] = league
 
     else:
         st.sidebar.error("Please enter a valid number for League ID.")
 
 # Check if data is available in session_state
-if 'Full_Selection_Data' in st.session_state:
-    df_Full_Selection_Data = st.session_state['Full_Selection_Data']
-    df_hist_Teams_data = st.session_state['hist_Teams_data']
-    df_Transfers_IN_OUT = st.session_state['df_Transfers_IN_OUT']
-    df_All_Transfers = st.session_state['All_Transfers']
-    LEAGUE_NAME = st.session_state['LEAGUE_NAME']
-    start_event = st.session_state['start_event']
+if 'league' in st.session_state:
+    import pandas as pd
+    import numpy as np  # Required for handling conditional operations
+    from fpl_functions import calculate_similarity_score, cleanse_similar_df, cleanse_onlydf, apply_live_points, simulate_what_ifs
+    from fpl_functions import build_ownership_index, ownership_counts, find_differentials, find_template_team, TOTAL_GAME_WEEKS
+    from fpl_functions import LARGE_LEAGUE_TEAMS, CHART_TOP_TEAMS, performance_bands, select_chart_teams, game_week_standings
+
+    # Move to the league's latest crawl as a whole, so that the tables of a page always come from the same crawl
+    league = st.session_state['league']
+    if fpl_league_crawl(league.league_id)['version'] != league.version:
+        league = st.session_state['league'] = open_league(league.league_id)
+    LEAGUE_NAME = league.league_name
+    start_event = league.start_event
+
+    live_tables = {} # tables replaced by their live version in live mode
+
+    def league_table(table):
+        """
+        A table of the league, extracted the first time a page uses it.
+        """
+        if table in live_tables:
+            return live_tables[table]
+        with st.spinner('Loading data. This might take awhile...'):
+            return getattr(league, table)
+
+    # use this when computing points and comparing points historically. Every page needs it for the game week filter.
+    df_hist_Teams_data = league_table('hist_teams_data')
 
     # Game Week filter
-    game_weeks = sorted(df_Full_Selection_Data['game_week'].unique().astype(int))
+    game_weeks = sorted(df_hist_Teams_data['event'].dropna().unique().astype(int))
     selected_game_week = st.sidebar.selectbox('Select Game Week', game_weeks, index=len(game_weeks)-1)
 
+    # Live mode - refresh the points of the latest game week without re-running the extraction
+    live_mode = st.sidebar.toggle('Live Game Week', help=f'Refresh the latest game week points every {LIVE_POLL_SECONDS} seconds.')
+    if live_mode:
+        live_game_week = game_weeks[-1]
+        live_fetched_at, live_points = fpl_live_points(live_game_week)
+        if live_points is not None:
+            df_hist_Teams_data, live_selection_data = apply_live_points(df_hist_Teams_data, league_table('full_selection_data'), 
+                                                                        live_game_week, live_points)
+            live_ownership_index = pd.concat([league_table('ownership_index').drop(live_game_week, level='game_week', errors='ignore'),
+                                              build_ownership_index(live_selection_data[live_selection_data['event'] == live_game_week])
+                                              ]).sort_index()
+            live_tables.update({'hist_teams_data': df_hist_Teams_data, 'full_selection_data': live_selection_data, 
+                                'ownership_index': live_ownership_index})
+            st.sidebar.caption(f'Live points for Game Week {live_game_week} as of {live_fetched_at:%H:%M:%S}')
+        else:
+            st.sidebar.caption(f'Live points for Game Week {live_game_week} are not available right now.')
+
+        # Rerun the page once newer live points have been fetched
+        @st.fragment(run_every=LIVE_POLL_SECONDS)
+        def poll_live_points():
+            latest_fetched_at, _ = fpl_live_points(live_game_week)
+            if latest_fetched_at != live_fetched_at:
+                st.rerun()
+
+        with st.sidebar:
+            poll_live_points()
+
     barchart_dragmode = False # pre-set to control if the user can drag and pan the charts
     # Function to create horizontal bar charts using plotly
     def plot_horizontal_bar(data, title, x_label, y_label):
+        import plotly.express as px
         fig = px.bar(
             data_frame=data,
             x=data.values, 
@@ -161,11 +273,31 @@ if 'Full_Selection_Data' in st.session_state:
                           dragmode=barchart_dragmode,)
         return fig
 
+    # Function to chart a large league as percentile bands with a few team lines, using WebGL traces
+    def plot_league_bands(team_lines, bands, y_axis, title, highlight_teams=()):
+        import plotly.graph_objects as go
+        fig = go.Figure()
+        band_style = dict(mode='lines', line=dict(width=0), hoverinfo='skip')
+        for low, high, name, opacity in [(10, 90, '10th-90th percentile', 0.15), (25, 75, '25th-75th percentile', 0.3)]:
+            fig.add_trace(go.Scattergl(x=bands.index, y=bands[high], showlegend=False, **band_style))
+            fig.add_trace(go.Scattergl(x=bands.index, y=bands[low], name=name, fill='tonexty',
+                                       fillcolor=f'rgba(0, 255, 135, {opacity})', **band_style))
+        fig.add_trace(go.Scattergl(x=bands.index, y=bands[50], mode='lines', name='Median',
+                                   line=dict(color='#00ff87', dash='dash')))
+        for team, line in team_lines.groupby('Team', sort=False):
+            fig.add_trace(go.Scattergl(x=line['Game Week'], y=line[y_axis], mode='lines+markers', name=team,
+                                       line=dict(width=4 if team in highlight_teams else 2)))
+        fig.update_layout(title=title, xaxis_title='Game Week', yaxis_title=y_axis)
+        return fig
+
     # First Page - Team Overview
     if page == "Home":
         home() # show homepage
 
     elif page == "Individual Team Overview":
+        import plotly.express as px
+        df_Full_Selection_Data = league_table('full_selection_data') # use this when analysing an individual team.
+        df_Transfers_IN_OUT = league_table('df_transfers_in_out')
 
         # Entry Name filter
         entry_names = sorted(df_Full_Selection_Data['entry_name'].unique())
@@ -427,55 +559,58 @@ if 'Full_Selection_Data' in st.session_state:
         with bar3:
             fig3 = plot_horizontal_bar(most_selected_name, "Most Selected Clubs", "Count", "Club")
             st.plotly_chart(fig3)
+
+        # Add a horizontal dividing line
+        st.markdown("---")
+
+        # What-if analysis of the captaincy and transfer decisions of every team up to the selected game week
+        st.subheader(f'What If? - Points Left on the Table up to Game Week {int(selected_game_week)}')
+        what_ifs = simulate_what_ifs(df_Full_Selection_Data[df_Full_Selection_Data['event'] <= selected_game_week],
+                                     df_Transfers_IN_OUT[df_Transfers_IN_OUT['event'] <= selected_game_week],
+                                     league_table('all_gw_data'), df_hist_Teams_data)
+        
+        league_what_ifs = what_ifs.pivot_table(index='entry_name', columns='decision', values='points_left', 
+                                               aggfunc='sum', fill_value=0)
+        league_what_ifs = league_what_ifs.reindex(columns=['Captain', 'Transfer'], fill_value=0)
+        league_what_ifs['Total'] = league_what_ifs['Captain'] + league_what_ifs['Transfer']
+        league_what_ifs = league_what_ifs.sort_values(by='Total', ascending=False)
+        team_what_ifs = league_what_ifs.reindex([selected_entry_name], fill_value=0).iloc[0]
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Points Left by Captaincy", f"{team_what_ifs['Captain']:.0f}")
+        col2.metric("Points Left by Transfers", f"{team_what_ifs['Transfer']:.0f}")
+        col3.metric("Total Points Left on the Table", f"{team_what_ifs['Total']:.0f}")
+
+        # Decisions of the selected team that cost the most points
+        show_team_what_ifs = what_ifs[what_ifs['entry_name'] == selected_entry_name]
+        show_team_what_ifs = show_team_what_ifs[['game_week', 'decision', 'choice_made', 'better_choice', 'points_left']].head(10)
+        show_team_what_ifs.columns = ['Game Week', 'Decision', 'Choice Made', 'Better Choice', 'Points Left']
+        st.dataframe(show_team_what_ifs, hide_index=True, use_container_width=True)
+
+        with st.expander("View the League's Points Left on the Table"):
+            league_what_ifs = league_what_ifs.reset_index()
+            league_what_ifs.columns = ['Team', 'Captaincy', 'Transfers', 'Total']
+            st.dataframe(league_what_ifs, hide_index=True, use_container_width=True)
         
     elif page == "Overall League":
+        import plotly.express as px
         st.markdown(f'<p class="big-font">League Statistics Overview - {LEAGUE_NAME}</p>', unsafe_allow_html=True)
 
         # sort and filter data for the latest game week
         overall_performance = df_hist_Teams_data[df_hist_Teams_data['event']<=selected_game_week]
             
-        # sort and filter data for the latest game week
-        team_performance = df_hist_Teams_data[df_hist_Teams_data['event']==selected_game_week].sort_values(by=['league_rank'])
-        
-        # Rank change calculation
-        df_hist_Teams_data_sorted = df_hist_Teams_data.sort_values(by=['entry_name', 'event'])
-        df_hist_Teams_data_sorted['previous_rank'] = df_hist_Teams_data_sorted.groupby('entry_name')['league_rank'].shift(1)
-        df_hist_Teams_data_sorted['rank_change'] = df_hist_Teams_data_sorted['league_rank'] - df_hist_Teams_data_sorted['previous_rank']
-
-        # Filter data for the current selected game week
-        team_performance = df_hist_Teams_data_sorted[df_hist_Teams_data_sorted['event'] == selected_game_week].sort_values(by=['league_rank'])
-
-        # Create a column for arrow symbols based on rank change
-        team_performance['Rank Change'] = np.where(team_performance['rank_change'] < 0, '▲',
-                                                np.where(team_performance['rank_change'] > 0, '▼', '–'))
-
-        # Add color for the arrows (green for up, red for down, grey for no change)
-        team_performance['Rank Change'] = np.where(team_performance['Rank Change'] == '▲', 
-                                                '<span style="color:green">▲</span>', 
-                                                np.where(team_performance['Rank Change'] == '▼', 
-                                                            '<span style="color:red">▼</span>', 
-                                                            '<span style="color:grey">–</span>'))
-
-        # Select columns to display (including Rank Change)
-        team_performance = team_performance[['entry_name','points','total_points', 'bank','value','event_transfers', 
-                                            'event_transfers_cost','points_on_bench', 'league_rank', 'Rank Change']]
-        
-        team_performance['bank'], team_performance['value'] = team_performance['bank']/10, team_performance['value']/10
-
-        # Rename columns for readability
-        team_performance.columns = ['Team','GW Points', 'Total Points', 'Bank', 'Team Value', 'No. of GW Transfers', 
-                                    'Cost of Transfers', 'Points on Bench', 'Rank', 'Change']
-        
-        # reorder columns
-        team_performance = team_performance[['Rank', 'Change', 'Team','GW Points', 'Total Points', 
-                                            'Bank', 'Team Value', 'No. of GW Transfers',
-                                            'Cost of Transfers', 'Points on Bench'
-                                            ]]
+        # Standings of every game week, built once per league
+        standings_fetched_at = live_fetched_at if 'hist_teams_data' in live_tables else None
+        standings = fpl_league_standings(st.session_state['league_id'], league.version, standings_fetched_at, df_hist_Teams_data)
+        team_performance = game_week_standings(standings, selected_game_week)
 
         # Display overall league statistics (customize this as per your needs)
         total_transfers = overall_performance['event_transfers'].sum()
-        team_of_the_week = team_performance.sort_values(by='GW Points', ascending=False)['Team'].iloc[0]
-        highest_valued_team = team_performance.sort_values(by='Team Value', ascending=False)['Team'].iloc[0]
+        if team_performance.empty:
+            team_of_the_week = highest_valued_team = 'N.A.'
+        else:
+            team_of_the_week = team_performance.loc[team_performance['points'].idxmax(), 'entry_name']
+            highest_valued_team = team_performance.loc[team_performance['value'].idxmax(), 'entry_name']
 
         # Display summary metrics for the entire league
         st.subheader(f"Overall League Performance - Game Week {selected_game_week}")
@@ -487,11 +622,56 @@ if 'Full_Selection_Data' in st.session_state:
         # Show overall performance metrics for all teams
         st.subheader("Performance by Team")
 
-        # Convert the DataFrame to HTML
-        team_performance_html = team_performance.to_html(escape=False, index=False)
+        # Search and sort the standings on the server and send one page of them, however large the league
+        standings_columns = {'Rank': 'league_rank', 'GW Points': 'points', 'Total Points': 'total_points', 'Team': 'entry_name',
+                             'Bank': 'bank', 'Team Value': 'value', 'No. of GW Transfers': 'event_transfers',
+                             'Cost of Transfers': 'event_transfers_cost', 'Points on Bench': 'points_on_bench'}
+        col1, col2, col3 = st.columns([2, 2, 1])
+        search = col1.text_input('Search teams', placeholder='Team name')
+        sort_by = col2.selectbox('Sort by', list(standings_columns))
+        sort_order = col3.selectbox('Order', ['Ascending', 'Descending'])
+        matching_teams = game_week_standings(standings, selected_game_week, search, standings_columns[sort_by], 
+                                             ascending=sort_order == 'Ascending')
+
+        n_pages = max(1, -(-len(matching_teams) // STANDINGS_PAGE_SIZE))
+        standings_page = 1
+        if n_pages > 1:
+            standings_page = st.number_input(f'Page (of {n_pages})', min_value=1, max_value=n_pages, value=1)
+        first_row = (standings_page - 1) * STANDINGS_PAGE_SIZE
+        standings_rows = matching_teams.iloc[first_row:first_row + STANDINGS_PAGE_SIZE].copy()
 
-        # Display the table with rank changes using st.markdown
-        st.markdown(team_performance_html, unsafe_allow_html=True)
+        # Create a column for arrow symbols based on rank change
+        standings_rows['Rank Change'] = np.where(standings_rows['rank_change'] < 0, '▲',
+                                                 np.where(standings_rows['rank_change'] > 0, '▼', '–'))
+
+        # Add color for the arrows (green for up, red for down, grey for no change)
+        standings_rows['Rank Change'] = np.where(standings_rows['Rank Change'] == '▲', 
+                                                 '<span style="color:green">▲</span>', 
+                                                 np.where(standings_rows['Rank Change'] == '▼', 
+                                                          '<span style="color:red">▼</span>', 
+                                                          '<span style="color:grey">–</span>'))
+
+        # Select columns to display (including Rank Change)
+        standings_rows = standings_rows[['entry_name','points','total_points', 'bank','value','event_transfers', 
+                                         'event_transfers_cost','points_on_bench', 'league_rank', 'Rank Change']]
+        
+        standings_rows['bank'], standings_rows['value'] = standings_rows['bank']/10, standings_rows['value']/10
+
+        # Rename columns for readability
+        standings_rows.columns = ['Team','GW Points', 'Total Points', 'Bank', 'Team Value', 'No. of GW Transfers', 
+                                  'Cost of Transfers', 'Points on Bench', 'Rank', 'Change']
+        
+        # reorder columns
+        standings_rows = standings_rows[['Rank', 'Change', 'Team','GW Points', 'Total Points', 
+                                         'Bank', 'Team Value', 'No. of GW Transfers',
+                                         'Cost of Transfers', 'Points on Bench'
+                                         ]]
+
+        # Display the page of the table with rank changes using st.markdown
+        st.markdown(standings_rows.to_html(escape=False, index=False), unsafe_allow_html=True)
+        if n_pages > 1 or search:
+            st.caption(f"Showing {first_row + 1 if len(standings_rows) else 0}-{first_row + len(standings_rows)} "
+                       f"of {len(matching_teams)} teams")
 
         # Add a horizontal dividing line
         st.markdown("---")
@@ -513,14 +693,28 @@ if 'Full_Selection_Data' in st.session_state:
         y_axis = st.selectbox('Y-axis', ['GW Points', 'Total Points', 'Rank', 'Team Value', 'Bank', 'No. of GW Transfers'], index=0)
 
         chart_title = f"{y_axis} by Teams across Game Weeks"
-        fig_2 = px.line(overall_performance, 
-                        x='Game Week', 
-                        y=y_axis,
-                        color='Team', 
-                        title=chart_title)
+        n_teams = overall_performance['Team'].nunique()
+        large_league = n_teams > LARGE_LEAGUE_TEAMS
+        if large_league:
+            # A line per team is too slow to draw for a large league, so show the spread of the league as percentile bands
+            # and draw only the top teams and the teams picked, as WebGL traces
+            highlight_teams = st.multiselect('Highlight teams', sorted(overall_performance['Team'].unique()),
+                                             max_selections=CHART_TOP_TEAMS)
+            chart_teams = select_chart_teams(overall_performance, highlight_teams)
+            bands = performance_bands(overall_performance, y_axis)
+            fig_2 = plot_league_bands(overall_performance[overall_performance['Team'].isin(chart_teams)],
+                                      bands, y_axis, chart_title, highlight_teams)
+            st.caption(f"{n_teams} teams in the league: the shaded bands show the 10th to 90th and 25th to 75th percentiles "
+                       f"across all teams, with the top {CHART_TOP_TEAMS} teams and any highlighted teams drawn as lines.")
+        else:
+            fig_2 = px.line(overall_performance, 
+                            x='Game Week', 
+                            y=y_axis,
+                            color='Team', 
+                            title=chart_title)
 
-        # Add circle markers to the line chart
-        fig_2.update_traces(mode='lines+markers', marker=dict(symbol='circle'))
+            # Add circle markers to the line chart
+            fig_2.update_traces(mode='lines+markers', marker=dict(symbol='circle'))
 
         # Update y-axis layout conditionally based on the selected y-axis value
         yaxis_config = {}
@@ -528,8 +722,8 @@ if 'Full_Selection_Data' in st.session_state:
         # Reverse the y-axis if 'Rank' is selected
         if y_axis == 'Rank':
              yaxis_config = {
-                'tickmode': 'linear',
-                'dtick': 1,  # Show ticks at every integer
+                'tickmode': 'auto' if large_league else 'linear',
+                'dtick': None if large_league else 1,  # Show ticks at every integer
                 'autorange': 'reversed'  # Reverse the y-axis for 'Rank'
             }
 
@@ -545,93 +739,118 @@ if 'Full_Selection_Data' in st.session_state:
 
         st.plotly_chart(fig_2)
 
-        # Filter the data for the selected game week and selected entry name
-        df_full_select_for_gw = df_Full_Selection_Data[(df_Full_Selection_Data['game_week'] == selected_game_week)]
-                                                        
-        df_full_select_upto_gw = df_Full_Selection_Data[(df_Full_Selection_Data['game_week'] <= selected_game_week)]                      
-        
-        df_hist_teams_for_gw = df_hist_Teams_data[(df_hist_Teams_data['event'] == selected_game_week)] 
-                                                        
-        df_hist_teams_upto_gw = df_hist_Teams_data[(df_hist_Teams_data['event'] <= selected_game_week)]
+        # Monte Carlo projection of where each team finishes the season
+        st.subheader(f'League Finish Projection after Game Week {selected_game_week}')
+        if st.checkbox('Simulate the rest of the season'):
+            with st.spinner('Simulating the remaining game weeks...'):
+                projection_fetched_at = live_fetched_at if 'hist_teams_data' in live_tables else None
+                projection = fpl_league_projection(st.session_state['league_id'], league.version, selected_game_week,
+                                                   projection_fetched_at, df_hist_Teams_data)
+            
+            projection = projection[['entry_name', 'league_rank', 'expected_rank', 'most_likely_rank', 
+                                     'win_probability', 'top_3_probability']]
+            projection['expected_rank'] = projection['expected_rank'].round(1)
+            projection['win_probability'] = (projection['win_probability'] * 100).round(1)
+            projection['top_3_probability'] = (projection['top_3_probability'] * 100).round(1)
+            projection.columns = ['Team', 'Current Rank', 'Expected Final Rank', 'Most Likely Final Rank', 'Win %', 'Top 3 %']
+            st.dataframe(projection, hide_index=True, use_container_width=True)
+            st.caption(f"Based on {PROJECTION_SIMULATIONS:,} simulations of the remaining {max(TOTAL_GAME_WEEKS - selected_game_week, 0)} "
+                       "game weeks, drawing each team's weekly points from its own results so far.")
 
-        # Calculate statistics up to the selected game week
-        first_eleven_cumul = df_full_select_upto_gw[df_full_select_upto_gw['position']<=11]
-        # bench_players_cumul = df_full_select_upto_gw[df_full_select_upto_gw['position']>11]
+        # The ownership statistics need the picks of every team, the slowest part of the extraction, so they are opt-in
+        # until the picks have been loaded
+        st.subheader('Player Ownership')
+        if st.checkbox('Show player ownership across the league', value=league.is_loaded('ownership_index')):
+            df_Ownership_Index = league_table('ownership_index') # use this for player ownership across the league.
 
-        first_eleven_cumul = first_eleven_cumul[['position', 'web_name', 'name', 
-                                                'plural_name_short', 'total_points', 'points_earned', 'is_captain']]
-        first_eleven_cumul.columns = ['No.', 'Name', 'Club', 'Position', 'GW Points', 'Points Earned', 'Captain']
+            # show some barcharts metrics across all the teams in the league, from the ownership index
+            # Most captained players
+            most_captained = ownership_counts(df_Ownership_Index, start_event, selected_game_week, column='captained')
 
-        # show some barcharts metrics across all the teams in the league
-        # Most captained players
-        most_captained = first_eleven_cumul[first_eleven_cumul['Captain']]['Name'].value_counts().nlargest(5)
+            # Most selected player (by web_name)
+            most_selected_web = ownership_counts(df_Ownership_Index, start_event, selected_game_week)
 
-        # Most selected player (by web_name)
-        most_selected_web = first_eleven_cumul['Name'].value_counts().nlargest(5)
+            # Most selected Club
+            most_selected_name = ownership_counts(df_Ownership_Index, start_event, selected_game_week, by='name')
 
-        # Most selected Club
-        most_selected_name = first_eleven_cumul['Club'].value_counts().nlargest(5)
+            # Subheader for more statistics
+            st.subheader(f'League Statistics up to GW{selected_game_week}')
 
-        # Subheader for more statistics
-        st.subheader(f'League Statistics up to GW{selected_game_week}')
+            bar1, bar2, bar3 = st.columns(3)
 
-        bar1, bar2, bar3 = st.columns(3)
+            # Plot Most Captained Players
+            with bar1:
+                fig1 = plot_horizontal_bar(most_captained, "Most Captained Players", "Count", "Player")
+                st.plotly_chart(fig1)
 
-        # Plot Most Captained Players
-        with bar1:
-            fig1 = plot_horizontal_bar(most_captained, "Most Captained Players", "Count", "Player")
-            st.plotly_chart(fig1)
+            # Plot Most Selected Players by Web Name
+            with bar2:
+                fig2 = plot_horizontal_bar(most_selected_web, "Most Selected Players", "Count", "Player")
+                st.plotly_chart(fig2)
 
-        # Plot Most Selected Players by Web Name
-        with bar2:
-            fig2 = plot_horizontal_bar(most_selected_web, "Most Selected Players", "Count", "Player")
-            st.plotly_chart(fig2)
-
-        # Plot Most Selected Players by Name
-        with bar3:
-            fig3 = plot_horizontal_bar(most_selected_name, "Most Selected Clubs", "Count", "Club")
-            st.plotly_chart(fig3)
+            # Plot Most Selected Players by Name
+            with bar3:
+                fig3 = plot_horizontal_bar(most_selected_name, "Most Selected Clubs", "Count", "Club")
+                st.plotly_chart(fig3)
 
 
-        # For the Game week 
-        # Calculate statistics up to the selected game week
-        first_eleven = df_full_select_for_gw[df_full_select_for_gw['position']<=11]
+            # For the Game week 
+            # Most captained players
+            most_captained = ownership_counts(df_Ownership_Index, selected_game_week, selected_game_week, column='captained')
 
-        first_eleven = first_eleven[['position', 'web_name', 'name', 
-                                                'plural_name_short', 'total_points', 'points_earned', 'is_captain']]
-        first_eleven.columns = ['No.', 'Name', 'Club', 'Position', 'GW Points', 'Points Earned', 'Captain']
+            # Most selected player (by web_name)
+            most_selected_web = ownership_counts(df_Ownership_Index, selected_game_week, selected_game_week)
 
-        # show some barcharts metrics across all the teams in the league
-        # Most captained players
-        most_captained = first_eleven[first_eleven['Captain']]['Name'].value_counts().nlargest(5)
+            # Most selected Club
+            most_selected_name = ownership_counts(df_Ownership_Index, selected_game_week, selected_game_week, by='name')
 
-        # Most selected player (by web_name)
-        most_selected_web = first_eleven['Name'].value_counts().nlargest(5)
+            # Subheader for more statistics
+            st.subheader(f'League Statistics for the GW{selected_game_week}')
 
-        # Most selected Club
-        most_selected_name = first_eleven['Club'].value_counts().nlargest(5)
+            bar1, bar2, bar3 = st.columns(3)
 
-        # Subheader for more statistics
-        st.subheader(f'League Statistics for the GW{selected_game_week}')
+            # Plot Most Captained Players
+            with bar1:
+                fig1 = plot_horizontal_bar(most_captained, "Most Captained Players", "Count", "Player")
+                st.plotly_chart(fig1)
 
-        bar1, bar2, bar3 = st.columns(3)
+            # Plot Most Selected Players by Web Name
+            with bar2:
+                fig2 = plot_horizontal_bar(most_selected_web, "Most Selected Players", "Count", "Player")
+                st.plotly_chart(fig2)
 
-        # Plot Most Captained Players
-        with bar1:
-            fig1 = plot_horizontal_bar(most_captained, "Most Captained Players", "Count", "Player")
-            st.plotly_chart(fig1)
+            # Plot Most Selected Players by Name
+            with bar3:
+                fig3 = plot_horizontal_bar(most_selected_name, "Most Selected Clubs", "Count", "Club")
+                st.plotly_chart(fig3)
 
-        # Plot Most Selected Players by Web Name
-        with bar2:
-            fig2 = plot_horizontal_bar(most_selected_web, "Most Selected Players", "Count", "Player")
-            st.plotly_chart(fig2)
+            # Add a horizontal dividing line
+            st.markdown("---")
 
-        # Plot Most Selected Players by Name
-        with bar3:
-            fig3 = plot_horizontal_bar(most_selected_name, "Most Selected Clubs", "Count", "Club")
-            st.plotly_chart(fig3)
+            col_a, col_b = st.columns(2)
+
+            # Template team - the most selected players in each position
+            with col_a:
+                st.subheader(f'Template Team for GW{selected_game_week}')
+                template_team = find_template_team(df_Ownership_Index, selected_game_week)
+                template_team = template_team[['web_name', 'name', 'plural_name_short', 'selected', 'ownership', 'effective_ownership', 'total_points']]
+                template_team['ownership'] = (template_team['ownership'] * 100).round(1)
+                template_team['effective_ownership'] = (template_team['effective_ownership'] * 100).round(1)
+                template_team.columns = ['Name', 'Club', 'Position', 'Selected By', 'Ownership %', 'Effective Ownership %', 'GW Points']
+                st.dataframe(template_team, hide_index=True, use_container_width=True)
+
+            # Differentials - high scoring players that few teams in the league picked
+            with col_b:
+                st.subheader(f'Differentials for GW{selected_game_week}')
+                max_ownership = st.slider('Maximum Ownership %', 1, 50, 20)
+                differentials = find_differentials(df_Ownership_Index, selected_game_week, max_ownership=max_ownership / 100)
+                differentials = differentials[['web_name', 'name', 'plural_name_short', 'selected', 'ownership', 'total_points']]
+                differentials['ownership'] = (differentials['ownership'] * 100).round(1)
+                differentials.columns = ['Name', 'Club', 'Position', 'Selected By', 'Ownership %', 'GW Points']
+                st.dataframe(differentials, hide_index=True, use_container_width=True)
 
     elif page == "Similarity Analyser":
+        df_Full_Selection_Data = league_table('full_selection_data')
 
         # Set up the Streamlit app
         st.markdown(f'<p class="big-font">Similarity Analyser - Game Week {selected_game_week}</p>', unsafe_allow_html=True)
@@ -708,10 +927,60 @@ if 'Full_Selection_Data' in st.session_state:
 
             # Collapsible section
             with st.expander("View the League's Similarity Matrix"):
-                st.write("This content is hidden by default and can be expanded or collapsed.")
-                st.write("Add more content here as needed, like text, charts, or tables.")
+                from fpl_squads import MAX_SIMILARITY_TEAMS
+
+                # similarity of every pair of teams, computed from the league's squad arrays rather than team by team,
+                # and only on request since the matrix grows with the square of the league size
+                squads = league_table('squads')
+                if len(squads.entries) > MAX_SIMILARITY_TEAMS:
+                    st.info(f"The matrix is only shown for leagues of up to {MAX_SIMILARITY_TEAMS} teams. "
+                            "Compare two teams above instead.")
+                elif st.checkbox('Show the similarity matrix'):
+                    import plotly.express as px
+                    entry_names = league.dim_teams.set_index('entry')['entry_name'].reindex(squads.entries).tolist()
+                    fig = px.imshow(squads.similarity(selected_game_week), x=entry_names, y=entry_names,
+                                    color_continuous_scale='Greens', zmin=0, zmax=100, labels={'color': 'Similarity %'},
+                                    title=f'Similarity Scores for Game Week {selected_game_week}')
+                    fig.update_layout(dragmode=False)
+                    st.plotly_chart(fig)
+
+        # Nearest squads in every archived league, found through the squad index rather than by scoring every squad
+        with st.expander(f"Find the Squads most similar to {team_1} across All Leagues"):
+            # searched only on request, since it loads the index of every archived league
+            if st.button(f'Search every archived league for {team_1}'):
+                from fpl_archive import read_archive, read_league_info
+                from fpl_squad_index import archive_version
+
+                squads = league_table('squads')
+                entry = league.dim_teams.set_index('entry_name')['entry'][team_1]
+                row = np.flatnonzero(squads.entries == entry)
+                if selected_game_week not in squads.game_weeks or len(row) == 0:
+                    st.info(f"{team_1} has no picks for Game Week {selected_game_week}.")
+                else:
+                    with st.spinner('Searching the squads of every league...'):
+                        index = fpl_squad_index(selected_game_week, archive_version())
+                    g = squads.game_week_position(selected_game_week)
+                    nearest = index.query(squads.elements[row[0], g], squads.flags[row[0], g], top_n=10,
+                                          exclude=(st.session_state['league_id'], entry))
+                    st.caption(f"Searched {index.size} squads from the archived leagues of season {index.season}.")
+
+                    if nearest.empty:
+                        st.info(f"No squad in the archived leagues is close to {team_1}'s.")
+                    else:
+                        league_ids = nearest['league_id'].unique()
+                        teams = read_archive('dim_teams', league_ids=league_ids, seasons=[index.season],
+                                             columns=['entry', 'entry_name', 'player_name'])
+                        nearest = nearest.merge(teams, on=['league_id', 'entry'], how='left')
+                        league_names = {league_id: read_league_info(league_id, index.season).get('league_name') 
+                                        for league_id in league_ids}
+                        nearest['League'] = nearest['league_id'].map(league_names)
+                        nearest = nearest[['entry_name', 'player_name', 'League', 'similarity']]
+                        nearest.columns = ['Team', 'Manager', 'League', 'Similarity Score (%)']
+                        st.dataframe(nearest, hide_index=True)
 
     elif page == "Transfer Statistics":
+        import plotly.express as px
+        df_All_Transfers = league_table('all_transfers')
 
         st.markdown(f'<p class="big-font">Transfer Statistics - Game Week {selected_game_week}</p>', unsafe_allow_html=True)
 
@@ -775,5 +1044,27 @@ if 'Full_Selection_Data' in st.session_state:
 
         # Display the Plotly figure in Streamlit
         st.plotly_chart(fig)                            
+
+    elif page == "SQL Explorer":
+        from fpl_sql import run_user_query, list_archive_tables, EXAMPLE_QUERIES
+
+        st.markdown(f'<p class="big-font">SQL Explorer - {LEAGUE_NAME}</p>', unsafe_allow_html=True)
+        st.markdown('Query the archived league tables with SQL. Filter on the `league`, `season` and `gw` columns '
+                    'so that only the matching snapshots are read.')
+
+        # Start from one of the example queries for the loaded league
+        example = st.selectbox('Example Queries', list(EXAMPLE_QUERIES.keys()))
+        query = st.text_area('Query', EXAMPLE_QUERIES[example].format(league_id=st.session_state['league_id']).strip(), height=200)
+
+        if st.button('Run Query'):
+            try:
+                query_result = run_user_query(query)
+                st.dataframe(query_result, hide_index=True, use_container_width=True)
+                st.caption(f'{len(query_result)} rows')
+            except Exception as e:
+                st.error(f'Query failed: {e}')
+
+        with st.expander("View the Available Tables and Columns"):
+            st.dataframe(list_archive_tables(), hide_index=True, use_container_width=True)
 else:
     home()
\ No newline at end of file
@@ -0,0 +1,91 @@
+import os
+import glob
+import duckdb
+from fpl_archive import ARCHIVE_DIR, ARCHIVE_TABLES
+
+### START OF SQL FUNCTIONS ###
+
+# Example queries for the SQL Explorer page. {league_id} is filled in with the loaded league.
+EXAMPLE_QUERIES = {
+    'Standings for the latest game week': """
+SELECT league_rank, entry_name, player_name, gw_points, total_points
+FROM hist_teams_data
+WHERE league = {league_id}
+  AND gw = (SELECT max(gw) FROM hist_teams_data WHERE league = {league_id})
+ORDER BY league_rank
+""",
+    'Most captained players': """
+SELECT web_name, count(*) AS times_captained, sum(points_earned) AS captain_points
+FROM full_selection_data
+WHERE league = {league_id} AND is_captain
+GROUP BY web_name
+ORDER BY times_captained DESC
+LIMIT 20
+""",
+    'Most bought players': """
+SELECT web_name, name AS club, count(*) AS times_bought
+FROM df_transfers_in_out
+WHERE league = {league_id} AND Direction = 'In'
+GROUP BY web_name, name
+ORDER BY times_bought DESC
+LIMIT 20
+""",
+    'Points on the bench by team': """
+SELECT entry_name, sum(points_on_bench) AS points_on_bench
+FROM hist_teams_data
+WHERE league = {league_id}
+GROUP BY entry_name
+ORDER BY points_on_bench DESC
+""",
+}
+
+def connect_archive(archive_dir=ARCHIVE_DIR):
+    """
+    Open an in-process DuckDB connection with a view over every table in the archive.
+    Each view gets league, season and gw columns from the partition path, so filters on them only read the matching files,
+    and other filters are pushed down into the parquet scans.
+    """
+    archive_dir = os.path.abspath(archive_dir)
+    con = duckdb.connect()
+    for table, game_week_column in ARCHIVE_TABLES.items():
+        partitions = ['league=*', 'season=*'] + (['gw=*'] if game_week_column else [])
+        pattern = os.path.join(archive_dir, *partitions, f"{table}.parquet")
+        if not glob.glob(pattern):
+            continue
+        hive_types = "{'league': 'BIGINT', 'season': 'VARCHAR'" + (", 'gw': 'INTEGER'" if game_week_column else "") + "}"
+        pattern = pattern.replace("'", "''")
+        con.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = true, "
+                    f"hive_types = {hive_types}, union_by_name = true)")
+    return con
+
+def query_archive(sql, params=None, archive_dir=ARCHIVE_DIR):
+    """
+    Run a query over the archive and return the result as a DataFrame.
+    """
+    with connect_archive(archive_dir) as con:
+        return con.execute(sql, params).df()
+
+def run_user_query(sql, archive_dir=ARCHIVE_DIR, max_rows=10000):
+    """
+    Run a query typed in by a user. Only a single SELECT statement is allowed, and the connection
+    is locked down so that it can only read from the archive directory. At most max_rows rows are returned.
+    """
+    with connect_archive(archive_dir) as con:
+        con.execute(f"SET allowed_directories = ['{os.path.abspath(archive_dir)}']")
+        con.execute("SET enable_external_access = false")
+        con.execute("SET lock_configuration = true")
+
+        statements = con.extract_statements(sql)
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            raise ValueError("Only a single SELECT query can be run.")
+        return con.sql(sql).limit(max_rows).df()
+
+def list_archive_tables(archive_dir=ARCHIVE_DIR):
+    """
+    Columns of every table registered over the archive, for reference when writing queries.
+    """
+    with connect_archive(archive_dir) as con:
+        return con.execute("SELECT table_name, column_name, data_type FROM information_schema.columns "
+                           "ORDER BY table_name, ordinal_position").df()
+
+### END OF SQL FUNCTIONS ###
@@ -0,0 +1,151 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+from fpl_archive import ARCHIVE_DIR, partition_dir, list_archived_seasons
+from fpl_squads import SQUAD_SIZE, STARTING_SIZE, CAPTAIN_BIT, VICE_CAPTAIN_BIT, load_squad_tensor, score_squads, squads_dir
+
+### START OF SQUAD INDEX FUNCTIONS ###
+
+# MinHash signatures of the squads, split into bands for locality sensitive hashing. Two squads become candidates
+# when all the hashes of any one band agree, which is likely above a weighted Jaccard similarity of about 0.5
+N_HASHES = 64
+N_BANDS = 16
+MAX_CANDIDATES = 5000 # candidates scored exactly per query, those sharing the most bands first
+SIGNATURE_CHUNK = 2048 # squads hashed at a time, to bound the memory of the hashing
+
+MERSENNE_PRIME = np.uint64(2**31 - 1)
+TOKEN_OFFSET = 2**15 # above any player id, so that the tokens of each kind of pick do not collide
+
+def squad_tokens(elements, flags):
+    """
+    The set of tokens of each squad (squads x positions arrays) that MinHash compares: a token per player, another
+    per starting player, two more for the captain and one for the vice captain, so that squads sharing the starters
+    and the captain weigh more, as they do in the similarity score. Missing tokens are -1.
+    """
+    elements = elements.astype(np.int64)
+    picked = elements > 0
+    starting = np.where(picked[:, :STARTING_SIZE], elements[:, :STARTING_SIZE] + TOKEN_OFFSET, -1)
+    captain = np.where(picked & ((flags & CAPTAIN_BIT) > 0), elements, 0).max(axis=1, keepdims=True)
+    vice_captain = np.where(picked & ((flags & VICE_CAPTAIN_BIT) > 0), elements, 0).max(axis=1, keepdims=True)
+    extra = np.concatenate([captain + 2 * TOKEN_OFFSET, captain + 3 * TOKEN_OFFSET, vice_captain + 4 * TOKEN_OFFSET], axis=1)
+    extra[np.concatenate([captain, captain, vice_captain], axis=1) == 0] = -1
+    return np.concatenate([np.where(picked, elements, -1), starting, extra], axis=1)
+
+def minhash_signatures(tokens, seed=0, n_hashes=N_HASHES):
+    """
+    MinHash signature of each set of tokens: for each of n_hashes random hash functions (a * x + b) mod p,
+    the smallest hash of the set. Two signatures agree on a hash with probability the Jaccard similarity of the sets.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(MERSENNE_PRIME), n_hashes, dtype=np.uint64)
+    b = rng.integers(0, int(MERSENNE_PRIME), n_hashes, dtype=np.uint64)
+    signatures = np.empty((len(tokens), n_hashes), dtype=np.uint32)
+    for start in range(0, len(tokens), SIGNATURE_CHUNK):
+        chunk = tokens[start:start + SIGNATURE_CHUNK]
+        hashes = (chunk.astype(np.uint64)[:, :, None] * a + b) % MERSENNE_PRIME
+        hashes[chunk < 0] = MERSENNE_PRIME # missing tokens never win the minimum
+        signatures[start:start + SIGNATURE_CHUNK] = hashes.min(axis=1)
+    return signatures
+
+def band_keys(signatures, n_bands=N_BANDS):
+    """
+    One 64 bit key per band of each signature, mixing the hashes of the band.
+    """
+    bands = signatures.reshape(len(signatures), n_bands, -1).astype(np.uint64)
+    keys = np.zeros((len(signatures), n_bands), dtype=np.uint64)
+    for row in range(bands.shape[2]):
+        keys = keys * np.uint64(0x9E3779B97F4A7C15) + bands[:, :, row] # wraps around, as intended
+    return keys
+
+class SquadIndex:
+    """
+    Index of the squads of many leagues in one game week, for finding the squads most similar to a given squad.
+    Every band of the signatures is kept sorted by key, so that a query finds its candidates with a binary search
+    per band, and only the candidates are scored exactly. Squads are added per league, then build() sorts the bands.
+    """
+    def __init__(self, game_week, season=None, seed=0):
+        self.game_week = game_week
+        self.season = season
+        self.seed = seed
+        self.parts = []
+        self.size = 0
+
+    def add(self, league_id, squads):
+        """
+        Add the squads of a league's SquadTensor in the index's game week. Teams without picks are left out.
+        """
+        if self.game_week not in squads.game_weeks:
+            return
+        g = squads.game_week_position(self.game_week)
+        elements, flags = np.asarray(squads.elements[:, g, :]), np.asarray(squads.flags[:, g, :])
+        picked = elements[:, 0] > 0
+        self.parts.append((np.full(picked.sum(), league_id, dtype=np.int64), np.asarray(squads.entries)[picked],
+                           elements[picked], flags[picked]))
+
+    def build(self):
+        if self.parts:
+            league_ids, entries, elements, flags = (np.concatenate(arrays) for arrays in zip(*self.parts))
+        else:
+            league_ids, entries = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+            elements, flags = np.zeros((0, SQUAD_SIZE), dtype=np.int16), np.zeros((0, SQUAD_SIZE), dtype=np.uint8)
+        self.parts = []
+        self.league_ids, self.entries, self.elements, self.flags = league_ids, entries, elements, flags
+        self.size = len(entries)
+        keys = band_keys(minhash_signatures(squad_tokens(elements, flags), self.seed))
+        self.order = np.argsort(keys, axis=0, kind='stable')
+        self.sorted_keys = np.take_along_axis(keys, self.order, axis=0)
+        return self
+
+    def candidates(self, squad_elements, squad_flags, max_candidates=MAX_CANDIDATES):
+        """
+        Positions of the squads that share at least one band with the squad, those sharing the most bands first.
+        """
+        keys = band_keys(minhash_signatures(squad_tokens(squad_elements[None, :], squad_flags[None, :]), self.seed))[0]
+        matches = []
+        for band, key in enumerate(keys):
+            first = np.searchsorted(self.sorted_keys[:, band], key, side='left')
+            last = np.searchsorted(self.sorted_keys[:, band], key, side='right')
+            matches.append(self.order[first:last, band])
+        positions, shared_bands = np.unique(np.concatenate(matches), return_counts=True)
+        return positions[np.argsort(-shared_bands, kind='stable')][:max_candidates]
+
+    def query(self, squad_elements, squad_flags, top_n=10, exclude=None):
+        """
+        The top_n squads most similar to a squad (its elements and flags in squad position order), with their exact
+        similarity scores, as a DataFrame of league_id, entry and similarity. exclude is a (league_id, entry) to skip,
+        usually the squad's own team.
+        """
+        squad_elements, squad_flags = np.asarray(squad_elements), np.asarray(squad_flags)
+        positions = self.candidates(squad_elements, squad_flags)
+        if exclude is not None:
+            positions = positions[(self.league_ids[positions] != exclude[0]) | (self.entries[positions] != exclude[1])]
+        scores = score_squads(self.elements[positions], self.flags[positions], squad_elements, squad_flags)
+        best = np.argsort(-scores, kind='stable')[:top_n]
+        return pd.DataFrame({'league_id': self.league_ids[positions[best]], 'entry': self.entries[positions[best]],
+                             'similarity': scores[best]})
+
+def latest_archived_season(archive_dir=ARCHIVE_DIR):
+    seasons = [season for _, season in list_archived_seasons(archive_dir=archive_dir)]
+    return max(seasons) if seasons else None
+
+def archive_version(archive_dir=ARCHIVE_DIR):
+    """
+    Latest time any league was archived, so that an index built from the archive can tell when it is out of date.
+    """
+    paths = glob.glob(os.path.join(partition_dir(archive_dir, '*', '*'), 'league.json'))
+    return max((os.path.getmtime(path) for path in paths), default=None)
+
+def build_squad_index(game_week, season=None, archive_dir=ARCHIVE_DIR):
+    """
+    Index the squads of every archived league in a game week of a season, by default the latest archived season.
+    """
+    season = season or latest_archived_season(archive_dir)
+    index = SquadIndex(game_week, season)
+    for league_id, league_season in list_archived_seasons(archive_dir=archive_dir):
+        directory = squads_dir(archive_dir, league_id, league_season)
+        if league_season == season and os.path.isdir(directory):
+            index.add(league_id, load_squad_tensor(directory))
+    return index.build()
+
+### END OF SQUAD INDEX FUNCTIONS ###
@@ -0,0 +1,190 @@
+import os
+import numpy as np
+import pandas as pd
+from fpl_archive import partition_dir, write_atomic
+
+### START OF SQUAD TENSOR FUNCTIONS ###
+
+SQUAD_SIZE = 15
+STARTING_SIZE = 11
+
+# bit layout of the packed pick flags: the multiplier in the two lowest bits, then the captain and vice captain
+MULTIPLIER_MASK = 0b0011
+CAPTAIN_BIT = 0b0100
+VICE_CAPTAIN_BIT = 0b1000
+
+SQUAD_ARRAYS = ['entries', 'game_weeks', 'elements', 'flags']
+
+# largest league whose full similarity matrix is computed and sent at once. Larger leagues compare one team at a time.
+MAX_SIMILARITY_TEAMS = 200
+
+class SquadTensor:
+    """
+    The picks of a league as dense arrays, a fraction of the size of the picks as a DataFrame.
+    elements[e, g, p] is the player id picked by entries[e] in game_weeks[g] at position p + 1, or 0 if the team
+    has no picks for that game week, and flags[e, g, p] packs the multiplier, captain and vice captain of the pick.
+    The arrays can be memory-mapped from a saved tensor.
+    """
+    def __init__(self, entries, game_weeks, elements, flags):
+        self.entries = entries
+        self.game_weeks = game_weeks
+        self.elements = elements
+        self.flags = flags
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in SQUAD_ARRAYS)
+
+    @property
+    def multipliers(self):
+        return self.flags & MULTIPLIER_MASK
+
+    @property
+    def is_captain(self):
+        return (self.flags & CAPTAIN_BIT) > 0
+
+    @property
+    def is_vice_captain(self):
+        return (self.flags & VICE_CAPTAIN_BIT) > 0
+
+    def game_week_position(self, game_week):
+        positions = np.flatnonzero(self.game_weeks == game_week)
+        if len(positions) == 0:
+            raise KeyError(f"Game week {game_week} is not in the squad tensor.")
+        return positions[0]
+
+    def save(self, directory):
+        """
+        Save each array as a .npy file in the directory, so that load_squad_tensor can memory-map them.
+        """
+        for name in SQUAD_ARRAYS:
+            array = getattr(self, name)
+            write_atomic(os.path.join(directory, f"{name}.npy"), lambda tmp_path: save_array(tmp_path, array))
+
+    def points(self, all_gw_data):
+        """
+        Points of every team in every game week, as an entries x game_weeks array: the players' points times their multipliers.
+        Transfer costs are not deducted, like the points column of hist_teams_data.
+        """
+        max_element = int(max(self.elements.max(), all_gw_data['player_id'].max()))
+        points_by_player = np.zeros((len(self.game_weeks), max_element + 1), dtype=np.int32)
+        gw_positions = pd.Index(self.game_weeks).get_indexer(all_gw_data['game_week'])
+        known = gw_positions >= 0
+        points_by_player[gw_positions[known], all_gw_data['player_id'].to_numpy()[known]] = all_gw_data['total_points'].to_numpy()[known]
+        player_points = np.take_along_axis(points_by_player[None, :, :], self.elements.astype(np.intp), axis=2)
+        return (player_points * self.multipliers).sum(axis=2)
+
+    def ownership(self, game_week):
+        """
+        Ownership of every player picked in the game week, indexed by element, with the same counts as build_ownership_index.
+        """
+        g = self.game_week_position(game_week)
+        elements, multipliers = self.elements[:, g, :], self.multipliers[:, g, :]
+        teams = int((elements[:, 0] > 0).sum())
+        starting = np.zeros(elements.shape, dtype=bool)
+        starting[:, :STARTING_SIZE] = True
+        picked = elements > 0
+
+        size = int(elements.max()) + 1
+        counts = pd.DataFrame({
+            'selected': np.bincount(elements[picked], minlength=size),
+            'starting': np.bincount(elements[picked & starting], minlength=size),
+            'captained': np.bincount(elements[picked & starting & self.is_captain[:, g, :]], minlength=size),
+            'multiplier_sum': np.bincount(elements[picked], weights=multipliers[picked], minlength=size).astype(np.int64),
+        })
+        counts = counts[counts['selected'] > 0].rename_axis('element')
+        counts['ownership'] = counts['selected'] / teams
+        counts['effective_ownership'] = counts['multiplier_sum'] / teams
+        return counts
+
+    def similarity(self, game_week, rows=None):
+        """
+        Similarity score of every pair of teams in the game week, as an entries x entries array of percentages.
+        Scored like calculate_similarity_score: each shared player counts 1 if both teams have the same captaincy and
+        both start or both bench him, 0.8 if the captaincy differs, and 0.5 if only one team starts him, out of 15.
+        With rows, a list of positions in entries, only the scores of those teams against every team are computed.
+        """
+        g = self.game_week_position(game_week)
+        elements, flags = self.elements[:, g, :], self.flags[:, g, :]
+        n_players = int(elements.max()) + 1
+        categories = pick_categories(flags)
+
+        # one hot (entry, player) matrix per category, so that X[k] @ X[l].T counts the players shared with categories k and l
+        one_hot = np.zeros((N_PICK_CATEGORIES, len(self.entries), n_players), dtype=np.float32)
+        entry_index = np.broadcast_to(np.arange(len(self.entries))[:, None], elements.shape)
+        picked = elements > 0
+        one_hot[categories[picked], entry_index[picked], elements[picked]] = 1
+
+        rows = np.arange(len(self.entries)) if rows is None else np.asarray(rows)
+        scores = np.zeros((len(rows), len(self.entries)), dtype=np.float32)
+        for k in range(N_PICK_CATEGORIES):
+            if one_hot[k][rows].any():
+                scores += one_hot[k][rows] @ np.tensordot(PICK_CATEGORY_WEIGHTS[k], one_hot, axes=1).T
+        return np.round(scores / SQUAD_SIZE * 100, 2)
+
+def pick_categories(flags):
+    """
+    Category of each pick in an array of flags whose last axis is the squad position: the captaincy
+    (none, captain or vice captain) times 2, plus 1 if the player starts.
+    """
+    captaincy = (flags & (CAPTAIN_BIT | VICE_CAPTAIN_BIT)) >> 2
+    starting = np.zeros(flags.shape, dtype=np.int8)
+    starting[..., :STARTING_SIZE] = 1
+    return captaincy * 2 + starting
+
+N_PICK_CATEGORIES = 8
+
+# score of a player shared by two squads, by the categories of his two picks: 1 with the same captaincy on the same side
+# of the bench, 0.5 if only one squad starts him and 0.8 if the captaincy differs
+_same_captaincy = (np.arange(N_PICK_CATEGORIES)[:, None] >> 1) == (np.arange(N_PICK_CATEGORIES)[None, :] >> 1)
+_same_side = (np.arange(N_PICK_CATEGORIES)[:, None] & 1) == (np.arange(N_PICK_CATEGORIES)[None, :] & 1)
+PICK_CATEGORY_WEIGHTS = np.where(_same_captaincy, np.where(_same_side, 1.0, 0.5), 0.8).astype(np.float32)
+
+def score_squads(elements, flags, squad_elements, squad_flags):
+    """
+    Similarity score of one squad (squad_elements and squad_flags, one value per position) against each of
+    a list of squads (elements and flags, squads x positions), scored like SquadTensor.similarity.
+    """
+    shared = (elements[:, None, :] == squad_elements[None, :, None]) & (squad_elements[None, :, None] > 0)
+    weights = PICK_CATEGORY_WEIGHTS[pick_categories(squad_flags)[None, :, None], pick_categories(flags)[:, None, :]]
+    return np.round((shared * weights).sum(axis=(1, 2)) / SQUAD_SIZE * 100, 2)
+
+def save_array(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+def build_squad_tensor(all_team_selections):
+    """
+    Build the squad tensor from the picks returned by create_all_team_selections.
+    """
+    picks = all_team_selections[all_team_selections['position'].between(1, SQUAD_SIZE)]
+    entries = np.sort(picks['entry'].unique()).astype(np.int64)
+    events = picks['event'].astype(int)
+    game_weeks = np.arange(events.min(), events.max() + 1, dtype=np.int16) if len(picks) else np.array([], dtype=np.int16)
+
+    e = pd.Index(entries).get_indexer(picks['entry'])
+    g = events.to_numpy() - (game_weeks[0] if len(game_weeks) else 0)
+    p = picks['position'].to_numpy(dtype=np.intp) - 1
+
+    elements = np.zeros((len(entries), len(game_weeks), SQUAD_SIZE), dtype=np.int16)
+    flags = np.zeros(elements.shape, dtype=np.uint8)
+    elements[e, g, p] = picks['element'].to_numpy()
+    flags[e, g, p] = (picks['multiplier'].to_numpy().astype(np.uint8) & MULTIPLIER_MASK) \
+        | np.where(picks['is_captain'].astype(bool), CAPTAIN_BIT, 0).astype(np.uint8) \
+        | np.where(picks['is_vice_captain'].astype(bool), VICE_CAPTAIN_BIT, 0).astype(np.uint8)
+    return SquadTensor(entries, game_weeks, elements, flags)
+
+def load_squad_tensor(directory, mmap_mode='r'):
+    """
+    Load a saved squad tensor. With mmap_mode='r' the arrays are memory-mapped, so only the pages used are read.
+    """
+    arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in SQUAD_ARRAYS}
+    return SquadTensor(**arrays)
+
+def squads_dir(archive_dir, league_id, season):
+    """
+    Where the squad tensor of a league and season is saved in the archive.
+    """
+    return os.path.join(partition_dir(archive_dir, league_id, season), 'squads')
+
+### END OF SQUAD TENSOR FUNCTIONS ###
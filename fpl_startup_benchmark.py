@@ -0,0 +1,91 @@
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+### START OF STARTUP BENCHMARK FUNCTIONS ###
+
+# Cold start budget for a new session: the median first run of fpl_site.py up to the Home page, in fresh interpreters.
+# Importing streamlit itself is measured separately since the app cannot start any faster than that.
+# The Home page takes about 200-300 ms from run to run, while importing pandas and plotly on it would add over 500 ms,
+# so the budget leaves room for the noise and still fails on that regression.
+HOME_PAGE_BUDGET_MS = 400
+
+# modules the Home page must not load. They are imported when a league is loaded or a page needs them.
+LAZY_MODULES = ['pandas', 'numpy', 'plotly.express', 'requests', 'duckdb', 'pyarrow', 'fpl_functions', 'fpl_sql', 'fpl_storage']
+
+# modules whose import cost is reported, as the cost paid by the first page that needs them
+REPORTED_MODULES = ['pandas', 'plotly.express', 'fpl_functions', 'fpl_sql']
+
+COLD_START_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+app = AppTest.from_file('fpl_site.py', default_timeout=60)
+app.run()
+rendered = time.perf_counter()
+print(json.dumps({'streamlit_ms': (imported - start) * 1000, 'home_page_ms': (rendered - imported) * 1000,
+                  'exception': [str(e.value) for e in app.exception],
+                  'loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+IMPORT_SCRIPT = """
+import sys, json, time, importlib
+import streamlit
+start = time.perf_counter()
+importlib.import_module(%r)
+print(json.dumps({'import_ms': (time.perf_counter() - start) * 1000}))
+"""
+
+def run_fresh(script):
+    """
+    Run a script in a new interpreter, so that nothing is already imported, and return its JSON output.
+    """
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_cold_start(runs=5):
+    """
+    Median time to import streamlit and to render the Home page over several fresh interpreters,
+    and the lazy modules that the Home page loaded.
+    """
+    results = [run_fresh(COLD_START_SCRIPT % LAZY_MODULES) for _ in range(runs)]
+    return {
+        'streamlit_ms': statistics.median(result['streamlit_ms'] for result in results),
+        'home_page_ms': statistics.median(result['home_page_ms'] for result in results),
+        'exception': results[0]['exception'],
+        'loaded': results[0]['loaded'],
+    }
+
+def measure_module_imports(modules=REPORTED_MODULES, runs=3):
+    """
+    Median import time of each module in a fresh interpreter that has already imported streamlit.
+    """
+    return {module: statistics.median(run_fresh(IMPORT_SCRIPT % module)['import_ms'] for _ in range(runs))
+            for module in modules}
+
+### END OF STARTUP BENCHMARK FUNCTIONS ###
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the cold start of the app against its budget.')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    cold_start = measure_cold_start(args.runs)
+    print(f"Import streamlit:       {cold_start['streamlit_ms']:7.0f} ms")
+    print(f"Render the Home page:   {cold_start['home_page_ms']:7.0f} ms (median of {args.runs} runs, budget {HOME_PAGE_BUDGET_MS} ms)")
+    for module, import_ms in measure_module_imports().items():
+        print(f"  first use of {module + ':':16}{import_ms:7.0f} ms")
+
+    failures = []
+    if cold_start['exception']:
+        failures.append(f"the Home page raised {cold_start['exception']}")
+    if cold_start['home_page_ms'] > HOME_PAGE_BUDGET_MS:
+        failures.append(f"the Home page took a median of {cold_start['home_page_ms']:.0f} ms")
+    if cold_start['loaded']:
+        failures.append(f"the Home page loaded {', '.join(cold_start['loaded'])}")
+    for failure in failures:
+        print(f"Over budget: {failure}")
+    sys.exit(1 if failures else 0)
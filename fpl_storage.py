@@ -0,0 +1,156 @@
+import os
+import time
+import pickle
+import threading
+import contextlib
+from fpl_archive import write_atomic, file_lock
+
+### START OF SNAPSHOT STORAGE FUNCTIONS ###
+
+# Where the league snapshots are shared between workers. Set FPL_SNAPSHOT_STORE=memory to keep them in the process only.
+SNAPSHOT_STORE = os.environ.get('FPL_SNAPSHOT_STORE', 'directory')
+SNAPSHOT_DIR = os.environ.get('FPL_SNAPSHOT_DIR', 'fpl_snapshots')
+
+SNAPSHOT_MAX_AGE_SECONDS = 4 * 60 * 60 # same as the app's cache
+LOCK_TIMEOUT_SECONDS = 30 * 60 # longest a worker waits for another worker's extraction
+LOCK_POLL_SECONDS = 0.5
+
+class DirectorySnapshotStore:
+    """
+    Snapshots stored as pickle files in a directory shared by all workers, e.g. a volume mounted into every replica.
+    Each key has a lock file, locked with flock, so that only one worker at a time refreshes it.
+    The lock is released by the OS if the worker dies.
+    """
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, extension='pkl'):
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def saved_at(self, key):
+        """
+        Time the snapshot was saved, or None if there is no snapshot.
+        """
+        try:
+            return os.path.getmtime(self.path(key))
+        except FileNotFoundError:
+            return None
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        write_atomic(self.path(key), write)
+
+    def delete(self, key):
+        """
+        Remove the snapshot. Its lock file is kept, since another worker may hold the lock.
+        """
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def lock(self, key, timeout=LOCK_TIMEOUT_SECONDS):
+        """
+        Hold the key's lock. Yields False instead of waiting when the timeout is 0 and another worker holds it.
+        """
+        return file_lock(self.path(key, 'lock'), timeout=timeout, poll_seconds=LOCK_POLL_SECONDS)
+
+class MemorySnapshotStore:
+    """
+    In-process stand-in for the shared store, for a single worker or for local development.
+    """
+    def __init__(self):
+        self.snapshots = {}
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def saved_at(self, key):
+        snapshot = self.snapshots.get(key)
+        return snapshot[0] if snapshot else None
+
+    def get(self, key):
+        snapshot = self.snapshots.get(key)
+        return snapshot[1] if snapshot else None
+
+    def put(self, key, value):
+        self.snapshots[key] = (time.time(), value)
+
+    def delete(self, key):
+        self.snapshots.pop(key, None)
+
+    @contextlib.contextmanager
+    def lock(self, key, timeout=LOCK_TIMEOUT_SECONDS):
+        with self.locks_lock:
+            key_lock = self.locks.setdefault(key, threading.Lock())
+        if timeout == 0:
+            acquired = key_lock.acquire(blocking=False)
+        else:
+            acquired = key_lock.acquire(timeout=timeout)
+        if not acquired:
+            if timeout == 0:
+                yield False
+                return
+            raise TimeoutError(f"Timed out waiting for the lock on {key}.")
+        try:
+            yield True
+        finally:
+            key_lock.release()
+
+_snapshot_store = None
+
+def get_snapshot_store():
+    """
+    The snapshot store configured for this process, created on first use.
+    """
+    global _snapshot_store
+    if _snapshot_store is None:
+        _snapshot_store = MemorySnapshotStore() if SNAPSHOT_STORE == 'memory' else DirectorySnapshotStore(SNAPSHOT_DIR)
+    return _snapshot_store
+
+def load_or_extract(key, extract, store=None, max_age_seconds=SNAPSHOT_MAX_AGE_SECONDS, lock_timeout=LOCK_TIMEOUT_SECONDS):
+    """
+    Return the snapshot for the key, running extract() to refresh it when it is missing or older than max_age_seconds.
+    Only one worker extracts a key at a time. Workers that find a stale snapshot while another worker is refreshing it
+    get the stale snapshot straight away, and workers without any snapshot wait for the refresh and reuse its result.
+    """
+    store = store or get_snapshot_store()
+
+    def is_fresh():
+        saved_at = store.saved_at(key)
+        return saved_at is not None and time.time() - saved_at < max_age_seconds
+
+    if is_fresh():
+        return store.get(key)
+
+    # serve the stale snapshot rather than wait if another worker is already refreshing it
+    if store.saved_at(key) is not None:
+        with store.lock(key, timeout=0) as locked:
+            if locked:
+                return refresh_snapshot(store, key, extract, is_fresh)
+        return store.get(key)
+
+    with store.lock(key, timeout=lock_timeout):
+        return refresh_snapshot(store, key, extract, is_fresh)
+
+def refresh_snapshot(store, key, extract, is_fresh):
+    """
+    Extract and save the snapshot, unless another worker saved a fresh one while this worker waited for the lock.
+    Must be called while holding the key's lock.
+    """
+    if is_fresh():
+        return store.get(key)
+    value = extract()
+    store.put(key, value)
+    return value
+
+### END OF SNAPSHOT STORAGE FUNCTIONS ###
@@ -0,0 +1,224 @@
+import re
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+### START OF STUB SERVER FUNCTIONS ###
+
+# A local stand-in for the FPL API, serving a synthetic league. It can inject rate limiting and server errors so that
+# the crawler can be exercised without hitting the real API, e.g.
+#   python fpl_stub_server.py --port 8765 --rate-limit 50 --error-rate 0.02
+#   FPL_BASE_URL=http://localhost:8765/api/ streamlit run fpl_site.py
+
+ELEMENT_TYPES = [
+    {'id': 1, 'plural_name': 'Goalkeepers', 'plural_name_short': 'GKP', 'singular_name': 'Goalkeeper', 'singular_name_short': 'GKP'},
+    {'id': 2, 'plural_name': 'Defenders', 'plural_name_short': 'DEF', 'singular_name': 'Defender', 'singular_name_short': 'DEF'},
+    {'id': 3, 'plural_name': 'Midfielders', 'plural_name_short': 'MID', 'singular_name': 'Midfielder', 'singular_name_short': 'MID'},
+    {'id': 4, 'plural_name': 'Forwards', 'plural_name_short': 'FWD', 'singular_name': 'Forward', 'singular_name_short': 'FWD'},
+]
+
+# entry ids are league_id * ENTRIES_PER_LEAGUE + i, so that the league of an entry can be decoded from its id
+ENTRIES_PER_LEAGUE = 10**6
+
+# players of each element type in a squad, with the starting formation (4-4-2) first
+SQUAD_TYPES = [1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 1, 2, 3, 4]
+
+def build_league_payloads(league_id=1, n_entries=20, n_game_weeks=5, start_event=1, n_players=400, season_start=2024, seed=0):
+    """
+    Build the API responses for a synthetic league, keyed by path relative to the API root.
+    Picks, history and live points are consistent with each other, so the extraction's consistency check passes.
+    """
+    if n_entries > ENTRIES_PER_LEAGUE:
+        raise ValueError(f"A league can have at most {ENTRIES_PER_LEAGUE} entries.")
+    rng = random.Random(f"{seed}-{league_id}")
+    teams = [{'id': i + 1, 'code': 100 + i, 'name': f'Club {i + 1}', 'short_name': f'C{i + 1:02d}', 'pulse_id': 1000 + i}
+             for i in range(20)]
+    elements = []
+    for player_id in range(1, n_players + 1):
+        team = teams[player_id % len(teams)]
+        elements.append({'id': player_id, 'element_type': player_id % 4 + 1, 'first_name': f'First{player_id}',
+                         'second_name': f'Second{player_id}', 'web_name': f'Player{player_id}',
+                         'team': team['id'], 'team_code': team['code'], 'now_cost': 45 + player_id % 80})
+    players_by_type = {element_type['id']: [p['id'] for p in elements if p['element_type'] == element_type['id']]
+                       for element_type in ELEMENT_TYPES}
+    first_deadline = datetime.datetime(season_start, 8, 16, 17, 30, tzinfo=datetime.timezone.utc)
+    events = [{'id': gw, 'deadline_time': (first_deadline + datetime.timedelta(days=7 * (gw - 1))).isoformat(),
+               'finished': gw < start_event + n_game_weeks, 'is_current': gw == start_event + n_game_weeks - 1}
+              for gw in range(1, 39)]
+    payloads = {'bootstrap-static/': {'events': events, 'teams': teams, 'elements': elements, 'element_types': ELEMENT_TYPES}}
+
+    # the live points are served from league 1's payloads to every league, so they depend only on the seed
+    live_rng = random.Random(seed)
+    live_points = {}
+    for gw in range(start_event, start_event + n_game_weeks):
+        live = []
+        for player in elements:
+            stats = {'minutes': live_rng.choice([1, 30, 60, 90, 90, 90]), 'goals_scored': int(live_rng.random() < 0.15),
+                     'assists': int(live_rng.random() < 0.15), 'clean_sheets': int(live_rng.random() < 0.3), 'bonus': 0,
+                     'total_points': live_rng.randint(0, 12)}
+            live.append({'id': player['id'], 'stats': stats, 'explain': []})
+        live_points[gw] = {player['id']: player['stats']['total_points'] for player in live}
+        payloads[f'event/{gw}/live/'] = {'elements': live}
+        payloads[f'fixtures/?event={gw}'] = []
+
+    results = []
+    for i in range(n_entries):
+        entry = league_id * ENTRIES_PER_LEAGUE + i
+        results.append({'id': 1000000 + i, 'event_total': 0, 'player_name': f'Manager {i + 1}', 'rank': i + 1,
+                        'last_rank': i + 1, 'rank_sort': i + 1, 'total': 0, 'entry': entry, 'entry_name': f'Team {i + 1}'})
+        squad = []
+        for element_type in SQUAD_TYPES:
+            squad.append(rng.choice([p for p in players_by_type[element_type] if p not in squad]))
+        history, transfers = [], []
+        for gw in range(start_event, start_event + n_game_weeks):
+            if gw > start_event and rng.random() < 0.6:
+                slot = rng.randrange(len(squad))
+                player_in = rng.choice([p for p in players_by_type[SQUAD_TYPES[slot]] if p not in squad])
+                transfer_time = first_deadline + datetime.timedelta(days=7 * (gw - 1) - rng.randint(1, 6), hours=rng.randint(0, 23))
+                transfers.append({'element_in': player_in, 'element_in_cost': 55, 'element_out': squad[slot],
+                                  'element_out_cost': 60, 'entry': entry, 'event': gw, 'time': transfer_time.isoformat()})
+                squad[slot] = player_in
+            captain = rng.randrange(11)
+            picks, points = [], 0
+            for position, element in enumerate(squad, start=1):
+                multiplier = 0 if position > 11 else (2 if position - 1 == captain else 1)
+                picks.append({'element': element, 'position': position, 'multiplier': multiplier,
+                              'is_captain': position - 1 == captain, 'is_vice_captain': position - 1 == (captain + 1) % 11,
+                              'element_type': SQUAD_TYPES[position - 1]})
+                points += multiplier * live_points[gw][element]
+            payloads[f'entry/{entry}/event/{gw}/picks/'] = {'active_chip': None, 'automatic_subs': [], 'entry_history': {},
+                                                             'picks': picks}
+            cost = 4 if rng.random() < 0.1 else 0
+            history.append({'event': gw, 'points': points, 'total_points': 0, 'rank': 1, 'rank_sort': 1, 'overall_rank': 1,
+                            'percentile_rank': 1, 'bank': rng.randint(0, 30), 'value': 1000 + rng.randint(0, 30),
+                            'event_transfers': 1 if cost else 0, 'event_transfers_cost': cost,
+                            'points_on_bench': rng.randint(0, 15)})
+        payloads[f'entry/{entry}/history'] = {'current': history, 'past': [], 'chips': []}
+        payloads[f'entry/{entry}/transfers/'] = transfers
+    payloads[f'leagues-classic/{league_id}/standings/'] = {
+        'league': {'id': league_id, 'name': f'Stub League {league_id}', 'start_event': start_event},
+        'standings': {'has_next': False, 'page': 1, 'results': results}}
+    return payloads
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average, with bursts of up to burst requests.
+    """
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class StubFPLServer(ThreadingHTTPServer):
+    """
+    Serves the synthetic leagues under /api/. Leagues are generated on first request.
+    Counts the responses by status code in self.counters.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, n_entries=20, n_game_weeks=5, rate_limit=None, error_rate=0.0, latency=0.0, seed=0):
+        super().__init__(address, StubFPLHandler)
+        self.n_entries, self.n_game_weeks, self.seed = n_entries, n_game_weeks, seed
+        self.bucket = TokenBucket(rate_limit, max(rate_limit, 1)) if rate_limit else None
+        self.error_rate, self.latency = error_rate, latency
+        self.rng = random.Random(seed)
+        self.payloads = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def league_payloads(self, league_id):
+        with self.lock:
+            if league_id not in self.payloads:
+                self.payloads[league_id] = build_league_payloads(league_id, self.n_entries, self.n_game_weeks, seed=self.seed)
+            return self.payloads[league_id]
+
+    def find_payload(self, path):
+        """
+        Look up a path in the generated leagues. The player data is shared by all leagues, so it comes from league 1.
+        Returns None, answered with a 404, for paths and ids that no league has.
+        """
+        league_match = re.match(r'leagues-classic/(\d+)/standings/', path)
+        entry_match = re.match(r'entry/(\d+)/', path)
+        if league_match:
+            league_id = int(league_match.group(1))
+        elif entry_match:
+            league_id = int(entry_match.group(1)) // ENTRIES_PER_LEAGUE
+        else:
+            league_id = 1
+        if league_id < 1:
+            return None
+        return self.league_payloads(league_id).get(path)
+
+    def count(self, status):
+        with self.lock:
+            self.counters[status] = self.counters.get(status, 0) + 1
+
+class StubFPLHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if not self.path.startswith('/api/'):
+            return self.respond(404, {'detail': 'Not found.'})
+        if server.bucket and not server.bucket.take():
+            return self.respond(429, {'detail': 'Request was throttled.'}, headers={'Retry-After': '1'})
+        if server.error_rate and server.rng.random() < server.error_rate:
+            return self.respond(503, {'detail': 'Service unavailable.'})
+        payload = server.find_payload(self.path[len('/api/'):])
+        if payload is None:
+            return self.respond(404, {'detail': 'Not found.'})
+        self.respond(200, payload)
+
+    def respond(self, status, payload, headers=None):
+        self.server.count(status)
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(port=0, **kwargs):
+    """
+    Start the stub server on a background thread. Returns the server and its API base URL.
+    """
+    server = StubFPLServer(('127.0.0.1', port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/"
+
+### END OF STUB SERVER FUNCTIONS ###
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve synthetic FPL leagues locally.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--entries', type=int, default=20, help='teams per league')
+    parser.add_argument('--game-weeks', type=int, default=5)
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests per second before answering 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    args = parser.parse_args()
+
+    server = StubFPLServer(('127.0.0.1', args.port), n_entries=args.entries, n_game_weeks=args.game_weeks,
+                           rate_limit=args.rate_limit, error_rate=args.error_rate, latency=args.latency)
+    print(f"Serving the stub FPL API at http://127.0.0.1:{args.port}/api/")
+    server.serve_forever()
@@ -0,0 +1,32 @@
+import os
+import sys
+import pytest
+
+# the fpl_* modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fpl_stub_server import start_stub_server
+
+@pytest.fixture(scope='session')
+def stub_url():
+    """
+    Base URL of a stub FPL API with 8 teams per league and 5 game weeks played, used by fpl_functions for the session.
+    """
+    import fpl_functions
+    server, base_url = start_stub_server(n_entries=8, n_game_weeks=5)
+    original_url, fpl_functions.BASE_URL = fpl_functions.BASE_URL, base_url
+    yield base_url
+    fpl_functions.BASE_URL = original_url
+    server.shutdown()
+
+@pytest.fixture(scope='session')
+def archive_dir(stub_url, tmp_path_factory):
+    """
+    An archive with every table of leagues 1 and 2 of the stub extracted into it.
+    """
+    from fpl_functions import LeagueData
+    archive_dir = str(tmp_path_factory.mktemp('archive'))
+    for league_id in [1, 2]:
+        league = LeagueData(league_id, archive_dir=archive_dir, journal_dir=None)
+        league.full_selection_data, league.df_transfers_in_out
+    return archive_dir
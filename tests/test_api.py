@@ -0,0 +1,75 @@
+import json
+import urllib.error
+import urllib.request
+import pytest
+from fpl_api import start_stats_api
+
+@pytest.fixture(scope='module')
+def stats_api(archive_dir):
+    server, url = start_stats_api(archive_dir=archive_dir)
+    yield server, url
+    server.shutdown()
+
+def get(url, headers=None):
+    """
+    Status, headers and body of a GET request, without raising on error statuses.
+    """
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {})) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+def test_standings(stats_api):
+    _, url = stats_api
+    status, headers, body = get(f"{url}/leagues/1/standings/5")
+    assert status == 200
+    assert headers['ETag'] and headers['Last-Modified']
+    assert len(json.loads(body)) == 8
+
+def test_a_matching_etag_gets_not_modified(stats_api):
+    server, url = stats_api
+    _, headers, body = get(f"{url}/leagues/1/standings/4")
+    hits = server.api.counters['cache_hits']
+
+    status, revalidated, revalidated_body = get(f"{url}/leagues/1/standings/4", {'If-None-Match': headers['ETag']})
+    assert status == 304
+    assert revalidated_body == b''
+    assert revalidated['ETag'] == headers['ETag']
+    assert server.api.counters['cache_hits'] == hits + 1
+
+    status, _, body_again = get(f"{url}/leagues/1/standings/4", {'If-None-Match': '"stale", "other"'})
+    assert (status, body_again) == (200, body)
+    status, _, _ = get(f"{url}/leagues/1/standings/4", {'If-None-Match': '*'})
+    assert status == 304
+
+def test_responses_differ_by_etag(stats_api):
+    _, url = stats_api
+    etags = {get(f"{url}/leagues/{league_id}/standings/5")[1]['ETag'] for league_id in [1, 2]}
+    assert len(etags) == 2
+
+def test_errors(stats_api):
+    _, url = stats_api
+    assert get(f"{url}/leagues/99/standings/5")[0] == 404
+    assert get(f"{url}/nothing")[0] == 404
+    assert get(f"{url}/leagues/1/standings/5?season=2024")[0] == 400
+
+def test_similarity_scores_are_rounded(stats_api):
+    _, url = stats_api
+    status, _, body = get(f"{url}/leagues/1/similarity/5")
+    similarity = json.loads(body)
+    assert status == 200
+    assert len(similarity['scores']) == len(similarity['entries']) == 8
+    assert all(score == round(score, 2) and len(repr(score)) <= 6 for row in similarity['scores'] for score in row)
+
+def test_an_unexpected_error_gets_a_json_500(stats_api, monkeypatch):
+    server, url = stats_api
+
+    def fail(*args):
+        raise RuntimeError('corrupt archive')
+
+    monkeypatch.setattr(server.api, 'league', fail)
+    status, headers, body = get(f"{url}/leagues/2/teams/{2 * 10**6}/history")
+    assert status == 500
+    assert headers['Content-Type'] == 'application/json'
+    assert 'detail' in json.loads(body)
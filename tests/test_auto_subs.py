@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+from fpl_functions import resolve_team_selections
+
+# element types of the squad by position: a 4-4-2 and a bench of a goalkeeper, a defender, a midfielder and a forward
+SQUAD_TYPES = [1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 1, 2, 3, 4]
+CAPTAIN, VICE_CAPTAIN = 10, 9 # positions of a forward and a midfielder
+
+def squad(entry=1, event=1, active_chip=None):
+    return pd.DataFrame({'entry': entry, 'event': event, 'position': range(1, 16), 'element_type': SQUAD_TYPES,
+                         'multiplier': [2 if position == CAPTAIN else int(position <= 11) for position in range(1, 16)],
+                         'is_captain': [position == CAPTAIN for position in range(1, 16)],
+                         'is_vice_captain': [position == VICE_CAPTAIN for position in range(1, 16)],
+                         'active_chip': active_chip})
+
+def resolve(team_selections, did_not_play=(), finished=None):
+    minutes = np.where(team_selections['position'].isin(did_not_play), 0, 90)
+    multiplier, sub_in, sub_out = resolve_team_selections(team_selections, minutes, finished)
+    by_position = lambda values: dict(zip(team_selections['position'], values))
+    return by_position(multiplier), by_position(sub_in), by_position(sub_out)
+
+def test_no_subs_when_every_starter_played():
+    multiplier, sub_in, sub_out = resolve(squad())
+    assert [multiplier[position] for position in range(1, 16)] == [1] * 9 + [2, 1] + [0] * 4
+    assert not any(sub_in.values()) and not any(sub_out.values())
+
+def test_first_outfield_bench_player_replaces_a_defender():
+    multiplier, sub_in, sub_out = resolve(squad(), did_not_play=[2])
+    assert multiplier[2] == 0 and multiplier[13] == 1
+    assert [position for position, value in sub_in.items() if value] == [13]
+    assert [position for position, value in sub_out.items() if value] == [2]
+
+def test_a_bench_player_who_did_not_play_is_skipped():
+    multiplier, sub_in, _ = resolve(squad(), did_not_play=[2, 13])
+    assert multiplier[13] == 0 and multiplier[14] == 1
+    assert [position for position, value in sub_in.items() if value] == [14]
+
+def test_goalkeeper_is_only_replaced_by_the_bench_goalkeeper():
+    multiplier, sub_in, _ = resolve(squad(), did_not_play=[1])
+    assert multiplier[1] == 0 and multiplier[12] == 1
+    assert [position for position, value in sub_in.items() if value] == [12]
+
+def test_formation_stays_valid():
+    # with both forwards and the bench forward out, one forward stays on to keep the minimum of one
+    multiplier, sub_in, sub_out = resolve(squad(), did_not_play=[10, 11, 15])
+    assert [position for position, value in sub_in.items() if value] == [13]
+    assert [position for position, value in sub_out.items() if value] == [10]
+    assert multiplier[11] == 1 and multiplier[14] == 0
+
+def test_vice_captain_takes_the_armband():
+    multiplier, _, _ = resolve(squad(), did_not_play=[CAPTAIN])
+    assert multiplier[CAPTAIN] == 0 and multiplier[VICE_CAPTAIN] == 2
+
+def test_no_sub_until_the_fixture_is_finished():
+    team_selections = squad()
+    finished = ~team_selections['position'].isin([2]).to_numpy()
+    multiplier, sub_in, _ = resolve(team_selections, did_not_play=[2], finished=finished)
+    assert multiplier[2] == 1 and not any(sub_in.values())
+
+def test_chips():
+    multiplier, sub_in, _ = resolve(squad(active_chip='bboost'), did_not_play=[2])
+    assert [multiplier[position] for position in range(1, 16)] == [1] * 9 + [2] + [1] * 5
+    assert not any(sub_in.values())
+    multiplier, _, _ = resolve(squad(active_chip='3xc'))
+    assert multiplier[CAPTAIN] == 3
+
+def test_squads_are_resolved_in_any_row_order():
+    team_selections = pd.concat([squad(entry=1), squad(entry=2, event=3), squad(entry=1, event=2)])
+    team_selections = team_selections.sample(frac=1, random_state=0).reset_index(drop=True)
+    minutes = np.where((team_selections['entry'] == 2) & (team_selections['position'] == 2), 0, 90)
+    multiplier, sub_in, _ = resolve_team_selections(team_selections, minutes)
+    subbed_in = team_selections[sub_in]
+    assert subbed_in[['entry', 'event', 'position']].values.tolist() == [[2, 3, 13]]
+    assert multiplier.sum() == 3 * 12
+
+def test_squads_without_fifteen_picks_keep_their_multipliers():
+    short_squad = squad(entry=2).iloc[:14] # the bench forward is missing
+    repeated_position = squad(entry=3)
+    repeated_position.loc[14, 'position'] = 14
+    team_selections = pd.concat([squad(entry=1), short_squad, repeated_position], ignore_index=True)
+    minutes = np.where(team_selections['position'] == 2, 0, 90)
+    multiplier, sub_in, sub_out = resolve_team_selections(team_selections, minutes)
+
+    complete = (team_selections['entry'] == 1).to_numpy()
+    assert team_selections.loc[sub_in, ['entry', 'position']].values.tolist() == [[1, 13]]
+    assert team_selections.loc[sub_out, ['entry', 'position']].values.tolist() == [[1, 2]]
+    assert (multiplier[~complete] == team_selections.loc[~complete, 'multiplier']).all()
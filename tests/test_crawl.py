@@ -0,0 +1,92 @@
+import time
+import pytest
+from fpl_crawl import CrawlController, CrawlError, ErrorBudget, classify_status, fetch_units
+from fpl_stub_server import start_stub_server
+
+def fast_controller(**kwargs):
+    return CrawlController(backoff_seconds=0.01, max_backoff_seconds=0.05, **kwargs)
+
+def test_limit_grows_on_success_and_is_cut_on_throttling():
+    controller = fast_controller(max_concurrency=8, initial_concurrency=4)
+    for _ in range(40):
+        controller.acquire()
+        controller.release('ok')
+    assert controller.limit == 8
+
+    controller.acquire()
+    controller.release('throttled', retry_after=0)
+    assert controller.limit == 4
+    controller.acquire()
+    controller.release('server_error', retry_after=0)
+    assert controller.limit == 2
+    assert controller.stats()['backoffs'] == 2
+
+def test_client_errors_do_not_back_off():
+    controller = fast_controller(initial_concurrency=4)
+    controller.acquire()
+    controller.release('client_error')
+    assert controller.limit == 4
+    assert controller.paused_until == 0.0
+
+def test_retry_after_pauses_new_requests():
+    controller = CrawlController(max_backoff_seconds=1.0)
+    controller.acquire()
+    controller.release('throttled', retry_after=0.2)
+    start = time.monotonic()
+    controller.acquire()
+    assert time.monotonic() - start >= 0.15
+    controller.release('ok')
+
+def test_classify_status():
+    assert [classify_status(status) for status in [200, 404, 429, 503]] == ['ok', 'client_error', 'throttled', 'server_error']
+
+def test_error_budget_allows_a_share_and_a_minimum_of_lost_units():
+    budget = ErrorBudget(budget=0.02, min_units=2)
+    budget.record(10, ['a', 'b'])
+    assert not budget.exhausted()
+    budget.record(0, ['c'])
+    assert budget.exhausted()
+    with pytest.raises(CrawlError):
+        budget.check()
+
+    budget = ErrorBudget(budget=0.02, min_units=2)
+    budget.record(1000, list(range(20)))
+    assert not budget.exhausted()
+    budget.record(0, [20])
+    assert budget.exhausted()
+
+def test_fetch_units_retries_server_errors(stub_url):
+    server, base_url = start_stub_server(n_entries=8, n_game_weeks=5, error_rate=0.3, seed=1)
+    try:
+        controller = fast_controller()
+        urls = {gw: f"{base_url}event/{gw}/live/" for gw in range(1, 6)}
+        urls.update({entry: f"{base_url}entry/{entry}/history" for entry in range(10**6, 10**6 + 8)})
+        budget = ErrorBudget()
+        results = fetch_units(urls, budget=budget, controller=controller, max_attempts=20)
+    finally:
+        server.shutdown()
+    assert set(results) == set(urls)
+    assert budget.failed_units == []
+    assert controller.counters['server_error'] > 0
+    assert controller.counters['requeued'] == controller.counters['server_error']
+
+def test_fetch_units_leaves_out_missing_units_without_using_the_budget(stub_url):
+    controller = fast_controller()
+    budget = ErrorBudget()
+    results = fetch_units({gw: f"{stub_url}event/{gw}/live/" for gw in range(1, 39)}, budget=budget, controller=controller)
+    assert sorted(results) == [1, 2, 3, 4, 5]
+    assert budget.failed_units == []
+    assert controller.counters['missing_units'] == 33
+    assert controller.counters['requeued'] == 0
+
+def test_fetch_units_raises_once_retries_are_exhausted():
+    server, base_url = start_stub_server(error_rate=1.0)
+    try:
+        controller = fast_controller()
+        with pytest.raises(CrawlError):
+            fetch_units({gw: f"{base_url}event/{gw}/live/" for gw in range(1, 4)}, budget=ErrorBudget(),
+                        controller=controller, max_attempts=2)
+    finally:
+        server.shutdown()
+    assert controller.counters['failed_units'] == 3
+    assert controller.counters['requests'] == 6
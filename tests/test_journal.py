@@ -0,0 +1,43 @@
+import os
+from fpl_crawl import CrawlController, fetch_units
+from fpl_journal import ExtractionJournal
+
+def test_replay_keeps_the_latest_response_of_each_url(tmp_path):
+    journal = ExtractionJournal(str(tmp_path / 'journal.jsonl'))
+    journal.record('a', {'n': 1})
+    journal.record('b', {'n': 2})
+    journal.record('a', {'n': 3})
+    journal.close()
+    assert ExtractionJournal(journal.path).load() == {'a': {'n': 3}, 'b': {'n': 2}}
+
+def test_replay_skips_a_line_cut_short(tmp_path):
+    journal = ExtractionJournal(str(tmp_path / 'journal.jsonl'))
+    journal.record('a', {'n': 1})
+    journal.close()
+    with open(journal.path, 'a') as f:
+        f.write('{"url": "b", "da')
+
+    resumed = ExtractionJournal(journal.path)
+    assert resumed.load() == {'a': {'n': 1}}
+    resumed.record('c', {'n': 3})
+    resumed.close()
+    assert ExtractionJournal(journal.path).load() == {'a': {'n': 1}, 'c': {'n': 3}}
+
+def test_an_old_journal_is_discarded(tmp_path):
+    journal = ExtractionJournal(str(tmp_path / 'journal.jsonl'))
+    journal.record('a', {'n': 1})
+    journal.close()
+    assert ExtractionJournal(journal.path, max_age_seconds=-1).load() == {}
+    assert not os.path.exists(journal.path)
+
+def test_fetch_units_resumes_from_the_journal(stub_url, tmp_path):
+    urls = {gw: f"{stub_url}event/{gw}/live/" for gw in range(1, 6)}
+    first_run = fetch_units(dict(list(urls.items())[:3]), controller=CrawlController(),
+                            journal=ExtractionJournal(str(tmp_path / 'journal.jsonl')))
+
+    controller = CrawlController()
+    resumed = fetch_units(urls, controller=controller, journal=ExtractionJournal(str(tmp_path / 'journal.jsonl')))
+    assert controller.counters['resumed_units'] == 3
+    assert controller.counters['requests'] == 2
+    assert {gw: resumed[gw] for gw in first_run} == first_run
+    assert sorted(resumed) == [1, 2, 3, 4, 5]
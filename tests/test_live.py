@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from fpl_functions import (apply_live_points, create_all_gw_data, create_all_team_selections, create_dim_teams,
+                           create_hist_teams_data, fetch_live_points, get_player_dimension, merge_data)
+
+# element types of the squad by position: a 4-4-2 and a bench of a goalkeeper, a defender, a midfielder and a forward
+SQUAD_TYPES = [1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 1, 2, 3, 4]
+
+def squad(entry, event, elements, captain):
+    return pd.DataFrame({'entry': entry, 'event': event, 'element': elements, 'position': range(1, 16),
+                         'element_type': SQUAD_TYPES, 'game_week': event, 'total_points': 0, 'minutes': 0,
+                         'multiplier': [2 if position == captain else int(position <= 11) for position in range(1, 16)],
+                         'is_captain': [position == captain for position in range(1, 16)],
+                         'is_vice_captain': [position == captain + 1 for position in range(1, 16)],
+                         'active_chip': None})
+
+def test_live_points_update_the_game_week_standings():
+    hist_teams_data = pd.DataFrame({'entry': [1, 2, 1, 2], 'event': [1, 1, 2, 2], 'points': [50, 70, 0, 0],
+                                    'event_transfers_cost': [0, 0, 4, 0]})
+    hist_teams_data['gw_points'] = hist_teams_data['points'] - hist_teams_data['event_transfers_cost']
+    hist_teams_data['total_points'] = hist_teams_data.groupby('entry')['gw_points'].cumsum()
+    hist_teams_data['league_rank'] = [2, 1, 2, 1]
+    full_selection_data = pd.concat([squad(1, 1, range(1, 16), captain=1), squad(1, 2, range(1, 16), captain=1),
+                                     squad(2, 2, range(16, 31), captain=10)], ignore_index=True)
+    full_selection_data['points_earned'] = 0
+    full_selection_data.loc[full_selection_data['element'] == 20, ['game_week', 'total_points']] = np.nan # no game week data
+
+    # every player scores his own id, and plays
+    element_ids = np.arange(1, 31)
+    live_points = (element_ids, element_ids, np.full(30, 90), np.ones(30, dtype=bool))
+    live_hist, live_selection = apply_live_points(hist_teams_data, full_selection_data, 2, live_points)
+
+    # team 1: 1 + ... + 11 with player 1 captained, less the transfer cost, team 2: 16 + ... + 26 with player 25 captained
+    gw_rows = live_hist[live_hist['event'] == 2].set_index('entry')
+    assert gw_rows['points'].tolist() == [67, 256]
+    assert gw_rows['total_points'].tolist() == [50 + 63, 70 + 256]
+    assert gw_rows['league_rank'].tolist() == [2, 1]
+    pd.testing.assert_frame_equal(live_hist[live_hist['event'] == 1], hist_teams_data[hist_teams_data['event'] == 1])
+
+    assert live_selection.loc[live_selection['element'] == 20, ['game_week', 'total_points']].values.tolist() == [[2, 20]]
+    assert (live_selection.loc[live_selection['event'] == 1, 'total_points'] == 0).all()
+    assert hist_teams_data['points'].tolist() == [50, 70, 0, 0] # the inputs are left as they were
+
+def test_live_points_match_a_full_crawl(stub_url):
+    dim_teams, _, start_event = create_dim_teams(4)
+    hist_teams_data = create_hist_teams_data(dim_teams, start_event)
+    all_team_selections = create_all_team_selections(hist_teams_data, 5, start_event)
+    full_selection_data = merge_data(get_player_dimension(), create_all_gw_data(5, start_event), all_team_selections, dim_teams)
+
+    # the tables as they were at the deadline of game week 5, before any points came in
+    stale_hist = hist_teams_data.copy()
+    in_gw = stale_hist['event'] == 5
+    stale_hist.loc[in_gw, 'points'] = 0
+    stale_hist.loc[in_gw, 'total_points'] -= stale_hist.loc[in_gw, 'gw_points'] + stale_hist.loc[in_gw, 'event_transfers_cost']
+    stale_hist.loc[in_gw, 'gw_points'] = -stale_hist.loc[in_gw, 'event_transfers_cost']
+    stale_hist.loc[in_gw, 'league_rank'] = 1
+    stale_selection = full_selection_data.copy()
+    stale_selection.loc[stale_selection['event'] == 5, ['game_week', 'total_points', 'minutes', 'points_earned']] = np.nan
+
+    live_hist, live_selection = apply_live_points(stale_hist, stale_selection, 5, fetch_live_points(5))
+    columns = ['entry', 'event', 'points', 'gw_points', 'total_points', 'league_rank']
+    pd.testing.assert_frame_equal(live_hist[columns], hist_teams_data[columns], check_dtype=False)
+    columns = ['entry', 'event', 'element', 'game_week', 'total_points', 'minutes', 'multiplier', 'points_earned']
+    pd.testing.assert_frame_equal(live_selection[columns], full_selection_data[columns], check_dtype=False)
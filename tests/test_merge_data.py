@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from fpl_functions import PlayerDimension, SELECTION_GW_COLUMNS, SELECTION_PLAYER_COLUMNS, merge_data
+
+BOOTSTRAP_STATIC = {
+    'events': [{'id': 1, 'deadline_time': '2024-08-16T17:30:00Z'}],
+    'teams': [{'code': 3, 'name': 'Arsenal', 'short_name': 'ARS', 'pulse_id': 1},
+              {'code': 7, 'name': 'Aston Villa', 'short_name': 'AVL', 'pulse_id': 2}],
+    'element_types': [{'id': element_type, 'plural_name': name, 'plural_name_short': name[:3].upper(), 'singular_name': name[:-1]}
+                      for element_type, name in [(1, 'Goalkeepers'), (2, 'Defenders'), (3, 'Midfielders'), (4, 'Forwards')]],
+    'elements': [{'id': element, 'element_type': element % 4 + 1, 'first_name': f'First {element}',
+                  'second_name': f'Second {element}', 'web_name': f'Player {element}', 'team': element % 2 + 1,
+                  'team_code': [3, 7][element % 2]} for element in range(1, 11)],
+}
+
+def gw_data(game_week, elements):
+    return pd.DataFrame({'minutes': 90, 'goals_scored': 0, 'assists': 1, 'clean_sheets': 0, 'bonus': 2,
+                         'total_points': [element + game_week for element in elements], 'player_id': elements,
+                         'game_week': game_week})
+
+def test_pruned_merge_matches_the_full_merge():
+    player_dimension = PlayerDimension(BOOTSTRAP_STATIC, 'v1')
+    # player 9 has no game week data in game week 2, and players 7, 8 and 10 are not picked
+    all_gw_data = pd.concat([gw_data(1, list(range(1, 11))), gw_data(2, [1, 2, 3, 4, 5, 6, 7, 8, 10])], ignore_index=True)
+    all_team_selections = pd.DataFrame({'element': [1, 2, 3, 4, 5, 6, 9, 1], 'position': [1, 2, 3, 4, 1, 2, 3, 4],
+                                        'multiplier': [2, 1, 1, 0, 2, 1, 1, 0],
+                                        'entry': [11, 11, 11, 11, 12, 12, 12, 12], 'event': [1, 1, 2, 2, 1, 1, 2, 2]})
+    dim_teams = pd.DataFrame({'entry': [11, 12, 13], 'entry_name': ['A', 'B', 'C'], 'player_name': ['a', 'b', 'c']})
+
+    pruned = merge_data(player_dimension, all_gw_data, all_team_selections, dim_teams)
+
+    # the wide merges that merge_data replaces
+    all_player_gw_data = pd.merge(player_dimension.player_data, all_gw_data, left_on='id_player', right_on='player_id', how='left')
+    full = pd.merge(all_team_selections, all_player_gw_data, left_on=['event', 'element'], right_on=['game_week', 'player_id'],
+                    how='left')
+    full = pd.merge(dim_teams, full, on='entry', how='left', suffixes=('_Team', '_Selection'))
+    full['points_earned'] = full['multiplier'] * full['total_points']
+
+    assert set(SELECTION_PLAYER_COLUMNS + SELECTION_GW_COLUMNS) <= set(pruned.columns)
+    assert 'bonus' not in pruned.columns and 'first_name' not in pruned.columns
+    assert len(pruned) == len(full) == 9
+    assert np.isnan(pruned.loc[pruned['element'] == 9, 'total_points']).all()
+    shared_columns = [col for col in pruned.columns if col in full.columns]
+    pd.testing.assert_frame_equal(pruned[shared_columns], full[shared_columns], check_dtype=False)
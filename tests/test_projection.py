@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from fpl_functions import project_league_finish, summarise_league_projection
+
+def history(points_by_team):
+    """
+    hist_teams_data of teams that scored the given net points in each game week so far.
+    """
+    rows = [(entry_name, event, points) for entry_name, points in points_by_team.items()
+            for event, points in enumerate(points, start=1)]
+    hist_teams_data = pd.DataFrame(rows, columns=['entry_name', 'event', 'gw_points'])
+    hist_teams_data['total_points'] = hist_teams_data.groupby('entry_name')['gw_points'].cumsum()
+    hist_teams_data['league_rank'] = hist_teams_data.groupby('event')['total_points'].rank(method='dense', ascending=False).astype(int)
+    return hist_teams_data
+
+# with 2 game weeks left, the leader cannot be caught and the last team cannot catch anyone
+HIST_TEAMS_DATA = history({'Leader': [300, 300, 300], 'Close 1': [50, 60, 70], 'Close 2': [70, 60, 49], 'Last': [0, 0, 1]})
+
+def test_teams_out_of_reach_have_a_certain_finish():
+    probabilities = project_league_finish(HIST_TEAMS_DATA, 3, n_simulations=2000, total_game_weeks=5, seed=1, chunk_size=300)
+    assert probabilities.columns.tolist() == [1, 2, 3, 4]
+    assert probabilities.loc['Leader', 1] == 1 and probabilities.loc['Last', 4] == 1
+    assert probabilities.loc['Close 1', [2, 3]].sum() == 1
+    assert 0 < probabilities.loc['Close 1', 2] < 1
+    assert np.allclose(probabilities.sum(axis=1), 1) and np.allclose(probabilities.sum(axis=0), 1)
+
+def test_the_projection_is_repeatable_with_a_seed():
+    first = project_league_finish(HIST_TEAMS_DATA, 3, n_simulations=500, total_game_weeks=5, seed=7)
+    pd.testing.assert_frame_equal(first, project_league_finish(HIST_TEAMS_DATA, 3, n_simulations=500, total_game_weeks=5, seed=7))
+
+def test_a_finished_season_keeps_the_final_ranks():
+    probabilities = project_league_finish(HIST_TEAMS_DATA, 3, n_simulations=100, total_game_weeks=3, seed=0)
+    summary = summarise_league_projection(probabilities, HIST_TEAMS_DATA, 3)
+    assert summary['entry_name'].tolist() == ['Leader', 'Close 1', 'Close 2', 'Last']
+    assert (summary['expected_rank'] == summary['league_rank']).all()
@@ -0,0 +1,58 @@
+import numpy as np
+from fpl_squad_index import SquadIndex, build_squad_index
+from fpl_squads import CAPTAIN_BIT, VICE_CAPTAIN_BIT, SquadTensor, score_squads
+
+def random_squads(rng, n_squads):
+    """
+    Squads of 15 distinct players out of 400 in one game week, captained by the first player and vice captained by the second.
+    """
+    elements = np.stack([rng.choice(np.arange(1, 401), 15, replace=False) for _ in range(n_squads)]).astype(np.int16)
+    flags = np.zeros((n_squads, 15), dtype=np.uint8)
+    flags[:, :11] = 1
+    flags[:, 0] = 2 | CAPTAIN_BIT
+    flags[:, 1] |= VICE_CAPTAIN_BIT
+    return elements, flags
+
+def tensor(entries, elements, flags, game_week=5):
+    return SquadTensor(np.asarray(entries, dtype=np.int64), np.array([game_week]), elements[:, None, :], flags[:, None, :])
+
+def test_query_finds_a_copy_of_the_squad_in_another_league():
+    rng = np.random.default_rng(0)
+    elements, flags = random_squads(rng, 300)
+    other_elements, other_flags = random_squads(rng, 300)
+    other_elements[42], other_flags[42] = elements[7], flags[7]
+
+    index = SquadIndex(5)
+    index.add(1, tensor(range(300), elements, flags))
+    index.add(2, tensor(range(1000, 1300), other_elements, other_flags))
+    index.add(3, tensor([1], elements[:1], flags[:1], game_week=4)) # another game week is left out
+    index.build()
+    assert index.size == 600
+
+    nearest = index.query(elements[7], flags[7], top_n=5, exclude=(1, 7))
+    assert (nearest.loc[0, 'league_id'], nearest.loc[0, 'entry'], nearest.loc[0, 'similarity']) == (2, 1042, 100)
+    assert not ((nearest['league_id'] == 1) & (nearest['entry'] == 7)).any()
+    assert nearest['similarity'].is_monotonic_decreasing
+
+def test_candidates_include_near_copies():
+    rng = np.random.default_rng(1)
+    elements, flags = random_squads(rng, 500)
+    near_copy = elements[3].copy()
+    near_copy[14] = 401 # one bench player changed
+    index = SquadIndex(5)
+    index.add(1, tensor(range(501), np.vstack([elements, near_copy[None, :]]), np.vstack([flags, flags[3:4]])))
+    index.build()
+
+    candidates = index.candidates(elements[3], flags[3])
+    assert {3, 500} <= set(candidates.tolist())
+    assert len(candidates) < 500
+    scores = score_squads(index.elements[candidates], index.flags[candidates], elements[3], flags[3])
+    assert scores.max() == 100
+
+def test_build_from_the_archive(archive_dir):
+    index = build_squad_index(5, archive_dir=archive_dir)
+    assert index.size == 16
+    assert set(index.league_ids.tolist()) == {1, 2}
+    row = 0
+    nearest = index.query(index.elements[row], index.flags[row], top_n=3)
+    assert nearest.loc[0, 'similarity'] == 100
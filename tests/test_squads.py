@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fpl_functions import LeagueData, build_ownership_index, calculate_similarity_score
+from fpl_squads import load_squad_tensor, squads_dir
+
+@pytest.fixture(scope='module')
+def league(stub_url, tmp_path_factory):
+    league = LeagueData(3, archive_dir=str(tmp_path_factory.mktemp('squads')), journal_dir=None)
+    league.squads
+    return league
+
+def test_saved_squads_match_the_extracted_ones(league):
+    saved = load_squad_tensor(squads_dir(league.archive_dir, league.league_id, league.players().season))
+    for name in ['entries', 'game_weeks', 'elements', 'flags']:
+        assert np.array_equal(getattr(saved, name), getattr(league.squads, name))
+
+@pytest.mark.parametrize('game_week', [1, 5])
+def test_similarity_matches_calculate_similarity_score(league, game_week):
+    picks = league.full_selection_data[league.full_selection_data['event'] == game_week]
+    teams = [picks[picks['entry'] == entry] for entry in league.squads.entries]
+    scores = league.squads.similarity(game_week)
+    for i, team_1 in enumerate(teams):
+        for j, team_2 in enumerate(teams):
+            assert scores[i, j] == pytest.approx(calculate_similarity_score(team_1, team_2)[0], abs=0.01)
+    assert np.allclose(league.squads.similarity(game_week, rows=[2, 0]), scores[[2, 0]])
+
+@pytest.mark.parametrize('game_week', [1, 5])
+def test_ownership_matches_build_ownership_index(league, game_week):
+    columns = ['selected', 'starting', 'captained', 'multiplier_sum', 'ownership', 'effective_ownership']
+    expected = build_ownership_index(league.full_selection_data).loc[game_week, columns]
+    pd.testing.assert_frame_equal(league.squads.ownership(game_week)[columns], expected, check_dtype=False)
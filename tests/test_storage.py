@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+import pandas as pd
+import pytest
+from fpl_archive import archive_league_data, file_lock, read_archive, read_league_info
+from fpl_storage import DirectorySnapshotStore, MemorySnapshotStore, load_or_extract
+
+@pytest.fixture(params=['memory', 'directory'])
+def store(request, tmp_path):
+    return MemorySnapshotStore() if request.param == 'memory' else DirectorySnapshotStore(str(tmp_path / 'snapshots'))
+
+def test_a_fresh_snapshot_is_reused(store):
+    assert load_or_extract('key', lambda: 1, store=store) == 1
+    assert load_or_extract('key', lambda: 2, store=store) == 1
+
+def test_a_stale_snapshot_is_refreshed(store):
+    load_or_extract('key', lambda: 1, store=store)
+    assert load_or_extract('key', lambda: 2, store=store, max_age_seconds=0) == 2
+    assert store.get('key') == 2
+
+def test_delete(store):
+    store.put('key', 1)
+    store.delete('key')
+    store.delete('key')
+    assert store.get('key') is None and store.saved_at('key') is None
+
+def test_only_one_worker_extracts_a_missing_snapshot(store):
+    calls = []
+
+    def extract():
+        calls.append(1)
+        time.sleep(0.3)
+        return 'tables'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(load_or_extract('key', extract, store=store)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == ['tables'] * 8
+
+def test_a_stale_snapshot_is_served_while_another_worker_refreshes_it(store):
+    store.put('key', 'stale')
+    with store.lock('key'):
+        assert load_or_extract('key', lambda: 'fresh', store=store, max_age_seconds=0) == 'stale'
+        with store.lock('key', timeout=0) as locked:
+            assert locked is False
+
+def test_file_lock_times_out(tmp_path):
+    path = str(tmp_path / 'file.lock')
+    with file_lock(path):
+        with pytest.raises(TimeoutError):
+            with file_lock(path, timeout=0.1, poll_seconds=0.02):
+                pass
+
+def test_concurrent_archives_keep_every_game_week(tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+
+    def archive(game_week):
+        archive_league_data(5, '2024-25', 'League', 1, {'hist_teams_data': pd.DataFrame({'event': [game_week]})},
+                            archive_dir=archive_dir)
+
+    threads = [threading.Thread(target=archive, args=(game_week,)) for game_week in range(1, 21)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert read_league_info(5, '2024-25', archive_dir)['game_weeks'] == list(range(1, 21))
+    assert os.path.exists(os.path.join(archive_dir, 'league=5', 'season=2024-25', 'gw=20', 'hist_teams_data.parquet'))
+
+def test_archived_picks_read_back_with_the_ones_without_game_week_data(tmp_path):
+    archive_dir = str(tmp_path / 'archive')
+    picks = pd.DataFrame({'entry': [1, 1, 2, 2], 'event': [1, 1, 1, 2], 'element': [10, 11, 10, 12],
+                          'game_week': [1, None, 1, 2], 'total_points': [5, None, 5, 3]})
+    league_info = archive_league_data(5, '2024-25', 'League', 1, {'full_selection_data': picks}, archive_dir=archive_dir)
+    assert league_info['game_weeks'] == [1, 2]
+
+    archived = read_archive('full_selection_data', league_ids=[5], archive_dir=archive_dir)
+    pd.testing.assert_frame_equal(archived.drop(columns=['league_id', 'season']), picks)
+    assert read_archive('full_selection_data', game_weeks=[1], archive_dir=archive_dir)['element'].tolist() == [10, 11, 10]
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from fpl_functions import simulate_captain_choices, simulate_what_ifs
+
+def picks(entry, event, players, captain, active_chip=None):
+    """
+    Picks of a team in a game week, from (web_name, element, total_points) with total_points None for a player without
+    game week data.
+    """
+    return pd.DataFrame({'entry': entry, 'entry_name': f'Team {entry}', 'event': event,
+                         'game_week': [np.nan if points is None else event for _, _, points in players],
+                         'element': [element for _, element, _ in players],
+                         'web_name': [web_name for web_name, _, _ in players],
+                         'total_points': [np.nan if points is None else points for _, _, points in players],
+                         'multiplier': [(3 if active_chip == '3xc' else 2) if web_name == captain else 1 for web_name, _, _ in players],
+                         'active_chip': active_chip})
+
+FULL_SELECTION_DATA = pd.concat([
+    picks(1, 1, [('A', 1, 2), ('B', 2, 10), ('C', 3, None)], captain='A'),
+    picks(1, 2, [('A', 1, 5), ('B', 2, 7), ('C', 3, 1)], captain='A', active_chip='3xc'),
+    picks(2, 1, [('D', 4, 9), ('E', 5, 3)], captain='D'),
+    picks(2, 2, [('D', 4, None), ('E', 5, 6)], captain='D'), # the captain has no game week data
+], ignore_index=True)
+
+def test_best_alternative_captain_of_every_game_week():
+    captains = simulate_captain_choices(FULL_SELECTION_DATA).set_index(['entry', 'game_week'])
+    assert len(captains) == 4
+    assert captains.loc[(1, 1), ['choice_made', 'better_choice', 'points_left']].tolist() == ['A', 'B', 8]
+    assert captains.loc[(1, 2), ['choice_made', 'better_choice', 'points_left']].tolist() == ['A', 'B', 4] # triple captain
+    assert captains.loc[(2, 1), 'points_left'] == 0
+    assert captains.loc[(2, 2), ['choice_made', 'better_choice', 'points_left']].tolist() == ['D', 'E', 6]
+
+def test_what_ifs_leave_out_decisions_that_could_not_be_improved():
+    # team 1 bought B for F before game week 2, and F scored 12 that week
+    transfers = pd.DataFrame({'Transfer_ID': [0, 0], 'entry': 1, 'entry_name': 'Team 1', 'event': 2, 'time': '2024-08-20',
+                              'element': [2, 6], 'web_name': ['B', 'F'], 'Direction': ['In', 'Out']})
+    all_gw_data = pd.DataFrame({'game_week': [1, 1, 2, 2, 2], 'player_id': [1, 2, 1, 2, 6], 'total_points': [2, 10, 5, 7, 12]})
+    what_ifs = simulate_what_ifs(FULL_SELECTION_DATA, transfers, all_gw_data)
+    assert what_ifs[['entry', 'game_week', 'decision', 'points_left']].values.tolist() == [
+        [1, 1, 'Captain', 8], [2, 2, 'Captain', 6], [1, 2, 'Transfer', 5], [1, 2, 'Captain', 4]]
+    assert what_ifs.loc[2, 'better_choice'] == 'Keep F'